@@ -1,49 +1,79 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
+"""
+Convert CRIRES pipeline products to 1D spectra (e.g. for ARES).
+
+Each file is opened once (memory-mapped) and all the requested detector
+extensions are converted. The output names are <name>_ext<N>.fits for each
+extension, or <name>_stitched.fits if the extensions are stitched into one
+spectrum, where <name> is the input file without .fits. A directory (e.g. a
+night of observations) is converted in parallel with a process per file.
+"""
 
 # My imports
 from __future__ import division, print_function
+import os
+import re
+import glob
 import numpy as np
 from astropy.io import fits
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from .io import read_spectrum, read_spectra
+from .resample import resample, METHODS
+
+_outputs = re.compile(r'_(ext\d+|stitched)\.fits$')
 
 
 def _parser():
     '''The argparse stuff'''
 
     parser = argparse.ArgumentParser(description='CRIRES spectrum to an 1D spectrum')
-    parser.add_argument('fname', help='Input fits file')
+    parser.add_argument('fname', nargs='+',
+                        help='Input fits file(s) or directories with fits files')
     parser.add_argument('--output', default=False,
-                        help='Output to this name. If nothing is given, output will be: "wmin-wmax.fits"')
+                        help='Output to this name (only for a single input and extension). '
+                        'If nothing is given, output will be: "wmin-wmax.fits"')
     parser.add_argument('-u', '--unit', default='angstrom',
                         choices=['angstrom', 'nm'],
                         help='The unit of the output wavelength')
     parser.add_argument('-c', '--clobber', default=True, action='store_false',
                         help='Do not overwrite existing files.')
+    parser.add_argument('-r', '--resample', default=None, choices=METHODS,
+                        help='Resample the flux from the wavelength of each pixel (linear, cubic, '
+                        'or flux conserving). Default is to assume an equidistant wavelength')
+    parser.add_argument('-e', '--extensions', default=None, type=int, nargs='+',
+                        help='Convert these extensions (default: all). The outputs are '
+                        '<name>_ext<N>.fits')
+    parser.add_argument('-s', '--stitch', default=False, action='store_true',
+                        help='Stitch the extensions into one spectrum: <name>_stitched.fits')
+    parser.add_argument('-d', '--outdir', default=None,
+                        help='Directory of the outputs (default: the directory of the input)')
+    parser.add_argument('-w', '--workers', default=None, type=int,
+                        help='Number of processes for multiple inputs')
     args = parser.parse_args()
     return args
 
 
-def _get_wavelength(fname, unit=1):
+def _get_wavelength(hdr, n, unit=1):
     '''Get the wavelength from a CRIRES pipeline reduced spectrum.
 
     Input:
-        fname: File name
+        hdr: Primary header of the CRIRES spectrum
+        n: Number of pixels
         unit: 1=Aangstrom, 2=nm
     Output:
         w: Output wavelength
     '''
-    d = fits.getdata(fname)
-    hdr = fits.getheader(fname)
-    I = d['Extracted_OPT']
     wmin, wmax = hdr['ESO INS WLEN MIN'], hdr['ESO INS WLEN MAX']
     if unit == 1:
-        return np.linspace(wmin, wmax, len(I), endpoint=True) * 10
+        return np.linspace(wmin, wmax, n, endpoint=True) * 10
     elif unit == 2:
-        return np.linspace(wmin, wmax, len(I), endpoint=True)
+        return np.linspace(wmin, wmax, n, endpoint=True)
 
 
-def main(fname, output=False, unit=1, clobber=True):
+def main(fname, output=False, unit=1, clobber=True, resample_method=None):
     '''Convert the CRIRES spectrum to a 1D spectrum
 
     Input:
@@ -51,23 +81,168 @@ def main(fname, output=False, unit=1, clobber=True):
         output: Name of output file. Default is: "wmin-wmax.fits"
         unit: Unit of wavelength vector (Angstrom is default.)
         clobber: Overwrite existing files
+        resample_method: Resample the flux from the wavelength of the pixels
+                         to the equidistant wavelength (linear, cubic, flux)
     '''
-    I = fits.getdata(fname)
-    w = _get_wavelength(fname, unit=unit)
+    spectrum = read_spectrum(fname, 'CRIRES')
+    I = spectrum.flux
+    w = _get_wavelength(spectrum.primary_header, len(I), unit=unit)
+    if resample_method:
+        wpix = spectrum.wavelength if unit == 1 else spectrum.wavelength / 10
+        I = resample(wpix, I, w, method=resample_method)
     if not output:
         output = '%i-%i.fits' % (w.min(), w.max())
     else:
         if not output.lower().endswith('.fits'):
             output += '.fits'
 
+    _write(w, I, output, clobber=clobber)
+    print('File writed to: {}'.format(output))
+
+
+def _write(w, I, output, clobber=True):
+    """Write a 1D spectrum with an equidistant wavelength w"""
     N = len(w)
     hdr = fits.Header()
     hdr["NAXIS1"] = N
-    hdr["CDELT1"] = (w[-1]-w[0])/N
+    hdr["CDELT1"] = (w[-1]-w[0])/(N-1)  # w includes both ends
     hdr["CRVAL1"] = w[0]
+    fits.writeto(output, np.asarray(I, dtype=float), header=hdr, overwrite=clobber)
 
-    fits.writeto(output, I['Extracted_OPT'], header=hdr, clobber=clobber)
-    print('File writed to: {}'.format(output))
+
+def _pixels(spectrum, unit=1):
+    """The wavelength (increasing) and flux of the pixels of an extension"""
+    w = np.asarray(spectrum.wavelength, dtype=float)
+    I = np.asarray(spectrum.flux, dtype=float)
+    if unit == 2:
+        w = w / 10
+    if w[0] > w[-1]:
+        w, I = w[::-1], I[::-1]
+    return w, I
+
+
+def _equidistant(spectrum, unit=1, resample_method=None):
+    """The extension with an equidistant wavelength from the first to the
+    last pixel. The flux is resampled if resample_method is given."""
+    wpix, I = _pixels(spectrum, unit=unit)
+    w = np.linspace(wpix[0], wpix[-1], len(wpix), endpoint=True)
+    if resample_method:
+        I = resample(wpix, I, w, method=resample_method)
+    return w, I
+
+
+def stitch(spectra, unit=1, resample_method='linear'):
+    """Stitch extensions into one spectrum with an equidistant wavelength
+
+    The step is the smallest (median) step of the extensions. Each
+    extension is resampled to the part of the wavelength it covers, where
+    extensions overlap the mean is used, and the gaps between the detectors
+    are interpolated linearly.
+
+    :spectra: List of Spectrum (CRIRES extensions)
+    :unit: 1=Aangstrom, 2=nm
+    :resample_method: linear, cubic, or flux (see astro_scripts.resample)
+    :returns: The wavelength and flux
+    """
+    pixels = [_pixels(spectrum, unit=unit) for spectrum in spectra]
+    dw = min(np.median(np.diff(wpix)) for wpix, _ in pixels)
+    w0 = min(wpix[0] for wpix, _ in pixels)
+    w1 = max(wpix[-1] for wpix, _ in pixels)
+    w = np.linspace(w0, w1, int(round((w1 - w0) / dw)) + 1, endpoint=True)
+
+    total = np.zeros(len(w))
+    counts = np.zeros(len(w))
+    for wpix, I in pixels:
+        inside = (w >= wpix[0]) & (w <= wpix[-1])
+        total[inside] += resample(wpix, I, w[inside], method=resample_method or 'linear')
+        counts[inside] += 1
+    covered = counts > 0
+    return w, np.interp(w, w[covered], total[covered] / counts[covered])
+
+
+def _output(fname, suffix, outdir=None):
+    """<outdir>/<name>_<suffix>.fits for the input fname"""
+    name = os.path.basename(fname)
+    if name.lower().endswith('.fits'):
+        name = name[:-5]
+    return os.path.join(outdir or os.path.dirname(fname), '{}_{}.fits'.format(name, suffix))
+
+
+def convert(fname, extensions=None, stitched=False, outdir=None, unit=1, clobber=True,
+            resample_method=None):
+    """Convert the extensions of a CRIRES spectrum to 1D spectra. The file
+    is opened once.
+
+    :fname: Fits file of CRIRES spectrum
+    :extensions: List of the extensions to convert (default: all)
+    :stitched: Stitch the extensions into one spectrum (<name>_stitched.fits)
+               instead of a spectrum per extension (<name>_ext<N>.fits)
+    :outdir: Directory of the outputs (default: the directory of fname)
+    :unit: 1=Aangstrom, 2=nm
+    :clobber: Overwrite existing files
+    :resample_method: Resample the flux from the wavelength of the pixels
+                      (linear, cubic, flux). Always done when stitching
+    :returns: List of the output files
+    """
+    spectra = read_spectra(fname, 'CRIRES', orders=extensions)
+    if outdir and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    if stitched:
+        output = _output(fname, 'stitched', outdir)
+        w, I = stitch(spectra, unit=unit, resample_method=resample_method)
+        _write(w, I, output, clobber=clobber)
+        return [output]
+
+    outputs = []
+    for spectrum in spectra:
+        output = _output(fname, 'ext{}'.format(spectrum.order), outdir)
+        w, I = _equidistant(spectrum, unit=unit, resample_method=resample_method)
+        _write(w, I, output, clobber=clobber)
+        outputs.append(output)
+    return outputs
+
+
+def _inputs(paths):
+    """The fits files given directly or in the directories. Outputs of
+    convert in the directories are skipped."""
+    fnames = []
+    for path in paths:
+        if os.path.isdir(path):
+            fnames += [fname for fname in sorted(glob.glob(os.path.join(path, '*.fits')))
+                       if not _outputs.search(fname)]
+        else:
+            fnames.append(path)
+    return fnames
+
+
+def _convert(fname, **options):
+    """convert, which returns the error instead of raising it"""
+    try:
+        return convert(fname, **options), None
+    except Exception as e:
+        return [], '{}: {}'.format(type(e).__name__, e)
+
+
+def batch(paths, workers=None, **options):
+    """Convert many CRIRES spectra (files or directories) in parallel
+
+    :paths: List of fits files or directories with fits files
+    :workers: Number of processes (default: number of CPUs)
+    :options: Options for convert (extensions, stitched, outdir, unit, clobber,
+              resample_method)
+    :returns: Dictionary with the output files of each input (an empty list
+              if the conversion failed)
+    """
+    fnames = _inputs(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(fnames) // (4 * (workers or os.cpu_count() or 1)))
+        results = list(executor.map(partial(_convert, **options), fnames, chunksize=chunksize))
+    outputs = {}
+    for fname, (output, error) in zip(fnames, results):
+        if error:
+            print('Warning: Could not convert {}. {}'.format(fname, error))
+        outputs[fname] = output
+    return outputs
 
 
 def runner():
@@ -76,7 +251,19 @@ def runner():
         args.unit = 1
     elif args.unit == 'nm':
         args.unit = 2
-    main(args.fname, output=args.output, unit=args.unit, clobber=args.clobber)
+    single = len(args.fname) == 1 and not os.path.isdir(args.fname[0])
+    if single and not (args.stitch or args.outdir or args.extensions):
+        main(args.fname[0], output=args.output, unit=args.unit, clobber=args.clobber,
+             resample_method=args.resample)
+        return
+    if args.output:
+        raise SystemExit('--output is only for a single input and extension')
+
+    outputs = batch(args.fname, workers=args.workers, extensions=args.extensions,
+                    stitched=args.stitch, outdir=args.outdir, unit=args.unit,
+                    clobber=args.clobber, resample_method=args.resample)
+    n = sum(len(output) for output in outputs.values())
+    print('{} files writed from {} inputs'.format(n, len(outputs)))
 
 
 if __name__ == '__main__':
@@ -4,12 +4,17 @@
 # My imports
 from __future__ import division, print_function
 import os
-import requests
+import json
+import hashlib
 import argparse
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import matplotlib.pyplot as plt
 from . import matplotlibcfg
+from .utils import save_npy
+
+path = os.path.expanduser('~/.SWEETCat/')
 
 def _parser():
     parser = argparse.ArgumentParser(description='Plot SWEET-Cat stuff')
@@ -27,17 +32,18 @@ def _parser():
     parser.add_argument('-ly', help='Logarithmic y axis', default=False, action='store_true')
     parser.add_argument('-s', help='Place Solar values in the plot', default=False, action='store_true')
     parser.add_argument('-l', help='Fit a linear regression', default=False, action='store_true')
+    parser.add_argument('--age', help='Ages interpolated on a grid of isochrone ages, or from the '
+                        'isochrone for each star', choices=['grid', 'exact'], default='grid')
+    parser.add_argument('-w', '--workers', help='Number of processes for the isochrone ages',
+                        default=1, type=int)
     args = parser.parse_args()
     return args
 
 
-def _read_sweetcat(fname):
+def _parse_sweetcat(fname):
     """
-    Read SWEETCat into a pandas DataFrame
+    Parse the SWEETCat csv file into a pandas DataFrame
     """
-    if not isinstance(fname, str):
-        raise ValueError('Input name must be a str')
-
     names = ['star', 'hd', 'ra', 'dec', 'vmag', 'vmagerr', 'par', 'parerr',
              'parsource', 'teff', 'tefferr', 'logg', 'loggerr', 'logglc',
              'logglcerr', 'vt', 'vterr', 'feh', 'feherr', 'mass', 'masserr',
@@ -51,10 +57,214 @@ def _read_sweetcat(fname):
     return df
 
 
+def _hash(fname):
+    with open(fname, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _cache_path(fname):
+    """The cache of the csv file is a directory next to it"""
+    return '{}_cache'.format(fname.rpartition('.')[0] or fname)
+
+
+def _write_cache(fname, df, cache):
+    """Save each column of the DataFrame as .npy. Text columns are stored
+    as str with '' for missing values. The manifest is written last."""
+    manifest = os.path.join(cache, 'manifest.json')
+    if os.path.isfile(manifest):
+        os.remove(manifest)
+    save_npy(os.path.join(cache, '_index.npy'), df.index.values)
+    dtypes = {}
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+            values = df[column].to_numpy()
+            dtypes[column] = values.dtype.str
+        else:
+            values = np.array(df[column].fillna('').astype(str).tolist(), dtype=str)
+            dtypes[column] = 'str'
+        save_npy(os.path.join(cache, '{}.npy'.format(column)), values)
+    st = os.stat(fname)
+    info = {'mtime': st.st_mtime, 'size': st.st_size, 'hash': _hash(fname),
+            'columns': list(df.columns), 'dtypes': dtypes}
+    with open(manifest + '.tmp', 'w') as f:
+        json.dump(info, f)
+    os.replace(manifest + '.tmp', manifest)
+    return info
+
+
+def _valid_cache(fname, cache):
+    """The manifest of the cache if it is up to date with the csv file"""
+    try:
+        with open(os.path.join(cache, 'manifest.json')) as f:
+            info = json.load(f)
+    except (IOError, ValueError):
+        return None
+    st = os.stat(fname)
+    if info['mtime'] == st.st_mtime and info['size'] == st.st_size:
+        return info
+    if info['size'] == st.st_size and info['hash'] == _hash(fname):
+        # Same content (e.g. downloaded again)
+        info['mtime'] = st.st_mtime
+        with open(os.path.join(cache, 'manifest.json'), 'w') as f:
+            json.dump(info, f)
+        return info
+    return None
+
+
+def _read_sweetcat(fname, columns=None, cache=True):
+    """
+    Read SWEETCat into a pandas DataFrame
+
+    The csv file is parsed once and stored column by column (.npy) in a
+    cache directory next to it, which is used until the modification time
+    and content of the csv file change.
+
+    :fname: The SWEETCat csv file
+    :columns: Only read these columns (default: all)
+    :cache: Use the cache
+    :returns: The DataFrame
+    """
+    if not isinstance(fname, str):
+        raise ValueError('Input name must be a str')
+    if not cache:
+        df = _parse_sweetcat(fname)
+        return df[list(columns)] if columns is not None else df
+
+    path = _cache_path(fname)
+    info = _valid_cache(fname, path)
+    if info is None:
+        info = _write_cache(fname, _parse_sweetcat(fname), path)
+
+    data = {}
+    for column in columns if columns is not None else info['columns']:
+        if column not in info['dtypes']:
+            raise ValueError('Column not in SWEET-Cat: {}'.format(column))
+        values = np.load(os.path.join(path, '{}.npy'.format(column)))
+        if info['dtypes'][column] == 'str':
+            values = np.where(values == '', np.nan, values.astype(object))
+        data[column] = values
+    index = np.load(os.path.join(path, '_index.npy'))
+    return pd.DataFrame(data, index=index, columns=list(data))
+
+
+_isochrone = None  # The isochrone used for the ages in this process
+
+MASS_GRID = np.round(np.arange(0.40, 2.501, 0.05), 2)
+FEH_GRID = np.round(np.arange(-1.00, 0.501, 0.05), 2)
+
+
+def _init_isochrone(isochrone=None):
+    """Set the isochrone used for the ages (default: Dartmouth)"""
+    global _isochrone
+    if isochrone is None:
+        from isochrones.dartmouth import Dartmouth_Isochrone
+        isochrone = Dartmouth_Isochrone()
+    _isochrone = isochrone
+
+
+def _exact_age(mass, feh):
+    """The age [Gyr] of a star in the middle of the age range of the isochrone
+    (NaN if the isochrone has no solution)"""
+    if not (np.isfinite(mass) and np.isfinite(feh)):
+        return np.nan
+    if _isochrone is None:
+        _init_isochrone()
+    try:
+        tmp = _isochrone.agerange(mass, feh)
+    except Exception:  # The isochrone package raises different errors
+        return np.nan
+    return (10**(tmp[0]-9) + 10**(tmp[1]-9))/2
+
+
+def exact_ages(mass, feh, workers=1, isochrone=None):
+    """The ages [Gyr] with a call to the isochrone for each star
+
+    :mass: Masses of the stars
+    :feh: [Fe/H] of the stars
+    :workers: Number of processes (each with its own isochrone)
+    :isochrone: The isochrone (default: Dartmouth)
+    :returns: The ages
+    """
+    mass = np.asarray(mass, dtype=float)
+    feh = np.asarray(feh, dtype=float)
+    if workers == 1:
+        if isochrone is not None or _isochrone is None:
+            _init_isochrone(isochrone)
+        return np.array([_exact_age(m, f) for m, f in zip(mass, feh)])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_isochrone,
+                             initargs=(isochrone,)) as executor:
+        chunksize = max(1, len(mass) // (4 * (workers or os.cpu_count() or 1)))
+        return np.array(list(executor.map(_exact_age, mass, feh, chunksize=chunksize)))
+
+
+def age_grid(masses=MASS_GRID, fehs=FEH_GRID, workers=1, isochrone=None, cache=True):
+    """The ages [Gyr] on a grid of mass and [Fe/H]. The grid is computed
+    once and saved in ~/.SWEETCat/.
+
+    :masses: The (sorted) masses of the grid
+    :fehs: The (sorted) [Fe/H] of the grid
+    :workers: Number of processes computing the grid
+    :isochrone: The isochrone (default: Dartmouth)
+    :cache: Use the saved grid
+    :returns: The ages with shape (len(masses), len(fehs))
+    """
+    key = hashlib.sha1(np.concatenate((masses, [np.nan], fehs)).tobytes()).hexdigest()
+    fname = os.path.join(path, 'age_grid_{}.npy'.format(key))
+    if cache and isochrone is None and os.path.isfile(fname):
+        return np.load(fname)
+    mass, feh = np.meshgrid(masses, fehs, indexing='ij')
+    grid = exact_ages(mass.ravel(), feh.ravel(), workers=workers,
+                      isochrone=isochrone).reshape(mass.shape)
+    if cache and isochrone is None:
+        save_npy(fname, grid)
+    return grid
+
+
+def grid_ages(mass, feh, grid, masses=MASS_GRID, fehs=FEH_GRID):
+    """Bilinear interpolation of the ages on a grid of mass and [Fe/H]
+
+    :mass: Masses of the stars
+    :feh: [Fe/H] of the stars
+    :grid: The ages on the grid (see age_grid)
+    :masses: The masses of the grid
+    :fehs: The [Fe/H] of the grid
+    :returns: The ages (NaN outside the grid)
+    """
+    mass = np.asarray(mass, dtype=float)
+    feh = np.asarray(feh, dtype=float)
+    i = np.clip(np.searchsorted(masses, mass) - 1, 0, len(masses) - 2)
+    j = np.clip(np.searchsorted(fehs, feh) - 1, 0, len(fehs) - 2)
+    x = (mass - masses[i]) / (masses[i+1] - masses[i])
+    y = (feh - fehs[j]) / (fehs[j+1] - fehs[j])
+    ages = ((1-x)*(1-y)*grid[i, j] + x*(1-y)*grid[i+1, j] +
+            (1-x)*y*grid[i, j+1] + x*y*grid[i+1, j+1])
+    outside = (mass < masses[0]) | (mass > masses[-1]) | (feh < fehs[0]) | (feh > fehs[-1])
+    ages[outside | np.isnan(mass) | np.isnan(feh)] = np.nan
+    return ages
+
+
+def _ages(fname, method='grid', workers=1):
+    """The ages of all stars in SWEET-Cat (a Series with the index of the
+    catalogue). The ages are saved in the cache of the catalogue, so they
+    are computed again only for a new version of the catalogue."""
+    df = _read_sweetcat(fname, columns=['mass', 'feh'])
+    info = _valid_cache(fname, _cache_path(fname))
+    out = os.path.join(_cache_path(fname), 'age_{}_{}.npy'.format(method, info['hash']))
+    if os.path.isfile(out):
+        return pd.Series(np.load(out), index=df.index)
+    if method == 'grid':
+        ages = grid_ages(df['mass'].values, df['feh'].values, age_grid(workers=workers))
+    else:
+        ages = exact_ages(df['mass'].values, df['feh'].values, workers=workers)
+    save_npy(out, ages)
+    return pd.Series(ages, index=df.index)
+
+
 def _download_sweetcat(fout):
     """
     Download SWEETCAT and write it to file
     """
+    import requests
     url = 'https://www.astro.up.pt/resources/sweet-cat/download.php'
     table = requests.get(url)
     with open(fout, 'w') as file:
@@ -63,7 +273,6 @@ def _download_sweetcat(fout):
 
 def main():
     args = _parser()
-    path = os.path.expanduser('~/.SWEETCat/')
     _sc = os.path.join(path, 'sweetcat.csv')
     if os.path.isdir(path):
         if not os.path.isfile(_sc):
@@ -75,22 +284,22 @@ def main():
         print('Downloading SWEET-Cat...')
         _download_sweetcat(_sc)
 
-    df = _read_sweetcat(_sc)
+    # Only read the columns which are used
+    columns = [c for c in (args.x, args.y, args.z) if c and c != 'age']
+    if args.sweetcat:
+        columns.append('source')
+    if 'age' in (args.x, args.y, args.z):
+        columns += ['mass', 'feh']
+    df = _read_sweetcat(_sc, columns=sorted(set(columns)))
     if args.sweetcat:
         df = df[df.source == True]
 
+    if (args.x == 'age') or (args.y == 'age') or (args.z == 'age'):
+        df['age'] = _ages(_sc, method=args.age, workers=args.workers).loc[df.index]
+
     df['x'] = df[args.x]
     df['y'] = df[args.y]
 
-    if (args.x == 'age') or (args.y == 'age') or (args.z == 'age'):
-        from isochrones.dartmouth import Dartmouth_Isochrone
-        dar = Dartmouth_Isochrone()
-        age = np.zeros(df.shape[0])
-        for i, (mass, feh) in enumerate(df[['mass', 'feh']].values):
-            tmp = dar.agerange(mass, feh)
-            age[i] = (10**(tmp[0]-9) + 10**(tmp[1]-9))/2
-        df['age'] = pd.Series(age)
-
     if args.z:
         if args.iz:
             z = 1/df[args.z].values
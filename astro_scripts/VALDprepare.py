@@ -10,14 +10,26 @@ import os
 def _parser():
     parser = argparse.ArgumentParser(description='Prepare the data downloaded '
                                      'from VALD.')
-    parser.add_argument('input', help='input compressed file', type=str)
+    parser.add_argument('input', help='input compressed file(s)', type=str, nargs='+')
     parser.add_argument('-o', '--output',
-                        help='Optional output',
+                        help='Optional output (only for a single input)',
                         default=False, type=str)
+    parser.add_argument('-w', '--workers',
+                        help='Number of worker processes for multiple inputs',
+                        default=None, type=int)
     return parser.parse_args()
 
 
 def main(inp, output=False):
+    """Remove the quotes from a compressed VALD file and comment the header
+
+    The file is streamed line by line to the output, so the memory used
+    does not depend on the size of the file.
+
+    :inp: The compressed VALD file
+    :output: The output file. Default is the input with .dat instead of .gz
+    :returns: The output file
+    """
 
     if not os.path.isfile(inp):
         raise IOError('File: {} does not exists'.format(inp))
@@ -26,24 +38,38 @@ def main(inp, output=False):
     if not output:
         output = '{}.dat'.format(fname)
 
-    fout = ''
-    with gzip.open(inp, 'r') as lines:
+    with gzip.open(inp, 'rb') as lines, open(output, 'wb') as fo:
         for i, line in enumerate(lines):
             if i < 2:
-                fout += '# {}'.format(line.replace("'", ''))
-            else:
-                fout += line.replace("'", '')
-            if 'References' in line:
+                fo.write(b'# ')
+            fo.write(line.replace(b"'", b''))
+            if b'References' in line:
                 break
+    return output
+
+
+def batch(inputs, workers=None):
+    """Prepare many VALD files in parallel
 
-    with open(output, 'w') as fo:
-        fo.write(fout)
+    :inputs: List of compressed VALD files
+    :workers: Number of worker processes (default: number of CPUs)
+    :returns: List of the output files
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(main, inputs))
 
 
 def runner():
     args = _parser()
     inp, output = args.input, args.output
-    main(inp, output)
+    if len(inp) == 1:
+        main(inp[0], output)
+    else:
+        if output:
+            raise SystemExit('An output can only be given for a single input')
+        for output in batch(inp, workers=args.workers):
+            print('Output file: {}'.format(output))
 
 
 if __name__ == '__main__':
@@ -1,11 +1,36 @@
-from astro_scripts.plot_fits import runner as plot_fits
-from astro_scripts.numpy2moog import runner as numpy2moog
-from astro_scripts.fitsHeader import main as fitsheader
-from astro_scripts.ascii2fits import main as ascii2fits
-from astro_scripts.CRIRES2ARES import runner as CRIRES2ARES
-from astro_scripts.linelist_filter import main as linelist_filter
-from astro_scripts.rv_measure import runner as rv_measure
-from astro_scripts.VALDextraction import main as VALDextraction
-from astro_scripts.VALDprepare import runner as VALDprepare
-from astro_scripts.vizier_query import main as vizier_query
-from astro_scripts.SWEETCat import main as SWEETCat
+import importlib
+
+# The console scripts (name: (module, function)). The modules are only
+# imported when the function is called, so a tool does not import the
+# (heavy) dependencies of all the other tools. Importing a submodule with
+# the same name (e.g. astro_scripts.SWEETCat) replaces the function.
+_entry_points = {
+    'plot_fits': ('plot_fits', 'runner'),
+    'numpy2moog': ('numpy2moog', 'runner'),
+    'fitsheader': ('fitsHeader', 'main'),
+    'ascii2fits': ('ascii2fits', 'main'),
+    'CRIRES2ARES': ('CRIRES2ARES', 'runner'),
+    'linelist_filter': ('linelist_filter', 'main'),
+    'linelist_convert': ('linelist', 'main'),
+    'rv_measure': ('rv_measure', 'runner'),
+    'rv_measure_batch': ('rv_measure', 'batch_runner'),
+    'VALDextraction': ('VALDextraction', 'main'),
+    'VALDprepare': ('VALDprepare', 'runner'),
+    'vizier_query': ('vizier_query', 'main'),
+    'SWEETCat': ('SWEETCat', 'main'),
+    'fits_archive': ('archive', 'main'),
+}
+
+
+def _entry_point(name, module, function):
+    """A function which imports module when it is called and runs function"""
+    def entry_point(*args, **kwargs):
+        return getattr(importlib.import_module('.' + module, __name__), function)(*args, **kwargs)
+    entry_point.__name__ = name
+    entry_point.__doc__ = 'Run {}.{} (imported when called)'.format(module, function)
+    return entry_point
+
+
+for _name, (_module, _function) in _entry_points.items():
+    globals()[_name] = _entry_point(_name, _module, _function)
+
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+An index of an archive of spectra (fits files) in SQLite.
+
+For each file the header keys and the wavelength coverage are recorded. The
+headers are read with the scanner in fitsHeader (only the header blocks),
+and the wavelength is found with utils.get_wavelength from CRVAL1, CDELT1
+(or CD1_1), and NAXIS1 of the first HDU with them. A scan only reads the
+files which are new or changed (path, size, and modification time) since
+the last scan, and removes the files which are gone.
+
+Files are then found by their header values or wavelength coverage without
+opening them, e.g. all spectra of HD20010 covering 6560-6570AA:
+
+    fits_archive scan /data/spectra
+    fits_archive query -w 6560 6570 -k OBJECT=HD20010
+
+The index is ~/.fits_archive/archive.sqlite by default.
+"""
+
+# My imports
+from __future__ import division, print_function
+import os
+import json
+import sqlite3
+import argparse
+from .fitsHeader import scan as scan_headers, _inputs, _key
+from .utils import get_wavelength
+
+path = os.path.expanduser('~/.fits_archive/')
+DATABASE = os.path.join(path, 'archive.sqlite')
+# Header keys with their own (indexed) column
+COLUMNS = {'OBJECT': 'object', 'DATE-OBS': 'date_obs', 'INSTRUME': 'instrument',
+           'EXPTIME': 'exptime'}
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS spectra (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    hdu INTEGER,
+    object TEXT,
+    date_obs TEXT,
+    instrument TEXT,
+    exptime REAL,
+    wmin REAL,
+    wmax REAL,
+    header TEXT
+);
+CREATE INDEX IF NOT EXISTS spectra_wavelength ON spectra (wmin, wmax);
+CREATE INDEX IF NOT EXISTS spectra_object ON spectra (object);
+CREATE INDEX IF NOT EXISTS spectra_date_obs ON spectra (date_obs);
+'''
+
+
+def connect(database=DATABASE):
+    """Open (or create) the index
+
+    :database: The SQLite file
+    :returns: The connection
+    """
+    dirname = os.path.dirname(database)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    db = sqlite3.connect(database)
+    db.row_factory = sqlite3.Row
+    db.executescript(_schema)
+    return db
+
+
+def coverage(headers):
+    """The wavelength coverage of a fits file from its headers
+
+    :headers: The headers of the HDUs (see fitsHeader.read_headers)
+    :returns: The HDU with the wavelength and the first and last wavelength
+              (None if no HDU has CRVAL1, CDELT1 or CD1_1, and NAXIS1)
+    """
+    for hdu, header in enumerate(headers):
+        hdr = dict(header)
+        if 'CDELT1' not in hdr and 'CD1_1' in hdr:
+            hdr['CDELT1'] = hdr['CD1_1']
+        try:
+            w = get_wavelength(hdr)
+        except (KeyError, TypeError, ValueError):
+            continue
+        if len(w):
+            return hdu, min(w[0], w[-1]), max(w[0], w[-1])
+    return None, None, None
+
+
+def _row(fname, st, headers):
+    """The row of a fits file in the index"""
+    hdu, wmin, wmax = coverage(headers)
+    header = dict(headers[0])
+    if hdu:  # The keys of the extension with the spectrum are used
+        header.update(headers[hdu])
+    values = [header.get(key) for key in COLUMNS]
+    return ([os.path.abspath(fname), st.st_mtime, st.st_size, hdu] + values +
+            [wmin, wmax, json.dumps(header)])
+
+
+def update(paths, database=DATABASE, workers=None):
+    """Add new and changed fits files to the index, and remove the files
+    which are gone from the directories
+
+    :paths: List of fits files or directories (searched recursively)
+    :database: The SQLite file
+    :workers: Number of processes reading the headers (default: number of CPUs)
+    :returns: Number of files added or updated, removed, and unchanged
+    """
+    fnames = [os.path.abspath(fname) for fname in _inputs(paths)]
+    db = connect(database)
+    try:
+        known = {row['path']: (row['mtime'], row['size'])
+                 for row in db.execute('SELECT path, mtime, size FROM spectra')}
+        stats = {}
+        for fname in fnames:
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            if known.get(fname) != (st.st_mtime, st.st_size):
+                stats[fname] = st
+
+        headers = scan_headers(list(stats), workers=workers)
+        rows = [_row(fname, stats[fname], headers[fname]) for fname in stats if fname in headers]
+
+        # Files which are not there anymore (in the directories or given)
+        found = set(fnames)
+        dirs = tuple(os.path.join(os.path.abspath(p), '') for p in paths if os.path.isdir(p))
+        given = set(os.path.abspath(p) for p in paths)
+        gone = [(p,) for p in known if p not in found and p.startswith(dirs) or
+                p in given and not os.path.isfile(p)]
+        with db:
+            db.executemany('INSERT OR REPLACE INTO spectra VALUES ({})'.format(
+                ', '.join('?' * 11)), rows)
+            db.executemany('DELETE FROM spectra WHERE path = ?', gone)
+    finally:
+        db.close()
+    return len(rows), len(gone), len(fnames) - len(stats)
+
+
+def query(database=DATABASE, wmin=None, wmax=None, keys=None, overlap=False):
+    """Find spectra in the index
+
+    :database: The SQLite file
+    :wmin: The spectra cover wavelengths from wmin (wmax if not given)
+    :wmax: The spectra cover wavelengths to wmax (wmin if not given)
+    :keys: Dictionary with header keys and the values they must have. A
+           value with % or _ is a pattern (SQL LIKE, e.g. 'HD%')
+    :overlap: Only part of wmin to wmax must be covered
+    :returns: A list of dictionaries with path, hdu, wmin, wmax, and the
+              header of each spectrum
+    """
+    conditions, parameters = [], []
+    if wmin is not None or wmax is not None:
+        w0 = wmin if wmin is not None else wmax
+        w1 = wmax if wmax is not None else wmin
+        conditions.append('wmin <= ? AND wmax >= ?')
+        parameters += [w1, w0] if overlap else [w0, w1]
+    for key, value in (keys or {}).items():
+        key = _key(key)
+        like = 'LIKE' if isinstance(value, str) and ('%' in value or '_' in value) else '='
+        if key in COLUMNS:
+            conditions.append('{} {} ?'.format(COLUMNS[key], like))
+        else:  # The JSON path is a parameter as well
+            conditions.append('json_extract(header, ?) {} ?'.format(like))
+            parameters.append('$."{}"'.format(key.replace('"', '\\"')))
+        parameters.append(value)
+
+    sql = 'SELECT path, hdu, wmin, wmax, header FROM spectra'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    db = connect(database)
+    try:
+        rows = db.execute(sql + ' ORDER BY path', parameters).fetchall()
+    finally:
+        db.close()
+    return [{'path': row['path'], 'hdu': row['hdu'], 'wmin': row['wmin'], 'wmax': row['wmax'],
+             'header': json.loads(row['header'])} for row in rows]
+
+
+def _number(value):
+    """A value of a key given in the terminal (a number if possible)"""
+    for t in (int, float):
+        try:
+            return t(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description='Index an archive of spectra (fits files) '
+                                     'and find spectra by header values or wavelength')
+    parser.add_argument('--database', default=DATABASE,
+                        help='The index (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('scan', help='Add new and changed fits files to the index')
+    p.add_argument('input', nargs='+', help='Fits files or directories (searched recursively)')
+    p.add_argument('-w', '--workers', default=None, type=int,
+                   help='Number of processes reading the headers')
+
+    p = subparsers.add_parser('query', help='Find spectra in the index')
+    p.add_argument('-w', '--wavelength', nargs='+', type=float, default=None,
+                   help='The spectra cover this wavelength (or range: wmin wmax)')
+    p.add_argument('--overlap', default=False, action='store_true',
+                   help='Only part of the wavelength range must be covered')
+    p.add_argument('-k', '--key', default=[], action='append',
+                   help='KEY=VALUE the header must have, e.g. OBJECT=HD20010 or '
+                   'OBJECT=HD%% (pattern). Can be given several times')
+    p.add_argument('-s', '--show', default=[], nargs='+',
+                   help='Also print the values of these header keys')
+    return parser.parse_args()
+
+
+def main():
+    args = _parser()
+    if args.command == 'scan':
+        n, removed, unchanged = update(args.input, database=args.database, workers=args.workers)
+        print('{} files indexed, {} removed, {} unchanged'.format(n, removed, unchanged))
+        return
+
+    keys = {}
+    for key in args.key:
+        if '=' not in key:
+            raise SystemExit('Give the keys as KEY=VALUE, not: {}'.format(key))
+        key, value = key.split('=', 1)
+        keys[key] = _number(value)
+    w = args.wavelength or [None]
+    spectra = query(args.database, wmin=w[0], wmax=w[-1], keys=keys, overlap=args.overlap)
+    for spectrum in spectra:
+        values = [str(spectrum['header'].get(_key(key))) for key in args.show]
+        print('  '.join([spectrum['path'], '{}-{}'.format(spectrum['wmin'], spectrum['wmax'])] + values))
+
+
+if __name__ == '__main__':
+    main()
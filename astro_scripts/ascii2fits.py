@@ -2,14 +2,36 @@
 # -*- coding: utf8 -*-
 
 from __future__ import print_function
+import os
 from astropy.io import fits
 import numpy as np
-from scipy.interpolate import interp1d
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from .utils import vac2air
+from .resample import resample, linear_grid, METHODS
 
 
-def convert2fits(fname, fout=None, dA=0.01, unit='a', read=True, vac=None):
+def read_ascii(fname, chunksize=1000000):
+    """Read the wavelength and flux (first two columns) of an ASCII spectrum
+    with the C parser of pandas, in chunks of rows. Lines starting with #
+    are skipped.
+
+    :fname: File name of the ASCII spectrum
+    :chunksize: Number of rows parsed at once
+    :returns: The wavelength and flux
+    """
+    import pandas as pd
+    reader = pd.read_csv(fname, sep=r'\s+', header=None, usecols=[0, 1], comment='#',
+                         dtype=float, engine='c', chunksize=chunksize)
+    chunks = [chunk.values for chunk in reader]
+    if not chunks:
+        raise ValueError('No data in {}'.format(fname))
+    data = np.concatenate(chunks)
+    return data[:, 0], data[:, 1]
+
+
+def convert2fits(fname, fout=None, dA=0.01, unit='a', read=True, vac=None, method='linear'):
     """Convert a 2-column ASCII to fits format for splot@IRAF or ARES.
 
     Inputs
@@ -29,6 +51,9 @@ def convert2fits(fname, fout=None, dA=0.01, unit='a', read=True, vac=None):
       should contain the wavelength and flux vector
     vac : bool (default: None)
       If True convert the wavelength vector from vacuum to air
+    method : str (default: linear)
+      How to resample to the new wavelength: linear, cubic, or flux
+      (flux conserving). See astro_scripts.resample
 
     Output
     ------
@@ -40,11 +65,11 @@ def convert2fits(fname, fout=None, dA=0.01, unit='a', read=True, vac=None):
         fout = fname.rpartition('.')[0] + '.fits'
 
     if read:
-        ll, flux = np.loadtxt(fname, usecols=(0, 1), unpack=True)
+        ll, flux = read_ascii(fname)
     else:
         ll, flux = fname
 
-    if unit == 'nn':  # nano meters
+    if unit in ('nm', 'nn'):  # nano meters
         ll *= 10
     elif unit == 'cm':  # Inverse centimeters
         ll = 10E7/ll
@@ -58,27 +83,44 @@ def convert2fits(fname, fout=None, dA=0.01, unit='a', read=True, vac=None):
 
     N = int((ll[-1] - ll[0]) / dA)
 
-    flux_int_func = interp1d(ll, flux, kind='linear')
-    ll_int = np.arange(N) * dA + ll[0]
-    flux_int = flux_int_func(ll_int)
+    ll_int = linear_grid(ll[0], dA, N)
+    flux_int = resample(ll, flux, ll_int, method=method)
     prihdr = fits.Header()
     prihdr["NAXIS1"] = N
     prihdr["CDELT1"] = dA
     prihdr["CRVAL1"] = ll[0]
 
-    fits.writeto(fout, flux_int, prihdr, clobber=True)
+    fits.writeto(fout, flux_int, prihdr, overwrite=True)
+    return fout
+
+
+def batch(fnames, workers=None, **options):
+    """Convert many ASCII spectra to fits in parallel
+
+    :fnames: List of ASCII spectra
+    :workers: Number of processes (default: number of CPUs)
+    :options: Options for convert2fits (dA, unit, vac, method)
+    :returns: List of the output files
+    """
+    convert = partial(convert2fits, **options)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(fnames) // (4 * (workers or os.cpu_count() or 1)))
+        return list(executor.map(convert, fnames, chunksize=chunksize))
 
 
 def _parser():
     parser = argparse.ArgumentParser(description='Convert a 2-column ASCII '
                                      'with wavelength and intensity to a 1D '
                                      'spectra for splot@IRAF or ARES')
-    parser.add_argument('input', help='File name of ASCII file')
+    parser.add_argument('input', help='File name of ASCII file(s)', nargs='+')
     parser.add_argument('-o', '--output',
-                        help='File name of output. Default'
+                        help='File name of output (only for a single input). Default'
                         ' is the ASCII name with a .fits'
                         ' extension',
                         default=None)
+    parser.add_argument('-w', '--workers',
+                        help='Number of processes for multiple inputs',
+                        default=None, type=int)
     parser.add_argument('-d', '--delta',
                         help='Wavelength step (default: 0.01A)',
                         default=0.01,
@@ -88,6 +130,8 @@ def _parser():
                         default='a', choices=['aa', 'nm', 'cm', 'mm'])
     parser.add_argument('-v', '--vacuum', action='store_true', default=False,
                         help='If input spectrum is in vacuum, convert to air wavelengths')
+    parser.add_argument('-m', '--method', default='linear', choices=METHODS,
+                        help='Resampling: linear, cubic, or flux (conserving). Default: linear')
     args = parser.parse_args()
     return args
 
@@ -95,8 +139,15 @@ def _parser():
 def main():
     args = _parser()
 
-    convert2fits(args.input, fout=args.output, dA=args.delta,
-                 unit=args.unit, vac=args.vacuum)
+    if len(args.input) == 1:
+        convert2fits(args.input[0], fout=args.output, dA=args.delta,
+                     unit=args.unit, vac=args.vacuum, method=args.method)
+    else:
+        if args.output:
+            raise SystemExit('An output can only be given for a single input')
+        fouts = batch(args.input, workers=args.workers, dA=args.delta,
+                      unit=args.unit, vac=args.vacuum, method=args.method)
+        print('Converted {} spectra'.format(len(fouts)))
 
 
 if __name__ == '__main__':
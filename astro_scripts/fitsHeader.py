@@ -1,17 +1,299 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
+"""
+View the header of fits files, or look up keys in many fits files.
+
+The keys are looked up with a scanner, which only reads the 2880-byte
+header blocks of each HDU and skips the data (the size is in the header).
+Many files are scanned in parallel, and the values of the keys in the first
+(or all) HDUs are given as a table (CSV or Parquet).
+
+The headers can be kept in a persistent index (~/.fitsheader/index.pkl),
+keyed by the path and modification time of each file, so only new or
+changed files are scanned again.
+"""
 
 # My imports
-from __future__ import division
-from astropy.io import fits
-from pydoc import pager
+from __future__ import division, print_function
+import os
+import sys
+import csv
+import gzip
+import pickle
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+path = os.path.expanduser('~/.fitsheader/')
+INDEX = os.path.join(path, 'index.pkl')
+BLOCK = 2880
+CARD = 80
+EXTENSIONS = ('.fits', '.fit', '.fts', '.fits.gz', '.fit.gz', '.fts.gz')
+
+
+def _string(value):
+    """A string value (starting with a quote) and the rest of the card"""
+    i = 1
+    chars = []
+    while i < len(value):
+        if value[i] == "'":
+            if value[i+1:i+2] == "'":  # A quote in the string
+                chars.append("'")
+                i += 2
+                continue
+            break
+        chars.append(value[i])
+        i += 1
+    return ''.join(chars).rstrip(), value[i+1:]
+
+
+def _value(value):
+    """The value of a card (the part after '= ')"""
+    value = value.strip()
+    if value.startswith("'"):
+        return _string(value)[0]
+    value = value.split('/', 1)[0].strip()
+    if not value:
+        return None
+    if value == 'T':
+        return True
+    if value == 'F':
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.replace('D', 'E'))
+    except ValueError:
+        return value
+
+
+def parse_header(block):
+    """Parse the cards of a header (COMMENT, HISTORY, and blank cards are
+    skipped, and long strings with CONTINUE are joined)
+
+    :block: The header (bytes, a multiple of 80 characters)
+    :returns: A dictionary with the keys (upper case) and values. HIERARCH
+              keys are without HIERARCH, e.g. 'ESO INS WLEN MIN'
+    """
+    header = {}
+    last = None
+    text = block.decode('ascii', 'replace')
+    for i in range(0, len(text), CARD):
+        card = text[i:i+CARD]
+        key = card[:8].strip().upper()
+        if key == 'END':
+            break
+        if key == 'CONTINUE' and last is not None:
+            previous = header[last]
+            if isinstance(previous, str) and previous.endswith('&'):
+                header[last] = previous[:-1] + _value(card[8:])
+            continue
+        if key == 'HIERARCH' and '=' in card:
+            key, value = card[8:].split('=', 1)
+            key = ' '.join(key.split()).upper()
+        elif card[8:10] == '= ':
+            value = card[10:]
+        else:
+            last = None
+            continue
+        header[key] = _value(value)
+        last = key
+    return header
+
+
+def _data_size(header):
+    """Bytes of the data of an HDU (with the padding to full blocks)"""
+    naxis = header.get('NAXIS', 0)
+    if not naxis:
+        return 0
+    n = 1
+    for i in range(1, naxis + 1):
+        n *= header.get('NAXIS{}'.format(i), 0)
+    size = abs(header.get('BITPIX', 8)) // 8 * header.get('GCOUNT', 1) * (header.get('PCOUNT', 0) + n)
+    return -(-size // BLOCK) * BLOCK
+
+
+def read_headers(fname, hdus=None):
+    """Read the headers of a fits file without reading the data
+
+    :fname: The fits file (or .gz)
+    :hdus: Number of HDUs to read (default: all)
+    :returns: A list of the headers (see parse_header) of the HDUs
+    """
+    headers = []
+    with (gzip.open if fname.endswith('.gz') else open)(fname, 'rb') as f:
+        while hdus is None or len(headers) < hdus:
+            blocks = []
+            while True:
+                block = f.read(BLOCK)
+                if len(block) < BLOCK:
+                    if blocks or not headers:
+                        raise ValueError('Not a valid fits file: {}'.format(fname))
+                    return headers  # End of the file
+                blocks.append(block)
+                if not headers and len(blocks) == 1 and not block.startswith(b'SIMPLE  '):
+                    raise ValueError('Not a fits file: {}'.format(fname))
+                if _end(block):
+                    break
+            header = parse_header(b''.join(blocks))
+            headers.append(header)
+            f.seek(_data_size(header), 1)
+    return headers
+
+
+def _end(block):
+    """Is the END card in the header block"""
+    for i in range(0, BLOCK, CARD):
+        if block[i:i+8] == b'END     ':
+            return True
+    return False
+
+
+def _read(fname):
+    """read_headers, which returns the error instead of raising it"""
+    try:
+        return read_headers(fname), None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+def load_index(fname=INDEX):
+    """The persistent index: {path: (mtime, size, headers)}"""
+    if not os.path.isfile(fname):
+        return {}
+    with open(fname, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_index(index, fname=INDEX):
+    """Save the persistent index (safe for other processes reading it)"""
+    dirname = os.path.dirname(fname)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    tmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, fname)
+
+
+def scan(fnames, workers=None, index=None):
+    """The headers of all the HDUs of many fits files, read in parallel
+
+    :fnames: List of fits files
+    :workers: Number of processes (default: number of CPUs)
+    :index: File of the persistent index. Files with the same path and
+            modification time as in the index are not read again
+    :returns: Dictionary with the headers of each file (files which could
+              not be read are left out)
+    """
+    cache = load_index(index) if index else {}
+    headers = {}
+    todo = []
+    for fname in fnames:
+        key = os.path.abspath(fname)
+        try:
+            st = os.stat(fname)
+        except OSError as e:
+            print('Warning: Could not read {}. {}'.format(fname, e), file=sys.stderr)
+            continue
+        if key in cache and cache[key][:2] == (st.st_mtime, st.st_size):
+            headers[fname] = cache[key][2]
+        else:
+            todo.append((fname, key, st))
+
+    if len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(todo) // (4 * (workers or os.cpu_count() or 1)))
+            results = list(executor.map(_read, [t[0] for t in todo], chunksize=chunksize))
+    else:
+        results = [_read(t[0]) for t in todo]
+
+    for (fname, key, st), (result, error) in zip(todo, results):
+        if error:
+            print('Warning: Could not read {}. {}'.format(fname, error), file=sys.stderr)
+            continue
+        headers[fname] = result
+        cache[key] = (st.st_mtime, st.st_size, result)
+    if index and todo:
+        save_index(cache, index)
+    return {fname: headers[fname] for fname in fnames if fname in headers}
+
+
+def _key(key):
+    """A key as in the parsed headers, e.g. 'hierarch eso  det' -> 'ESO DET'"""
+    key = key.split()
+    if len(key) > 1 and key[0].upper() == 'HIERARCH':
+        key = key[1:]
+    return ' '.join(key).upper()
+
+
+def table(fnames, keys, all_hdus=False, workers=None, index=None):
+    """The values of some keys in many fits files (case insensitive)
+
+    :fnames: List of fits files
+    :keys: List of keys
+    :all_hdus: A row for each HDU instead of only the first HDU
+    :workers: Number of processes (default: number of CPUs)
+    :index: File of the persistent index (see scan)
+    :returns: The column names and a list of the rows (None for missing keys)
+    """
+    names = ['fname'] + (['hdu'] if all_hdus else []) + list(keys)
+    rows = []
+    for fname, headers in scan(fnames, workers=workers, index=index).items():
+        for hdu, header in enumerate(headers if all_hdus else headers[:1]):
+            row = [fname] + ([hdu] if all_hdus else [])
+            rows.append(row + [header.get(_key(key)) for key in keys])
+    return names, rows
+
+
+def write_table(names, rows, output=None):
+    """Write the table to a CSV (default: stdout) or Parquet (.parquet) file"""
+    if output and output.endswith('.parquet'):
+        import pandas as pd
+        df = pd.DataFrame(rows, columns=names)
+        for name in names:  # Mixed types can not be saved
+            if df[name].dtype == object:
+                df[name] = df[name].map(lambda v: v if v is None else str(v))
+        df.to_parquet(output, index=False)
+        return
+    f = open(output, 'w', newline='') if output else sys.stdout
+    try:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(['' if v is None else v for v in row] for row in rows)
+    finally:
+        if output:
+            f.close()
+
+
+def _inputs(paths):
+    """The fits files given directly or in the directories (recursive)"""
+    fnames = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                dirs.sort()
+                fnames += [os.path.join(root, f) for f in sorted(files)
+                           if f.lower().endswith(EXTENSIONS)]
+        else:
+            fnames.append(p)
+    return fnames
 
 
 def _parser():
     parser = argparse.ArgumentParser(description='View the header of a fits file')
-    parser.add_argument('input', help='File name of fits file', nargs='+')
-    parser.add_argument('-key', help='Look up a given key (case insensitive)', default=None)
+    parser.add_argument('input', help='File name of fits file (or directories)', nargs='+')
+    parser.add_argument('-key', help='Look up a given key (case insensitive). Can be given '
+                        'several times', default=None, action='append')
+    parser.add_argument('-a', '--all-hdus', help='Look up the keys in all HDUs',
+                        default=False, action='store_true')
+    parser.add_argument('-o', '--output', help='Save the table of the keys (.csv or .parquet)',
+                        default=None)
+    parser.add_argument('-w', '--workers', help='Number of processes for many files',
+                        default=None, type=int)
+    parser.add_argument('-i', '--index', help='Keep the headers in a persistent index '
+                        '(default: %(const)s)', nargs='?', const=INDEX, default=None)
     return parser.parse_args()
 
 
@@ -19,15 +301,21 @@ def main():
     args = _parser()
 
     if args.key:
-        args.key = args.key.lower()
-        for fname in args.input:
-            h = fits.getheader(fname)
-            h.keys = map(str.lower, h.keys())
-            try:
-                print('{}:  {}'.format(fname, h[args.key]))
-            except KeyError:
+        fnames = _inputs(args.input)
+        names, rows = table(fnames, args.key, all_hdus=args.all_hdus,
+                            workers=args.workers, index=args.index)
+        if args.output or args.all_hdus or len(args.key) > 1:
+            write_table(names, rows, args.output)
+            return
+        found = {row[0]: row[1] for row in rows}
+        for fname in fnames:
+            if found.get(fname) is not None:
+                print('{}:  {}'.format(fname, found[fname]))
+            else:
                 print('Key was not found in: {}'.format(fname))
     else:
+        from astropy.io import fits
+        from pydoc import pager
         h = fits.getheader(args.input[0])
         string = '\n'.join("{!s} : {!r}".format(key, val) for (key, val) in h.items())
         pager(string)
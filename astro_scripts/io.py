@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Read observed spectra from the different instruments.
+
+A reader for each instrument (or file format) is registered with the
+register decorator. It gets the open (memory-mapped) fits file and returns
+a list of Spectrum, one per order or extension, so all the orders are read
+with a single file open. The data is only read from disk when it is used.
+"""
+
+# My imports
+from __future__ import division, print_function
+import os
+import numpy as np
+from astropy.io import fits
+from .utils import get_wavelength
+
+path = os.path.expanduser('~/.plotfits/')
+pathGIANO = os.path.join(path, 'wavelength_GIANO.dat')
+
+_readers = {}
+
+
+class Spectrum(object):
+    """A spectrum with wavelength, flux, and header.
+
+    The wavelength and flux can also be given as functions without
+    arguments, which are only called (once) when the attribute is used.
+    """
+
+    def __init__(self, wavelength, flux, header=None, primary_header=None,
+                 order=None, fname=None):
+        self._wavelength = wavelength
+        self._flux = flux
+        self.header = header
+        self.primary_header = primary_header if primary_header is not None else header
+        self.order = order
+        self.fname = fname
+
+    @property
+    def wavelength(self):
+        if callable(self._wavelength):
+            self._wavelength = self._wavelength()
+        return self._wavelength
+
+    @property
+    def flux(self):
+        if callable(self._flux):
+            self._flux = self._flux()
+        return self._flux
+
+    def __len__(self):
+        return len(self.flux)
+
+    def __repr__(self):
+        return 'Spectrum(fname={!r}, order={!r})'.format(self.fname, self.order)
+
+
+def register(ftype):
+    """Register a reader for a type of fits file (e.g. an instrument).
+
+    The reader is called as reader(hdul, orders, **options), where hdul is
+    the open fits file and orders is a list of the orders/extensions to read
+    (None for all). It returns a list of Spectrum.
+    """
+    def decorator(reader):
+        _readers[ftype.upper()] = reader
+        return reader
+    return decorator
+
+
+def ftypes():
+    """The types of fits files with a registered reader"""
+    return sorted(_readers)
+
+
+def read_spectra(fname, ftype='1D', orders=None, **options):
+    """Read one or more orders/extensions from a fits file (opened once)
+
+    :fname: Input spectra
+    :ftype: Type of fits file (see ftypes)
+    :orders: List of orders/extensions to read (default: all)
+    :options: Options for the reader, e.g. convert for 1D or wavefile for GIANO
+    :returns: A list of Spectrum
+    """
+    try:
+        reader = _readers[ftype.upper()]
+    except KeyError:
+        raise ValueError('No reader for ftype: {}. Choose from: {}'.format(ftype, ftypes()))
+    with fits.open(fname, memmap=True) as hdul:
+        spectra = reader(hdul, orders, **options)
+    for spectrum in spectra:
+        spectrum.fname = fname
+    return spectra
+
+
+def read_spectrum(fname, ftype='1D', order=None, **options):
+    """Read a single order/extension from a fits file
+
+    :fname: Input spectra
+    :ftype: Type of fits file (see ftypes)
+    :order: Order/extension to read (default: the first)
+    :options: Options for the reader
+    :returns: A Spectrum
+    """
+    orders = None if order is None else [order]
+    return read_spectra(fname, ftype, orders, **options)[0]
+
+
+@register('1D')
+def _read_1d(hdul, orders=None, convert=False, **options):
+    """1D spectra with the wavelength in CRVAL1, CDELT1, and NAXIS1.
+    The orders are the extensions (default: 0)."""
+    spectra = []
+    for ext in orders or [0]:
+        hdr = hdul[ext].header
+        spectra.append(Spectrum(lambda hdr=hdr: get_wavelength(hdr, convert=convert),
+                                hdul[ext].data, header=hdr,
+                                primary_header=hdul[0].header, order=ext))
+    return spectra
+
+
+@register('CRIRES')
+def _read_crires(hdul, orders=None, **options):
+    """CRIRES pipeline products with a table for each detector extension
+    (default: all)."""
+    spectra = []
+    for ext in orders or range(1, len(hdul)):
+        d = hdul[ext].data
+        spectra.append(Spectrum(lambda d=d: d['Wavelength']*10, lambda d=d: d['Extracted_OPT'],
+                                header=hdul[ext].header, primary_header=hdul[0].header,
+                                order=ext))
+    return spectra
+
+
+@register('GIANO')
+def _read_giano(hdul, orders=None, wavefile=None, **options):
+    """GIANO spectra with an order per row. The wavelength range of each
+    order is in the file wavefile (order, wmin, wmax). Orders start at 32
+    (default: all)."""
+    d = hdul[0].data
+    wd = np.loadtxt(wavefile or pathGIANO)
+    spectra = []
+    for order in orders or range(32, 32 + len(d)):
+        I = d[order - 32]  # 32 is the first order
+        w0, w1 = wd[wd[:, 0] == order][0][1:]
+        spectra.append(Spectrum(lambda w0=w0, w1=w1, n=len(I): np.linspace(w0, w1, n, endpoint=True),
+                                I, header=hdul[0].header, order=order))
+    return spectra
+
+
+@register('UVES')
+def _read_uves(hdul, orders=None, **options):
+    raise NotImplementedError('Please be patient. Not quite there yet')
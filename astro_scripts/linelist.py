@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Line lists in a binary format.
+
+A MOOG line list (ASCII) is parsed once and stored as a structured array
+sorted by wavelength (.npy). The binary file is memory-mapped and a
+wavelength window is found with a binary search, so only the lines in the
+window are read from disk.
+
+ASCII line lists given to read_linelist are converted once and cached in
+~/.plotfits/linelists/ (keyed by the path, size, and modification time).
+The least recently used line lists are removed when the cache grows above
+CACHE_SIZE.
+
+The columns are wavelength, element (MOOG species, e.g. 26.1), excit,
+loggf, and ew. The last column is the fifth column of the MOOG file (the EW
+for abfind, D0 for synthesis line lists) and NaN if missing.
+"""
+
+# My imports
+from __future__ import division, print_function
+import os
+import hashlib
+import argparse
+from bisect import bisect_left, bisect_right
+from itertools import islice
+import numpy as np
+from .utils import save_npy, prune_cache
+
+path = os.path.expanduser('~/.plotfits/')
+pathlinelists = os.path.join(path, 'linelists')
+
+DTYPE = np.dtype([('wavelength', 'f8'), ('element', 'f8'), ('excit', 'f8'),
+                  ('loggf', 'f8'), ('ew', 'f8')])
+HEADER = 'Wavelength\tEle\t  excit\t  log gf\t\t\t EW'
+FMT = ('%9.3f', '%10.1f', '%9.2f', '%9.3f', '%28.1f')
+CHUNKSIZE = 100000  # Number of lines parsed or formatted at once
+CACHE_SIZE = 500 * 1024**2  # Maximum size of the cache in bytes
+
+
+def _parse(lines):
+    """Parse the lines of a MOOG line list (without the header)"""
+    if not len(lines):
+        return np.zeros(0, dtype=DTYPE)
+    try:
+        rows = np.loadtxt(lines, ndmin=2)
+    except ValueError:  # Not all lines have the same number of columns
+        rows = [line.split() for line in lines]
+        rows = [row for row in rows if row and not row[0].startswith('#')]
+        table = np.full((len(rows), len(DTYPE)), np.nan)
+        for i, row in enumerate(rows):
+            row = row[:len(DTYPE)]
+            table[i, :len(row)] = row
+        rows = table
+
+    data = np.full(len(rows), np.nan, dtype=DTYPE)
+    for i, name in enumerate(DTYPE.names[:rows.shape[1]]):
+        data[name] = rows[:, i]
+    return data
+
+
+def read_moog(fname, skiprows=1):
+    """Parse a MOOG line list (ASCII)
+
+    :fname: The line list
+    :skiprows: Number of header lines
+    :returns: A structured array (DTYPE) sorted by wavelength
+    """
+    with open(fname) as lines:
+        return sort(_parse(list(islice(lines, skiprows, None))))
+
+
+def iter_moog(fname, chunksize=CHUNKSIZE, skiprows=1):
+    """Parse a MOOG line list in chunks (in the order of the file)
+
+    :fname: The line list
+    :chunksize: Number of lines in each chunk
+    :skiprows: Number of header lines
+    :returns: A generator of structured arrays (DTYPE)
+    """
+    with open(fname) as lines:
+        lines = islice(lines, skiprows, None)
+        while True:
+            chunk = list(islice(lines, chunksize))
+            if not chunk:
+                break
+            yield _parse(chunk)
+
+
+def iter_linelist(fname, chunksize=CHUNKSIZE):
+    """A line list in the binary (.npy) or MOOG format in chunks"""
+    if fname.endswith('.npy'):
+        data = load(fname)
+        for i in range(0, len(data), chunksize):
+            yield data[i:i+chunksize]
+    else:
+        for chunk in iter_moog(fname, chunksize):
+            yield chunk
+
+
+def format_moog(data, fmt=FMT):
+    """Format a line list in the MOOG format (one string per line). The ew
+    column is left blank if it is NaN.
+
+    :data: A structured array (DTYPE)
+    :fmt: The format of each column
+    :returns: A list of the lines (without newlines)
+    """
+    full = ''.join(fmt)
+    short = ''.join(fmt[:-1])
+    rows = np.column_stack([data[name] for name in DTYPE.names]).tolist() if len(data) else []
+    return [full % tuple(row) if row[-1] == row[-1] else short % tuple(row[:-1]) for row in rows]
+
+
+def write_moog(data, fname, header=HEADER, fmt=FMT):
+    """Write a line list in the MOOG format. The ew column is left blank
+    where it is NaN.
+
+    :data: A structured array (DTYPE)
+    :fname: The output file (name or open file)
+    :header: The header (1 line). None for no header
+    :fmt: The format of each column
+    """
+    if not hasattr(fname, 'write'):
+        with open(fname, 'w') as f:
+            return write_moog(data, f, header=header, fmt=fmt)
+    if header is not None:
+        fname.write(header + '\n')
+    for i in range(0, len(data), CHUNKSIZE):
+        lines = format_moog(data[i:i+CHUNKSIZE], fmt=fmt)
+        fname.write('\n'.join(lines) + '\n')
+
+
+def sort(data):
+    """Sort a line list by wavelength"""
+    return data[np.argsort(data['wavelength'], kind='stable')]
+
+
+def save(data, fname):
+    """Save a line list in the binary format (sorted by wavelength)
+
+    :data: A structured array (DTYPE)
+    :fname: The output file (.npy)
+    """
+    save_npy(fname, sort(np.asarray(data, dtype=DTYPE)))
+
+
+def load(fname):
+    """Memory-map a line list in the binary format"""
+    return np.load(fname, mmap_mode='r')
+
+
+def _cache_name(fname):
+    """The binary cache of an ASCII line list"""
+    fname = os.path.abspath(fname)
+    st = os.stat(fname)
+    key = repr([fname, st.st_mtime, st.st_size])
+    return os.path.join(pathlinelists, '{}.npy'.format(hashlib.sha1(key.encode('utf8')).hexdigest()))
+
+
+def read_linelist(fname, cache=True):
+    """Read a line list in the binary (.npy) or MOOG format
+
+    The MOOG format is converted to the binary format once and cached.
+
+    :fname: The line list
+    :cache: Use the cache for line lists in the MOOG format
+    :returns: A structured array (DTYPE) sorted by wavelength
+    """
+    if fname.endswith('.npy'):
+        return load(fname)
+    if not cache:
+        return read_moog(fname)
+    out = _cache_name(fname)
+    if os.path.isfile(out):
+        os.utime(out, None)  # Mark as recently used
+    else:
+        if os.path.isdir(pathlinelists):  # Before saving, so the new line list is kept
+            prune_cache(pathlinelists, CACHE_SIZE)
+        save(read_moog(fname), out)
+    return load(out)
+
+
+def window(data, w0, w1):
+    """The lines with w0 <= wavelength <= w1 (binary search)
+
+    :data: A line list sorted by wavelength
+    :w0: Lower wavelength limit
+    :w1: Upper wavelength limit
+    :returns: The lines in the window (a view)
+    """
+    # bisect instead of np.searchsorted, which copies the (strided) column
+    wavelength = data['wavelength']
+    i0 = bisect_left(wavelength, w0)
+    i1 = bisect_right(wavelength, w1, lo=i0)
+    return data[i0:i1]
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description='Convert a line list between the MOOG '
+                                     'format and the binary format (.npy)')
+    parser.add_argument('input', help='Input line list (.npy for the binary format)')
+    parser.add_argument('output', help='Output line list (.npy for the binary format)')
+    parser.add_argument('-w0', '--wmin', help='Lower wavelength limit', default=None, type=float)
+    parser.add_argument('-w1', '--wmax', help='Upper wavelength limit', default=None, type=float)
+    return parser.parse_args()
+
+
+def main():
+    args = _parser()
+    data = read_linelist(args.input, cache=False)
+    if args.wmin is not None or args.wmax is not None:
+        w0 = -np.inf if args.wmin is None else args.wmin
+        w1 = np.inf if args.wmax is None else args.wmax
+        data = window(data, w0, w1)
+    if args.output.endswith('.npy'):
+        save(data, args.output)
+    else:
+        write_moog(data, args.output)
+    print('Output file: {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,249 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
+"""
+Filter a line list with one or more queries.
+
+A query is a condition on the columns of the line list (wavelength,
+element, excit, loggf, and ew), e.g.:
+
+    wavelength >= 5000 and wavelength <= 6000
+    4000 < wavelength < 7000 and (loggf > -3 or element in (26.0, 26.1))
+    not element == 106.0
+
+Conditions are combined with and/or/not (or &, |, ~, which need
+parentheses around the comparisons as in Python). All queries are
+applied in one pass over the line list, which is read and written in chunks.
+In Python the conditions can also be made with Column, e.g.
+(Column('excit') < 5) & Column('element').isin([26.0, 26.1]).
+"""
 
 # My imports
 from __future__ import division, print_function
+import ast
+import operator
 import numpy as np
 import argparse
+from functools import reduce
+from .linelist import (DTYPE, HEADER, FMT, CHUNKSIZE, iter_linelist, write_moog,
+                       save, load)
+
+_compare = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt,
+            ast.LtE: operator.le, ast.Eq: operator.eq, ast.NotEq: operator.ne}
+
+
+class Predicate(object):
+    """A condition on a line list, which returns a boolean mask. Combine
+    with &, |, and ~."""
+
+    def __init__(self, func, description):
+        self._func = func
+        self.description = description
+
+    def __call__(self, data):
+        return self._func(data)
+
+    def __and__(self, other):
+        return Predicate(lambda data: self(data) & other(data),
+                         '({} & {})'.format(self.description, other.description))
+
+    def __or__(self, other):
+        return Predicate(lambda data: self(data) | other(data),
+                         '({} | {})'.format(self.description, other.description))
+
+    def __invert__(self):
+        return Predicate(lambda data: ~self(data), '~{}'.format(self.description))
+
+    def __repr__(self):
+        return 'Predicate({})'.format(self.description)
+
+
+class Column(object):
+    """A column of the line list. Comparisons give a Predicate."""
+    __hash__ = None
+
+    def __init__(self, name):
+        if name not in DTYPE.names:
+            raise ValueError('Unknown column: {}. Choose from: {}'.format(name, DTYPE.names))
+        self.name = name
+
+    def _compare(self, op, symbol, value):
+        if isinstance(value, Column):
+            return Predicate(lambda data: op(data[self.name], data[value.name]),
+                             '{} {} {}'.format(self.name, symbol, value.name))
+        return Predicate(lambda data: op(data[self.name], value),
+                         '{} {} {!r}'.format(self.name, symbol, value))
+
+    def __gt__(self, value):
+        return self._compare(operator.gt, '>', value)
+
+    def __ge__(self, value):
+        return self._compare(operator.ge, '>=', value)
+
+    def __lt__(self, value):
+        return self._compare(operator.lt, '<', value)
+
+    def __le__(self, value):
+        return self._compare(operator.le, '<=', value)
+
+    def __eq__(self, value):
+        return self._compare(operator.eq, '==', value)
+
+    def __ne__(self, value):
+        return self._compare(operator.ne, '!=', value)
+
+    def between(self, lower, upper):
+        """lower <= column <= upper"""
+        return (self >= lower) & (self <= upper)
+
+    def isin(self, values):
+        values = list(values)
+        return Predicate(lambda data: np.isin(data[self.name], values),
+                         '{} in {!r}'.format(self.name, values))
+
+
+def _value(node):
+    """A number or a tuple/list of numbers in a query"""
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        return [_value(n) for n in node.elts]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _value(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    try:  # literal_eval also knows ast.Num (numbers before Python 3.8)
+        value = ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        value = None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    raise ValueError('Expected a number, not: {}'.format(ast.dump(node)))
+
+
+def _operand(node):
+    """A column or a value in a comparison"""
+    if isinstance(node, ast.Name):
+        return Column(node.id)
+    return _value(node)
+
+
+def _predicate(node):
+    """Translate the syntax tree of a query to a Predicate"""
+    if isinstance(node, ast.BoolOp):
+        op = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        return reduce(op, map(_predicate, node.values))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+        op = operator.and_ if isinstance(node.op, ast.BitAnd) else operator.or_
+        return op(_predicate(node.left), _predicate(node.right))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.Invert)):
+        return ~_predicate(node.operand)
+    if isinstance(node, ast.Compare):
+        predicates = []
+        left = _operand(node.left)
+        for op, right in zip(node.ops, node.comparators):
+            right = _operand(right)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(left, Column):
+                    raise ValueError('Expected a column before "in"')
+                predicate = left.isin(right)
+                predicates.append(~predicate if isinstance(op, ast.NotIn) else predicate)
+            elif isinstance(left, Column) or isinstance(right, Column):
+                predicates.append(_compare[type(op)](left, right))
+            else:
+                raise ValueError('A comparison needs a column')
+            left = right
+        return reduce(operator.and_, predicates)
+    raise ValueError('Not a valid query: {}'.format(ast.dump(node)))
+
+
+def parse(query):
+    """Parse a query (see the module doc) to a Predicate
+
+    :query: The query
+    :returns: The Predicate
+    """
+    try:
+        tree = ast.parse(query.strip(), mode='eval')
+    except SyntaxError:
+        raise ValueError('Not a valid query: {}'.format(query))
+    return _predicate(tree.body)
+
+
+def _combine(queries):
+    """One Predicate from a query, a Predicate, or a list of them (and)"""
+    if isinstance(queries, (str, Predicate)):
+        queries = [queries]
+    queries = [parse(q) if isinstance(q, str) else q for q in queries]
+    return reduce(operator.and_, queries)
+
+
+def select(data, queries):
+    """The lines of a line list which fulfil all the queries
+
+    :data: A structured array (see linelist.DTYPE)
+    :queries: A query, a Predicate, or a list of them
+    :returns: The selected lines
+    """
+    return data[_combine(queries)(data)]
+
+
+def filter_linelist(fname, queries, output, header=HEADER, chunksize=CHUNKSIZE):
+    """Filter a line list with one pass over the file in chunks
+
+    :fname: The line list (MOOG format or .npy)
+    :queries: A query, a Predicate, or a list of them (all must be fulfilled)
+    :output: The output line list (MOOG format, or binary if .npy)
+    :header: The header of the output in the MOOG format
+    :chunksize: Number of lines read at once
+    :returns: The number of selected lines
+    """
+    predicate = _combine(queries)
+    if output.endswith('.npy'):
+        chunks = [chunk[predicate(chunk)] for chunk in iter_linelist(fname, chunksize)]
+        data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=DTYPE)
+        save(data, output)
+        return len(data)
+
+    n = 0
+    with open(output, 'w') as f:
+        f.write(header + '\n')
+        for chunk in iter_linelist(fname, chunksize):
+            chunk = chunk[predicate(chunk)]
+            write_moog(chunk, f, header=None)
+            n += len(chunk)
+    return n
 
 
 def ll_filter(fname, col, limit, sign, element):
-    data = np.loadtxt(fname, skiprows=1, unpack=True)
-    if sign and element:
-        i = (data[col] > limit) | (data[1] == element)
-    elif not sign and element:
-        i = (data[col] < limit) | (data[1] == element)
-    elif sign and not element:
-        i = data[col] > limit
-    elif not sign and not element:
-        i = data[col] < limit
+    """Filter a line list by a column and a limit. The lines keep the order
+    and all the columns of the input.
 
-    return data[:, i].T
+    :fname: The line list (MOOG format or .npy)
+    :col: The column (starting at 0)
+    :limit: Keep the lines below the limit (above if sign)
+    :sign: Keep the lines above the limit
+    :element: Always keep the lines of this element (e.g. 26.1)
+    :returns: The lines (2D array)
+    """
+    if fname.endswith('.npy'):
+        lines = load(fname)
+        rows = np.column_stack([lines[name] for name in DTYPE.names])
+    else:
+        rows = np.loadtxt(fname, skiprows=1, ndmin=2)
+    i = rows[:, col] > limit if sign else rows[:, col] < limit
+    if element:
+        i |= rows[:, 1] == element
+    return rows[i]
 
 
 def _parser():
-    parser = argparse.ArgumentParser(description='Filter the linelist by a column and an upper limit')
+    parser = argparse.ArgumentParser(description='Filter the linelist by a column and an '
+                                     'upper limit, or by one or more queries')
     parser.add_argument('input',
                         help='Input linelist')
     parser.add_argument('col',
                         help='Column to be sorted (starting at 0)',
-                        type=int)
+                        type=int, nargs='?')
     parser.add_argument('limit',
                         help='The upper limit on the column',
-                        type=float)
+                        type=float, nargs='?')
     parser.add_argument('-o', '--output',
                         help='The output linelist',
                         default=None)
@@ -44,7 +257,14 @@ def _parser():
                         ' not be removed.',
                         default=26.1,
                         type=float)
+    parser.add_argument('-q', '--query',
+                        help='Keep the lines fulfilling the query, e.g. '
+                        '"5000 < wavelength < 6000 and loggf > -3". '
+                        'Can be given several times (all must be fulfilled)',
+                        action='append', default=[])
     args = parser.parse_args()
+    if not args.query and (args.col is None or args.limit is None):
+        parser.error('Give a column and a limit, or a query')
     return args
 
 
@@ -58,15 +278,23 @@ def main():
     element = args.element
     if not args.output:
         t = fname.split('.')
-        t[0] += '_filtered_%s_%s' % (col, limit)
+        if args.query:
+            t[0] += '_filtered'
+        else:
+            t[0] += '_filtered_%s_%s' % (col, limit)
         output = '.'.join(t)
     else:
         output = args.output
 
+    if args.query:
+        n = filter_linelist(fname, args.query, output)
+        print('{} lines saved in {}'.format(n, output))
+        return
+
     data = ll_filter(fname, col, limit, sign, element)
     print('Result saved in {}'.format(output))
     np.savetxt(output, data,
-           fmt=('%9.3f', '%10.1f', '%9.2f', '%9.3f', '%28.1f'),
+           fmt=FMT[:data.shape[1]] + ('%10.3f',) * (data.shape[1] - len(FMT)),
            header='Wavelength\tEle\t  excit\t  log gf\t\t\t EW',
            comments='')
 
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Read a wavelength window of a model atmosphere spectrum.
+
+The model (and the PHOENIX wavelength vector) are opened memory-mapped and
+the window is found with a binary search, so only the needed slice is read
+from disk. The windowed, air converted, and normalized spectrum is stored in
+an on-disk LRU cache in ~/.plotfits/cache/.
+
+The air wavelengths of wavelength files (e.g. PHOENIX) are the same for all
+models, so they are computed once and stored as .npy in ~/.plotfits/grids/.
+"""
+
+# My imports
+from __future__ import division, print_function
+import os
+import hashlib
+import numpy as np
+from astropy.io import fits
+from .utils import vac2air, air2vac as _air2vac, save_npy, prune_cache
+from .normalize import normalize_constant
+
+path = os.path.expanduser('~/.plotfits/')
+pathwave = os.path.join(path, 'WAVE_PHOENIX-ACES-AGSS-COND-2011.fits')
+pathcache = os.path.join(path, 'cache')
+pathgrids = os.path.join(path, 'grids')
+CACHE_SIZE = 500 * 1024**2  # Maximum size of the cache in bytes
+
+
+def _fingerprint(fname, block=65536):
+    """Hash of the size, the beginning, and the end of a file"""
+    h = hashlib.sha1(str(os.path.getsize(fname)).encode('utf8'))
+    with open(fname, 'rb') as f:
+        h.update(f.read(block))
+        f.seek(max(os.path.getsize(fname) - block, 0))
+        h.update(f.read(block))
+    return h.hexdigest()
+
+
+def vacuum_wavelength(fname=pathwave):
+    """The wavelength vector of a wavelength file (e.g. PHOENIX), cached as
+    .npy and memory-mapped.
+
+    :fname: Fits file with the vacuum wavelength as data
+    :returns: The memory-mapped wavelength
+    """
+    out = os.path.join(pathgrids, '{}_vac.npy'.format(_fingerprint(fname)))
+    if not os.path.isfile(out):
+        save_npy(out, np.asarray(fits.getdata(fname), dtype=float))
+    return np.load(out, mmap_mode='r')
+
+
+def air_wavelength(fname=pathwave, density=1.0):
+    """The air wavelength of a wavelength file (e.g. PHOENIX), converted
+    once with vac2air, cached as .npy and memory-mapped.
+
+    :fname: Fits file with the vacuum wavelength as data
+    :density: The density used in vac2air
+    :returns: The memory-mapped air wavelength
+    """
+    out = os.path.join(pathgrids, '{}_air_{!r}.npy'.format(_fingerprint(fname), float(density)))
+    if not os.path.isfile(out):
+        save_npy(out, vac2air(vacuum_wavelength(fname), density))
+    return np.load(out, mmap_mode='r')
+
+
+def air2vac(wavelength, fname=pathwave, density=1.0):
+    """Convert air to vacuum wavelength with the cached grids of a
+    wavelength file. Outside the grid the conversion is done directly.
+
+    :wavelength: Air wavelength
+    :fname: Fits file with the vacuum wavelength as data
+    :density: The density used in vac2air
+    :returns: The vacuum wavelength
+    """
+    wavelength = np.asarray(wavelength, dtype=float)
+    air = air_wavelength(fname, density)
+    vac = vacuum_wavelength(fname)
+    i0, i1 = np.searchsorted(air, [wavelength.min(), wavelength.max()])
+    i0, i1 = max(i0 - 1, 0), min(i1 + 1, len(air))
+    result = np.interp(wavelength, air[i0:i1], vac[i0:i1])
+    outside = (wavelength < air[0]) | (wavelength > air[-1])
+    if np.any(outside):
+        result[outside] = _air2vac(wavelength[outside], density)
+    return result
+
+
+def cut_model(w_mod, I_mod, w0, w1, normalize=True):
+    """Cut out the model between w0 and w1 and normalize it
+
+    :w_mod: Wavelength of the model (sorted)
+    :I_mod: Flux of the model
+    :w0: Lower wavelength limit
+    :w1: Upper wavelength limit
+    :normalize: Normalize the flux in the window
+    :returns: The wavelength and flux in the window
+    """
+    # Same as (w_mod > w0) & (w_mod < w1), but without scanning the model
+    i0 = np.searchsorted(w_mod, w0, side='right')
+    i1 = np.searchsorted(w_mod, w1, side='left')
+    w_mod = np.array(w_mod[i0:i1], dtype=float)
+    I_mod = np.array(I_mod[i0:i1], dtype=float)
+    if normalize and len(w_mod) > 0:
+        I_mod = normalize_constant(I_mod)
+    return w_mod, I_mod
+
+
+def _read_window(model, w0, w1, air=True):
+    """Read the model between w0 and w1 (air wavelengths if air is True)
+    from the memory-mapped files.
+    """
+    with fits.open(model, memmap=True) as hdul:
+        hdr = hdul[0].header
+        data = hdul[0].data
+        if 'WAVE' in hdr.keys():  # Dealing with PHOENIX model
+            wave = air_wavelength(pathwave) if air else vacuum_wavelength(pathwave)
+            i0 = max(np.searchsorted(wave, w0) - 1, 0)
+            i1 = np.searchsorted(wave, w1) + 1
+            w_mod = np.array(wave[i0:i1], dtype=float)
+        else:
+            crval, cdelt, n = hdr['CRVAL1'], hdr['CDELT1'], hdr['NAXIS1']
+            v0, v1 = (_air2vac(w0), _air2vac(w1)) if air else (w0, w1)
+            i0 = min(max(int(np.floor((v0 - crval) / cdelt)) - 1, 0), n)
+            i1 = min(max(int(np.ceil((v1 - crval) / cdelt)) + 2, 0), n)
+            w_mod = crval + cdelt * np.arange(i0, i1)
+            if air:
+                w_mod = vac2air(w_mod)  # Correction for vacuum to air (ground based)
+        I_mod = np.array(data[i0:i1], dtype=float)
+    return w_mod, I_mod
+
+
+def _cache_key(model, w0, w1, **options):
+    """Key for the cache from the file, the window, and the options"""
+    model = os.path.abspath(model)
+    st = os.stat(model)
+    key = [model, st.st_mtime, st.st_size, round(w0, 3), round(w1, 3)]
+    key += ['{}={}'.format(k, options[k]) for k in sorted(options)]
+    return hashlib.sha1(repr(key).encode('utf8')).hexdigest()
+
+
+def _prune_cache(size=CACHE_SIZE):
+    """Remove the least recently used files until the cache is below size"""
+    prune_cache(pathcache, size)
+
+
+def clear_cache():
+    """Remove all cached model windows"""
+    if os.path.isdir(pathcache):
+        _prune_cache(size=0)
+
+
+def read_model(model, w0, w1, air=True, normalize=True, resolution=False, cache=True):
+    """Read a model spectrum between w0 and w1
+
+    Only the window is read from the (memory-mapped) files. The result is
+    cached on disk, so reading the same window again is just loading a
+    small .npy file.
+
+    :model: Model spectrum (PHOENIX or a 1D fits file)
+    :w0: Lower wavelength limit
+    :w1: Upper wavelength limit
+    :air: Convert the wavelength from vacuum to air
+    :normalize: Normalize the flux in the window
+    :resolution: Instrumental resolution to broaden the model with
+    :cache: Use the on-disk cache
+    :returns: The wavelength and flux of the model between w0 and w1
+    """
+    if cache:
+        fname = os.path.join(pathcache, '{}.npy'.format(
+            _cache_key(model, w0, w1, air=air, normalize=normalize, resolution=resolution)))
+        if os.path.isfile(fname):
+            os.utime(fname, None)  # Mark as recently used
+            w_mod, I_mod = np.load(fname)
+            return w_mod, I_mod
+
+    w_mod, I_mod = _read_window(model, w0, w1, air=air)
+    w_mod, I_mod = cut_model(w_mod, I_mod, w0, w1, normalize=False)
+    if len(w_mod) > 0:
+        if resolution:
+            from PyAstronomy import pyasl
+            I_mod = pyasl.instrBroadGaussFast(w_mod, I_mod, resolution, edgeHandling="firstlast", fullout=False, maxsig=None)
+        if normalize:
+            I_mod = normalize_constant(I_mod)
+
+    if cache:
+        save_npy(fname, np.vstack((w_mod, I_mod)))
+        _prune_cache()
+    return w_mod, I_mod
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Continuum normalization of spectra.
+
+constant: The spectrum is divided by its median and then by the median of
+          the highest points below a limit (a constant continuum). This uses
+          np.partition instead of sorting the spectrum.
+percentile: The continuum is a percentile of the flux in blocks of pixels,
+            linearly interpolated between the blocks.
+spline: As percentile, but with a cubic spline through the blocks.
+
+The block percentiles are computed in chunks, so very long spectra do not
+need large temporary arrays.
+"""
+
+# My imports
+from __future__ import division, print_function
+import numpy as np
+
+_CHUNK = 2**20  # Maximum number of pixels in the percentile calculation at once
+
+
+def continuum_constant(I, npoints=50, limit=1.2):
+    """The median of the npoints highest points below limit
+
+    :I: Flux (roughly normalized, e.g. divided by the median)
+    :npoints: Number of points used for the continuum
+    :limit: Only points below this limit are used (to avoid cosmics)
+    :returns: The continuum level (1 if no points are below limit)
+    """
+    I = np.asarray(I)
+    I = I[I < limit]
+    if not len(I):
+        return 1.0
+    if len(I) > npoints:
+        I = np.partition(I, len(I) - npoints)[-npoints:]
+    return np.median(I)
+
+
+def normalize_constant(I, npoints=50, limit=1.2, clip=False):
+    """Normalize with a constant continuum
+
+    :I: Flux
+    :npoints: Number of points used for the continuum
+    :limit: Only points below this limit (after dividing by the median) are used
+    :clip: Set negative values to 0
+    :returns: The normalized flux (a new array)
+    """
+    I = np.array(I, dtype=float)
+    median = np.median(I)
+    if median != 0:
+        I /= median
+    else:
+        I /= I.max()
+    I /= continuum_constant(I, npoints=npoints, limit=limit)
+    if clip:
+        I[I < 0] = 0
+    return I
+
+
+def _block_percentile(I, block, percentile):
+    """Percentile of the flux in blocks of block pixels. The last block is
+    the remaining pixels."""
+    nblocks = len(I) // block
+    rows = max(1, _CHUNK // block)
+    levels = []
+    for i in range(0, nblocks, rows):
+        chunk = I[i*block:min(i+rows, nblocks)*block].reshape(-1, block)
+        levels.append(np.nanpercentile(chunk, percentile, axis=1))
+    if len(I) % block or not nblocks:
+        levels.append([np.nanpercentile(I[nblocks*block:], percentile)])
+    return np.concatenate(levels)
+
+
+def continuum_percentile(w, I, block=200, percentile=90, method='percentile'):
+    """Continuum from a percentile of the flux in blocks of pixels
+
+    :w: Wavelength (sorted)
+    :I: Flux
+    :block: Number of pixels in each block
+    :percentile: Percentile of the flux in each block used as continuum
+    :method: Interpolate between the blocks with percentile (linear) or spline
+    :returns: The continuum at w
+    """
+    w = np.asarray(w, dtype=float)
+    I = np.asarray(I, dtype=float)
+    if not len(I):
+        return np.ones(0)
+    block = int(min(max(block, 1), len(I)))
+    levels = _block_percentile(I, block, percentile)
+    # Center of each block
+    edges = np.append(np.arange(0, len(I), block), len(I))
+    centers = 0.5 * (w[edges[:-1]] + w[edges[1:] - 1])
+    if method == 'spline' and len(centers) > 3:
+        from scipy.interpolate import make_interp_spline
+        spline = make_interp_spline(centers, levels, k=3)
+        continuum = spline(np.clip(w, centers[0], centers[-1]))
+    else:
+        continuum = np.interp(w, centers, levels)
+    return continuum
+
+
+def normalize(w, I, method='constant', **options):
+    """Normalize a spectrum
+
+    :w: Wavelength
+    :I: Flux
+    :method: constant, percentile, or spline (see the module doc)
+    :options: Options for normalize_constant or continuum_percentile
+    :returns: The normalized flux (a new array)
+    """
+    if method == 'constant':
+        return normalize_constant(I, **options)
+    elif method in ('percentile', 'spline'):
+        clip = options.pop('clip', False)
+        I = np.asarray(I, dtype=float) / continuum_percentile(w, I, method=method, **options)
+        if clip:
+            I[I < 0] = 0
+        return I
+    raise ValueError('method must be constant, percentile, or spline, not: {}'.format(method))
@@ -9,6 +9,26 @@ element, log gf, and EW to a MOOG file for abfind.
 from __future__ import division, print_function
 import numpy as np
 import argparse
+from itertools import islice
+from .linelist import DTYPE, iter_moog, format_moog
+
+ELEMENTS = ('H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Na', 'Mg', 'Al', 'Si',
+            'P', 'S', 'Cl', 'Ar', 'K', 'Ca', 'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni',
+            'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr', 'Y', 'Zr', 'Nb', 'Mo',
+            'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'I', 'Xe', 'Cs', 'Ba',
+            'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb',
+            'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi', 'Po',
+            'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'U')
+
+# The format and minimum width of the columns in numpy2moog_synth
+SYNTH_FMT = ('%.3f', '%.1f', '%.2f', '%.3f', '%.2f')
+SYNTH_WIDTH = (8, 6, 8, 13, 11)
+
+# Molecules: (MOOG species, dissociation energy D0)
+mol1 = ['CH', 'OH', 'C2', 'CN', 'CO']
+mol2 = ['106', '108', '606', '607', '608']
+mol3 = [3.47, 4.395, 6.25, 7.5, 11.09]
+mol = dict(zip(mol1, [m for m in zip(mol2, mol3)]))
 
 
 def numpy2moog_ew(arr, output=None, header=None):
@@ -41,82 +61,134 @@ def numpy2moog_ew(arr, output=None, header=None):
     print('Output file: {}'.format(output))
 
 
-def numpy2moog_synth(arr, output=None, header=None):
-    """Script to convert a numpy array to the MOOG format for abfind.
-    Most of this script is from:
-    http://stackoverflow.com/questions/28885617/read-and-save-data-file-with-variable-number-of-columns-in-python
+def _synth_widths(fname, names, chunksize):
+    """The width of each column: the widest of the name, the minimum width,
+    and the formatted values. The formatted values are widest at the
+    minimum or maximum of a column."""
+    low = np.full(len(SYNTH_FMT), np.inf)
+    high = np.full(len(SYNTH_FMT), -np.inf)
+    missing = False
+    for chunk in iter_moog(fname, chunksize):
+        if not len(chunk):
+            continue
+        columns = np.column_stack([chunk[name] for name in DTYPE.names])
+        low = np.fmin(low, np.fmin.reduce(columns, axis=0))
+        high = np.fmax(high, np.fmax.reduce(columns, axis=0))
+        missing |= np.isnan(columns[:, -1]).any()
+
+    widths = []
+    for i, (fmt, width) in enumerate(zip(SYNTH_FMT, SYNTH_WIDTH)):
+        width = max(width, len(names[i]) if i < len(names) else 0)
+        for value in (low[i], high[i]):
+            if np.isfinite(value):
+                width = max(width, len(fmt % value))
+        widths.append(width)
+    if missing:  # D0 is left blank with 16 spaces
+        widths[-1] = max(widths[-1], 16)
+    return widths
+
+
+def numpy2moog_synth(arr, output=None, header=None, chunksize=100000):
+    """Script to convert a numpy array to the MOOG format for synthesis.
+
+    The columns (wavelength, element, excit, log gf, and D0) are right
+    justified to the widest value (or name) in the column and separated by
+    a space. D0 is left blank if it is missing. The input is read in chunks
+    twice: first for the widths of the columns, and then to write the lines.
+
+    :arr: The name of the input file (with the names of the columns in the first line)
+    :output: output filename
+    :header: The first line of the output (default: the names of the columns)
+    :chunksize: Number of lines converted at once
     """
-    import pandas as pd
-    if not header:  # Default header
-        header = 'Wavelength\t   Ele\t  excit\t  log gf\t   D0'
-
-    df = pd.read_csv(arr, sep='\s+')
+    with open(arr) as f:
+        names = f.readline().split()[:len(SYNTH_FMT)]
+    widths = _synth_widths(arr, names, chunksize)
+    fmt = tuple(('' if i == 0 else ' ') + f.replace('%', '%{}'.format(w))
+                for i, (f, w) in enumerate(zip(SYNTH_FMT, widths)))
 
-    formatters = ['{: >8.3f}'.format, '{: >6.1f}'.format,
-                  '{: >8.2f}'.format, '{: >13.3f}'.format,
-                  lambda x: ' '*16 if np.isnan(x) else '{: >11.2f}'.format(x)]
-    lines = df.to_string(index=False, header=header, formatters=formatters)
+    if header is None:
+        header = ' '.join(name.rjust(w) for name, w in zip(names, widths))
 
     # Write output and remove trailing whitespaces
     with open(output, 'w') as f:
-        for line in lines.split('\n'):
-            f.write(line.rstrip() + '\n')
+        f.write(header.rstrip() + '\n')
+        for chunk in iter_moog(arr, chunksize):
+            for line in format_moog(chunk, fmt=fmt):
+                f.write(line.rstrip() + '\n')
 
 
-def vald2numpy(fname, output=None):
+def _species(elements):
+    """The MOOG species (e.g. 26.1) and D0 (for molecules, else '') of
+    VALD element names (e.g. 'Fe 2'). Each unique name is looked up once
+    and the result is mapped back to all the lines.
+    """
+    elements = np.char.strip(elements, " '")
+    ions = np.char.strip(np.char.rpartition(elements, ' ')[:, 2])
+    names, inverse = np.unique(np.char.strip(np.char.rpartition(elements, ' ')[:, 0]),
+                               return_inverse=True)
+    atomic = []
+    for name in names:
+        if name in mol:
+            atomic.append(mol[name][0])
+        elif name in ELEMENTS:
+            atomic.append(str(ELEMENTS.index(name) + 1))
+        else:
+            raise AttributeError('The following element does not exist in the dictionary yet: {}'.format(name))
+    atomic = np.array(atomic)[inverse]
+    d0 = np.array([str(mol[name][1]) if name in mol else '' for name in names])[inverse]
+    ions = (ions.astype(int) - 1).astype(str)
+    return np.char.add(np.char.add(atomic, '.'), ions), d0
+
+
+def _narrow(strings):
+    """The strings with the dtype of the longest one (e.g. <U4, not <U21)"""
+    return strings.astype('U{}'.format(max(1, np.char.str_len(strings).max())))
+
+
+def _vald_lines(lines):
+    """Convert the lines (with data) of a VALD file to the lines of the output"""
+    w, excit, loggf = np.loadtxt(lines, delimiter=',', usecols=(1, 2, 3), ndmin=2, unpack=True)
+    species, d0 = _species(np.array([line[:line.index(',')] for line in lines]))
+    d0 = np.where(d0 == '', d0, np.char.add('\t', d0))
+    # The columns are formatted for the whole chunk: the wavelength with 3
+    # decimals (from integers), and excit and loggf as repr. The strings of
+    # integers are made narrow, else every np.char.add copies 21 characters
+    w = np.round(w * 1000).astype(np.int64)
+    w = np.char.add(np.char.add(_narrow((w // 1000).astype(str)), '.'),
+                    np.char.zfill(_narrow((w % 1000).astype(str)), 3))
+    columns = [np.char.ljust(w, 9, '0'), _narrow(species), excit.astype(str),
+               np.char.ljust(loggf.astype(str), 6, '0')]
+    lines = columns[0]
+    for column in columns[1:]:
+        lines = np.char.add(np.char.add(lines, '\t'), column)
+    return np.char.add(lines, d0)
+
+
+def vald2numpy(fname, output=None, chunksize=100000):
     """Converts the VALD output to a numpy array with only the name,
     wavelength, excitation potential, and log gf
-    """
 
-    try:
-        from periodic.table import element
-    except ImportError:
-        raise ImportError('Could not import periodic\nInstall with: pip install periodic')
+    The VALD file is read and converted in chunks of lines, and lines
+    starting with # or * (and other lines without data) are skipped.
 
+    :fname: The VALD file (e.g. from VALDprepare)
+    :output: The output file (.moog is replaced with .npy)
+    :chunksize: Number of lines converted at once
+    """
+    if output is None:
+        output = '{}.npy'.format(fname.rpartition('.')[0] or fname)
     output = output.replace('.moog', '.npy')
 
-    with open(fname, 'r') as lines:
-        newFile = ''
-        for line in lines:
-            if line.startswith('#') or line.startswith('*'):
-                pass
-            else:
-                newFile += line
-    with open(fname, 'w') as f:
-        f.write(newFile)
-
-    f = np.loadtxt(fname,
-                   dtype={'names': ('elements', 'w', 'excit', 'loggf'),
-                          'formats': ('S4', 'f4', 'f4', 'f4')},
-                   comments='#', delimiter=',', usecols=(0, 1, 2, 3))
-
-    mol1 = ['CH', 'OH', 'C2', 'CN', 'CO']
-    mol2 = ['106', '108', '606', '607', '608']
-    mol3 = [3.47, 4.395, 6.25, 7.5, 11.09]
-    mol = dict(zip(mol1, [m for m in zip(mol2, mol3)]))
-
-    numpy_out = 'Wavelength\tEle\tExcit\tloggf\t\tD0\n'
-    for e, w, ex, l in zip(f['elements'], f['w'], f['excit'], f['loggf']):
-        w = str(round(w, 3)).ljust(9, '0')
-        iso = e[-1]
-        e = e[:-1].strip(' ')
-        if e in mol.keys():
-            ele_moog = '{}.{}'.format(mol[e][0], str(int(iso) - 1))
-            l = str(l).ljust(6, '0')
-            z = '\t'.join([w, ele_moog, str(ex), l, str(mol[e][1])]) + '\n'
-        else:
-            try:
-                t = element(e)
-                ele_moog = str(t.atomic) + '.' + str(int(iso) - 1)
-                l = str(l).ljust(6, '0')
-                z = '\t'.join([w, ele_moog, str(ex), l]) + '\n'
-            except AttributeError:
-                raise AttributeError('The following element does not exist in the dictionary yet: {}'.format(e))
-
-        numpy_out += z
-
-    with open(output, 'w') as f:
-        f.write(numpy_out)
+    with open(fname, 'r') as lines, open(output, 'w') as f:
+        f.write('Wavelength\tEle\tExcit\tloggf\t\tD0\n')
+        while True:
+            chunk = list(islice(lines, chunksize))
+            if not chunk:
+                break
+            chunk = [line for line in chunk if not line.startswith(('#', '*')) and line.count(',') >= 3]
+            if chunk:
+                f.write('\n'.join(_vald_lines(chunk).tolist()) + '\n')
     print('Output file: {}'.format(output))
 
 
@@ -151,8 +223,9 @@ def _parser():
 
 def runner():
     args = _parser()
-    if args.output is None:
-        output = '{}.moog'.format(filter(None, args.output.rpartition('.')[0]))
+    output = args.output
+    if output is None:
+        output = '{}.moog'.format(args.input.rpartition('.')[0] or args.input)
     # Always add a .moog to the output if none extension is provided.
     if args.mode == 'ew':
         numpy2moog_ew(args.input, output, args.header)
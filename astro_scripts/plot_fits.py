@@ -9,15 +9,21 @@ import matplotlib.pyplot as plt
 import matplotlib
 from . import matplotlibcfg
 from astropy.io import fits
-from PyAstronomy import pyasl
 import argparse
-try:
-    import lineid_plot
-    lineidImport = True
-except ImportError:
-    lineidImport = False
-    print('Install lineid_plot (pip install lineid_plot) for more functionality.')
-from .utils import ccf_astro, vac2air, dopplerShift, get_wavelength
+from .utils import ccf_astro, dopplerShift, get_wavelength
+from .models import read_model
+from .io import read_spectrum
+from .normalize import normalize_constant
+from .linelist import read_linelist, window
+
+
+def _import_lineid_plot():
+    """Import lineid_plot (only needed when plotting lines)"""
+    try:
+        import lineid_plot
+        return lineid_plot
+    except ImportError:
+        print('Install lineid_plot (pip install lineid_plot) for more functionality.')
 
 
 def _download_spec(fout):
@@ -37,20 +43,109 @@ class Cursor:
 
     The code is from here:
     http://matplotlib.org/examples/pylab_examples/cursor_demo.html
+
+    The crosshair is drawn with blitting: the rest of the axes is saved
+    after each draw and only the crosshair is drawn on top of it.
     """
 
     def __init__(self, ax):
         self._ax = ax
-        self.lx = ax.axhline(color='C0', lw=2, alpha=0.7)
-        self.ly = ax.axvline(color='C0', lw=2, alpha=0.7)
+        # Animated artists are only drawn by blitting
+        animated = bool(getattr(ax.figure.canvas, 'supports_blit', False))
+        self.lx = ax.axhline(color='C0', lw=2, alpha=0.7, animated=animated)
+        self.ly = ax.axvline(color='C0', lw=2, alpha=0.7, animated=animated)
+        self._background = None
+        ax.figure.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        """Save the axes without the crosshair"""
+        canvas = self._ax.figure.canvas
+        if getattr(canvas, 'supports_blit', False):
+            self._background = canvas.copy_from_bbox(self._ax.bbox)
+        self._blit()
+
+    def _blit(self):
+        canvas = self._ax.figure.canvas
+        if self._background is None:
+            return
+        canvas.restore_region(self._background)
+        self._ax.draw_artist(self.lx)
+        self._ax.draw_artist(self.ly)
+        canvas.blit(self._ax.bbox)
 
     def mouse_move(self, event):
         if not event.inaxes:
             return
         x, y = event.xdata, event.ydata
-        self.lx.set_ydata(y)
-        self.ly.set_xdata(x)
-        plt.draw()
+        self.lx.set_ydata([y, y])
+        self.ly.set_xdata([x, x])
+        if self._background is None:  # The backend can not blit
+            self._ax.figure.canvas.draw_idle()
+        else:
+            self._blit()
+
+
+def _pyramid(x, y, npoints):
+    """Min/max decimation of a spectrum. Level k has the minimum and maximum
+    of blocks of 2**k pixels (x is the first pixel of the block). Levels are
+    added until one has fewer than npoints blocks."""
+    levels = [(x, y, y)]
+    while len(levels[-1][0]) > npoints:
+        x, ymin, ymax = levels[-1]
+        if len(x) % 2:
+            x, ymin, ymax = np.append(x, x[-1]), np.append(ymin, ymin[-1]), np.append(ymax, ymax[-1])
+        levels.append((x[::2],
+                       np.fmin(ymin[::2], ymin[1::2]),
+                       np.fmax(ymax[::2], ymax[1::2])))
+    return levels
+
+
+class DecimatedLine:
+    """Plot a (large) spectrum at screen resolution
+
+    A min/max decimation pyramid is made once. When the x limits change
+    (zoom or pan), only the visible part is drawn from the coarsest level
+    with at least npoints blocks in view. The minimum and maximum of each
+    block are both drawn, so narrow lines are not lost.
+    """
+
+    def __init__(self, ax, x, y, *args, **kwargs):
+        self.npoints = kwargs.pop('npoints', None) or max(1000, 2 * int(ax.bbox.width))
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if np.any(np.diff(x) < 0):
+            i = np.argsort(x, kind='stable')
+            x, y = x[i], y[i]
+        self._ax = ax
+        self._levels = _pyramid(x, y, self.npoints)
+        self.line, = ax.plot(*self._data(0, len(x)), *args, **kwargs)
+        ax.callbacks.connect('xlim_changed', self.update)
+        # The callbacks only keep a weak reference, so the axes keeps the line
+        ax._decimated_lines = getattr(ax, '_decimated_lines', []) + [self]
+
+    def _data(self, i0, i1):
+        """The data to draw for the pixels i0 to i1"""
+        n = max(i1 - i0, 1)
+        k = min(max(int(np.log2(n / self.npoints)), 0), len(self._levels) - 1)
+        x, ymin, ymax = self._levels[k]
+        j0 = max((i0 >> k) - 1, 0)
+        j1 = min((i1 >> k) + 2, len(x))
+        if k == 0:
+            return x[j0:j1], ymin[j0:j1]
+        # Min and max of each block
+        xs = np.repeat(x[j0:j1], 2)
+        ys = np.column_stack((ymin[j0:j1], ymax[j0:j1])).ravel()
+        if j1 == len(x):  # End at the last pixel
+            xs = np.append(xs, self._levels[0][0][-1])
+            ys = np.append(ys, self._levels[0][1][-1])
+        return xs, ys
+
+    def update(self, ax=None):
+        """Draw the visible part of the spectrum"""
+        x0, x1 = sorted(self._ax.get_xlim())
+        x = self._levels[0][0]
+        i0, i1 = np.searchsorted(x, [x0, x1])
+        self.line.set_data(*self._data(i0, i1))
 
 
 def _parser():
@@ -158,34 +253,13 @@ def main(fname, lines=False, linelist=False,
     fitsext = int(fitsext)
     order = int(order)
 
-    if ftype == '1D':
-        I = fits.getdata(fname)
-        hdr = fits.getheader(fname)
-        w = get_wavelength(hdr, convert=convert)
-    elif ftype == 'CRIRES':
-        d = fits.getdata(fname, fitsext)
-        hdr = fits.getheader(fname, fitsext)
-        I = d['Extracted_OPT']
-        w = d['Wavelength']*10
-    elif ftype == 'GIANO':
-        d = fits.getdata(fname)
-        I = d[order - 32]  # 32 is the first order
-        wd = np.loadtxt(pathGIANO)
-        w0, w1 = wd[wd[:, 0] == order][0][1:]
-        w = np.linspace(w0, w1, len(I), endpoint=True)
-    elif ftype == 'UVES':
-        raise NotImplementedError('Please be patient. Not quite there yet')
-        # d = fits.getdata(fname)
-        # I = d['']
-
-    if np.median(I) != 0:
-        I /= np.median(I)
-    else:
-        I /= I.max()
+    order = {'CRIRES': fitsext, 'GIANO': order}.get(ftype)
+    spectrum = read_spectrum(fname, ftype, order=order, convert=convert, wavefile=pathGIANO)
+    I = spectrum.flux
+    w = spectrum.wavelength
+
     # Normalization (use first 50 points below 1.2 as constant continuum)
-    maxes = I[(I < 1.2)].argsort()[-50:][::-1]
-    I /= np.median(I[maxes])
-    I[I<0] = 0
+    I = normalize_constant(I, clip=True)
     dw = 10  # Some extra coverage for RV shifts
 
     if rv:
@@ -213,25 +287,11 @@ def main(fname, lines=False, linelist=False,
         sun = False
 
     if model:
-        I_mod = fits.getdata(model)
-        hdr = fits.getheader(model)
-        if 'WAVE' in hdr.keys():
-            w_mod = fits.getdata(pathwave)
-        else:
-            w_mod = get_wavelength(hdr)
-        w_mod = vac2air(w_mod)  # Correction for vacuum to air (ground based)
-        i = (w_mod > w0) & (w_mod < w1)
-        w_mod = w_mod[i]
-        I_mod = I_mod[i]
+        # Windowed, air converted, broadened and normalized (cached on disk)
+        w_mod, I_mod = read_model(model, w0, w1, resolution=resolution)
         if len(w_mod) > 0:
-            if resolution:
-                I_mod = pyasl.instrBroadGaussFast(w_mod, I_mod, resolution, edgeHandling="firstlast", fullout=False, maxsig=None)
             # https://phoenix.ens-lyon.fr/Grids/FORMAT
             # I_mod = 10 ** (I_mod-8.0)
-            I_mod /= np.median(I_mod)
-            # Normalization (use first 50 points below 1.2 as continuum)
-            maxes = I_mod[(I_mod < 1.2)].argsort()[-50:][::-1]
-            I_mod /= np.median(I_mod[maxes])
             if ccf in ['model', 'both'] and rv1:
                 print('Warning: RV set for model. Calculate RV with CCF')
             if rv1 and ccf not in ['model', 'both']:
@@ -320,13 +380,14 @@ def main(fname, lines=False, linelist=False,
     x_formatter = matplotlib.ticker.ScalarFormatter(useOffset=False)
     ax1.xaxis.set_major_formatter(x_formatter)
 
+    # Only the visible part of the spectra are drawn (at screen resolution)
     if sun and not model:
-        ax1.plot(w_sun, I_sun, '-C2', lw=1, alpha=0.6, label='Sun')
+        DecimatedLine(ax1, w_sun, I_sun, '-C2', lw=1, alpha=0.6, label='Sun')
     if telluric:
-        ax1.plot(w_tel, I_tel, '-C3', lw=1, alpha=0.6, label='Telluric')
+        DecimatedLine(ax1, w_tel, I_tel, '-C3', lw=1, alpha=0.6, label='Telluric')
     if model:
-        ax1.plot(w_mod, I_mod, '-C2', lw=1, alpha=0.6, label='Model')
-    ax1.plot(w, I, '-k', lw=1, label='Star')
+        DecimatedLine(ax1, w_mod, I_mod, '-C2', lw=1, alpha=0.6, label='Model')
+    DecimatedLine(ax1, w, I, '-k', lw=1, label='Star')
 
     # Add crosshair
     xlim = ax1.get_xlim()
@@ -334,12 +395,11 @@ def main(fname, lines=False, linelist=False,
     plt.connect('motion_notify_event', cursor.mouse_move)
     ax1.set_xlim(xlim)
 
-    if (linelist or lines) and lineidImport and not nolines:
+    lineid_plot = _import_lineid_plot() if (linelist or lines) and not nolines else None
+    if lineid_plot is not None:
         try:
-            lines, elements = np.loadtxt(linelist, usecols=(0, 1), skiprows=1, unpack=True)
-            idx = (lines <= max(w)) & (lines >= min(w))
-            lines = lines[idx]
-            elements = elements[idx]
+            data = window(read_linelist(linelist), min(w), max(w))
+            lines, elements = np.array(data['wavelength']), np.array(data['element'])
             Fe1Lines, Fe2Lines, otherLines = [], [], []
             for line, element in zip(lines, elements):
                 if np.allclose(element, 26.0):
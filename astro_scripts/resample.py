@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Resample spectra to a new wavelength grid.
+
+linear: Linear interpolation between the two nearest pixels.
+cubic: Cubic (Lagrange) interpolation through the four nearest pixels.
+flux: Flux conserving. Each new pixel is the mean of the old pixels,
+      weighted by how much of the new pixel they cover. The pixel edges
+      are halfway between the pixel centres.
+
+All the methods are linear in the flux, so the resampling is a sparse
+matrix from the old to the new grid. The matrix is made once per pair of
+grids (and method) and kept in memory, so resampling many spectra with the
+same grids is a single sparse matrix product for each spectrum. Outside the
+old grid the flux of the nearest pixel is used (as np.interp).
+"""
+
+# My imports
+from __future__ import division, print_function
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+METHODS = ('linear', 'cubic', 'flux')
+CACHE_SIZE = 16  # Number of matrices kept in memory
+
+_matrices = OrderedDict()
+
+
+def _linear(w, wnew):
+    """Rows, columns, and weights of linear interpolation"""
+    i = np.clip(np.searchsorted(w, wnew) - 1, 0, len(w) - 2)
+    t = np.clip((wnew - w[i]) / (w[i+1] - w[i]), 0, 1)
+    rows = np.repeat(np.arange(len(wnew)), 2)
+    cols = np.column_stack((i, i + 1)).ravel()
+    weights = np.column_stack((1 - t, t)).ravel()
+    return rows, cols, weights
+
+
+def _cubic(w, wnew):
+    """Rows, columns, and weights of cubic Lagrange interpolation through
+    the pixels i-1, i, i+1, and i+2, where w[i] <= wnew < w[i+1]"""
+    x = np.clip(wnew, w[0], w[-1])
+    i = np.clip(np.searchsorted(w, x) - 2, 0, len(w) - 4)  # First pixel of the stencil
+    stencil = i[:, np.newaxis] + np.arange(4)
+    ws = w[stencil]
+    weights = np.ones(stencil.shape)
+    for j in range(4):
+        for k in range(4):
+            if j != k:
+                weights[:, j] *= (x - ws[:, k]) / (ws[:, j] - ws[:, k])
+    rows = np.repeat(np.arange(len(wnew)), 4)
+    return rows, stencil.ravel(), weights.ravel()
+
+
+def _edges(w):
+    """Pixel edges halfway between the pixel centres"""
+    middle = 0.5 * (w[1:] + w[:-1])
+    return np.concatenate(([w[0] - (middle[0] - w[0])], middle, [w[-1] + (w[-1] - middle[-1])]))
+
+
+def _flux(w, wnew):
+    """Rows, columns, and weights of flux conserving rebinning"""
+    edges = _edges(w)
+    new = _edges(wnew)
+    lo, hi = new[:-1], new[1:]
+    # The old pixels first and last overlapping each new pixel
+    first = np.clip(np.searchsorted(edges, lo, side='right') - 1, 0, len(w) - 1)
+    last = np.clip(np.searchsorted(edges, hi, side='left') - 1, 0, len(w) - 1)
+    counts = last - first + 1
+    rows = np.repeat(np.arange(len(wnew)), counts)
+    cols = first[rows] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    overlap = np.minimum(edges[cols+1], hi[rows]) - np.maximum(edges[cols], lo[rows])
+    overlap = np.clip(overlap, 0, None)
+    covered = np.bincount(rows, weights=overlap, minlength=len(wnew))
+    # New pixels outside the old grid: the nearest old pixel
+    outside = covered[rows] == 0
+    overlap[outside] = 1.0
+    covered[covered == 0] = np.bincount(rows[outside], minlength=len(wnew))[covered == 0]
+    return rows, cols, overlap / covered[rows]
+
+
+def _key(w, wnew, method):
+    h = hashlib.sha1(method.encode('utf8'))
+    h.update(np.ascontiguousarray(w, dtype=float).tobytes())
+    h.update(b'|')
+    h.update(np.ascontiguousarray(wnew, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def rebin_matrix(w, wnew, method='linear'):
+    """The sparse matrix resampling a spectrum from w to wnew
+
+    :w: The wavelength of the spectrum (sorted)
+    :wnew: The new wavelength (sorted)
+    :method: linear, cubic, or flux (see the module doc)
+    :returns: A scipy.sparse matrix with shape (len(wnew), len(w))
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of {}, not: {}'.format(METHODS, method))
+    key = _key(w, wnew, method)
+    if key in _matrices:
+        _matrices.move_to_end(key)
+        return _matrices[key]
+
+    from scipy.sparse import csr_matrix
+    w = np.asarray(w, dtype=float)
+    wnew = np.asarray(wnew, dtype=float)
+    if len(w) < {'linear': 2, 'cubic': 4, 'flux': 2}[method]:
+        raise ValueError('Too few pixels ({}) for {} resampling'.format(len(w), method))
+    rows, cols, weights = {'linear': _linear, 'cubic': _cubic, 'flux': _flux}[method](w, wnew)
+    matrix = csr_matrix((weights, (rows, cols)), shape=(len(wnew), len(w)))
+
+    _matrices[key] = matrix
+    while len(_matrices) > CACHE_SIZE:
+        _matrices.popitem(last=False)
+    return matrix
+
+
+def resample(w, flux, wnew, method='linear'):
+    """Resample one or more spectra to a new wavelength
+
+    :w: The wavelength of the spectra (sorted)
+    :flux: The flux, or an array (n_spectra, len(w)) of fluxes
+    :wnew: The new wavelength (sorted)
+    :method: linear, cubic, or flux (see the module doc)
+    :returns: The flux at wnew (n_spectra, len(wnew) for several spectra)
+    """
+    flux = np.asarray(flux, dtype=float)
+    matrix = rebin_matrix(w, wnew, method)
+    return (matrix @ flux.T).T
+
+
+def linear_grid(w0, dw, n):
+    """The wavelength of a 1D spectrum (CRVAL1, CDELT1, NAXIS1)"""
+    return w0 + dw * np.arange(n)
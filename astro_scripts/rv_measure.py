@@ -4,10 +4,20 @@
 # My imports
 from __future__ import division, print_function
 import os
+import glob
+import time
 import numpy as np
 from astropy.io import fits
 from argparse import ArgumentParser
-from .utils import ccf_astro, vac2air, dopplerShift, get_wavelength
+from .utils import ccf_astro, fit_ccf, vac2air, dopplerShift, get_wavelength
+from .models import read_model, cut_model, air_wavelength, pathwave
+from .io import read_spectrum, read_spectra
+from .normalize import normalize
+
+dw = 10  # Some extra coverage for RV shifts
+
+# The prepared model in each worker of the batch mode
+_template = {}
 
 
 def _parser():
@@ -24,82 +34,298 @@ def _parser():
                         ' moment)')
     parser.add_argument('--ftype', help='Select which type the fits file is',
                         choices=['1D', 'CRIRES', 'GIANO', 'UVES'], default='1D')
+    parser.add_argument('--order', help='CRIRES extension or GIANO order (default: the first)',
+                        default=None, type=int)
+    parser.add_argument('--norm', help='Normalization of the spectrum (default: constant)',
+                        choices=['constant', 'percentile', 'spline'], default='constant')
+    parser.add_argument('--method', help='Method for the CCF (default: direct)',
+                        choices=['direct', 'fft'], default='direct')
+    parser.add_argument('--orders', help='Measure the RV in these orders/extensions'
+                        ' in parallel and combine them (all if none are given)',
+                        default=None, type=int, nargs='*')
+    parser.add_argument('-w', '--workers', default=None, type=int,
+                        help='Number of worker processes for --orders (default: number of CPUs)')
     return parser.parse_args()
 
 
-def main(fname, model, ftype='1D'):
-    """Plot a fits file with extensive options
+def _parser_batch():
+    """Take care of all the CLI stuff for the batch mode.
+    """
+    parser = ArgumentParser(description='Measure the RV of many spectra with the same model')
+    parser.add_argument('model',
+                        help='The model spectrum used for all the spectra')
+    parser.add_argument('fnames', nargs='*', default=[],
+                        help='Input fits files or glob patterns (e.g. "night1/*.fits")')
+    parser.add_argument('-m', '--manifest', default=None,
+                        help='File with one fits file (or glob pattern) per line')
+    parser.add_argument('-o', '--output', default='rv_measure.csv',
+                        help='Output table, .csv or .parquet (default: rv_measure.csv)')
+    parser.add_argument('-w', '--workers', default=None, type=int,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--ftype', help='Select which type the fits files are',
+                        choices=['1D', 'CRIRES', 'GIANO', 'UVES'], default='1D')
+    parser.add_argument('--order', help='CRIRES extension or GIANO order (default: the first)',
+                        default=None, type=int)
+    parser.add_argument('--norm', help='Normalization of the spectrum (default: constant)',
+                        choices=['constant', 'percentile', 'spline'], default='constant')
+    parser.add_argument('--method', help='Method for the CCF (default: direct)',
+                        choices=['direct', 'fft'], default='direct')
+    parser.add_argument('--fit', help='Method for fitting the CCF peak (default: gauss)',
+                        choices=['gauss', 'parabola', 'astropy'], default='gauss')
+    return parser.parse_args()
+
+
+def _read_spectrum(fname, ftype='1D', order=None, norm='constant'):
+    """Read and normalize an observed spectrum
 
     :fname: Input spectra
-    :model: Model spectrum
     :ftype: Type of fits file (1D, CRIRES, GIANO)
+    :order: The CRIRES extension or GIANO order (default: the first)
+    :norm: Normalization (constant, percentile, spline)
+    :returns: The wavelength and normalized flux
     """
+    spectrum = read_spectrum(fname, ftype, order=order)
+    w = spectrum.wavelength
+    I = normalize(w, spectrum.flux, method=norm, clip=True)
+    return w, I
 
-    path = os.path.expanduser('~/.plotfits/')
-    pathwave = os.path.join(path, 'WAVE_PHOENIX-ACES-AGSS-COND-2011.fits')
-
-    if ftype == '1D':
-        I = fits.getdata(fname)
-        hdr = fits.getheader(fname)
-        w = get_wavelength(hdr)
-    elif ftype == 'CRIRES':
-        d = fits.getdata(fname, fitsext)
-        hdr = fits.getheader(fname, fitsext)
-        I = d['Extracted_OPT']
-        w = d['Wavelength']*10
-    elif ftype == 'GIANO':
-        d = fits.getdata(fname)
-        I = d[order - 32]  # 32 is the first order
-        wd = np.loadtxt(pathGIANO)
-        w0, w1 = wd[wd[:, 0] == order][0][1:]
-        w = np.linspace(w0, w1, len(I), endpoint=True)
-    elif ftype == 'UVES':
-        raise NotImplementedError('Please be patient. Not quite there yet')
-
-    if np.median(I) != 0:
-        I /= np.median(I)
-    else:
-        I /= I.max()
-    # Normalization (use first 50 points below 1.2 as constant continuum)
-    maxes = I[(I < 1.2)].argsort()[-50:][::-1]
-    I /= np.median(I[maxes])
-    I[I<0] = 0
-    dw = 10  # Some extra coverage for RV shifts
 
-    w0, w1 = w[0] - dw, w[-1] + dw
+def _read_model(model):
+    """Read the full model spectrum and convert it to air wavelengths
 
-    I_mod = fits.getdata(model)
+    :model: Model spectrum
+    :returns: The (sorted) wavelength and flux of the model
+    """
+    I_mod = fits.getdata(model).astype(float)
     hdr = fits.getheader(model)
     if 'WAVE' in hdr.keys():  # Dealing with PHOENIX model
-        w_mod = fits.getdata(pathwave)
+        w_mod = air_wavelength(pathwave)  # Cached vacuum to air conversion
     else:
         w_mod = get_wavelength(hdr)
-    w_mod = vac2air(w_mod)  # Correction for vacuum to air (ground based)
-    i = (w_mod > w0) & (w_mod < w1)
-    w_mod = w_mod[i]
-    I_mod = I_mod[i]
-    if len(w_mod) > 0:
-        I_mod /= np.median(I_mod)
-        # Normalization (use first 50 points below 1.2 as continuum)
-        maxes = I_mod[(I_mod < 1.2)].argsort()[-50:][::-1]
-        I_mod /= np.median(I_mod[maxes])
+        w_mod = vac2air(w_mod)  # Correction for vacuum to air (ground based)
+    return w_mod, I_mod
+
+
+def main(fname, model, ftype='1D', method='direct', order=None, norm='constant'):
+    """Plot a fits file with extensive options
+
+    :fname: Input spectra
+    :model: Model spectrum
+    :ftype: Type of fits file (1D, CRIRES, GIANO)
+    :method: Method for the CCF (direct, fft)
+    :order: The CRIRES extension or GIANO order (default: the first)
+    :norm: Normalization of the spectrum (constant, percentile, spline)
+    """
+    w, I = _read_spectrum(fname, ftype, order, norm)
+    w0, w1 = w[0] - dw, w[-1] + dw
+    w_mod, I_mod = read_model(model, w0, w1)
 
     rvs = {}
     print('Calculating the CCF for: %s' % fname)
-    rv1, r_mod, c_mod, x_mod, y_mod = ccf_astro((w, -I + 1), (w_mod, -I_mod + 1))
+    rv1, r_mod, c_mod, x_mod, y_mod = ccf_astro((w, -I + 1), (w_mod, -I_mod + 1), method=method)
     print('Shifting model spectrum...')
-    I_mod, w_mod = dopplerShift(w_mod, I_mod, v=rv1, fill_value=0.95)
+    I_mod, w_mod = dopplerShift(w_mod, I_mod, v=rv1)
     rvs['model'] = rv1
     print('RV for {0} is {1}km/s'.format(fname.replace('.fits', ''), round(rvs['model'], 2)))
     return rv1, r_mod, c_mod, x_mod, y_mod
 
 
+def _measure_order(w, I, w_mod, I_mod, norm='constant', method='direct', fit='gauss'):
+    """Measure the RV of a single order
+
+    :w: Wavelength of the order
+    :I: Flux of the order (not normalized)
+    :w_mod: Wavelength of the model in the window of the order
+    :I_mod: Flux of the model (normalized)
+    :returns: The RV, its uncertainty, and the width of the CCF
+    """
+    I = normalize(w, I, method=norm, clip=True)
+    _, drvs, cc, _, _ = ccf_astro((w, -I + 1), (w_mod, -I_mod + 1), method=method)
+    if not np.any(cc):
+        return np.nan, np.nan, np.nan
+    rv, width, rverr, _ = fit_ccf(drvs, cc, method=fit)
+    return float(np.squeeze(rv)), float(rverr), float(width)
+
+
+def _combine(rv, rverr):
+    """Weighted mean of the RVs from several orders
+
+    The uncertainties from the CCF fit are often too small, so the
+    uncertainty of the mean is at least the standard error of the orders
+    (their standard deviation over the square root of their number).
+
+    :rv: The RVs
+    :rverr: The uncertainties on the RVs (the weights are 1/rverr**2)
+    :returns: The weighted mean, its uncertainty, and the scatter (standard
+              deviation) of the orders
+    """
+    rv = np.asarray(rv, dtype=float)
+    rverr = np.asarray(rverr, dtype=float)
+    good = np.isfinite(rv) & np.isfinite(rverr) & (rverr > 0)
+    if not np.any(good):
+        return np.nan, np.nan, np.nan
+    rv, weights = rv[good], 1 / rverr[good]**2
+    mean = np.sum(weights * rv) / np.sum(weights)
+    error = 1 / np.sqrt(np.sum(weights))
+    if len(rv) > 1:
+        error = max(error, np.std(rv, ddof=1) / np.sqrt(len(rv)))
+    return mean, error, np.std(rv)
+
+
+def multi_order(fname, model, ftype='CRIRES', orders=None, norm='constant',
+                method='direct', fit='gauss', workers=None):
+    """Measure the RV in all orders/extensions of a spectrum
+
+    The file is opened once, and the CCF of each order is calculated in
+    parallel. The RVs are combined in a weighted mean.
+
+    :fname: Input spectra
+    :model: Model spectrum
+    :ftype: Type of fits file (1D, CRIRES, GIANO)
+    :orders: List of orders/extensions (default: all)
+    :norm: Normalization of the spectrum (constant, percentile, spline)
+    :method: Method for the CCF (direct, fft)
+    :fit: Method for fitting the CCF peak (gauss, parabola, astropy)
+    :workers: Number of worker processes (default: number of CPUs)
+    :returns: The weighted mean RV, its uncertainty, the scatter of the
+              orders, and a pandas DataFrame with the RV of each order
+    """
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+
+    spectra = read_spectra(fname, ftype, orders)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for spectrum in spectra:
+            w = np.asarray(spectrum.wavelength, dtype=float)
+            I = np.asarray(spectrum.flux, dtype=float)
+            w_mod, I_mod = read_model(model, w.min() - dw, w.max() + dw)
+            futures.append(executor.submit(_measure_order, w, I, w_mod, I_mod,
+                                           norm=norm, method=method, fit=fit))
+        results = [future.result() for future in futures]
+
+    df = pd.DataFrame(results, columns=['rv', 'rverr', 'width'])
+    df.insert(0, 'order', [spectrum.order for spectrum in spectra])
+    rv, rverr, scatter = _combine(df['rv'], df['rverr'])
+    print(df.to_string(index=False))
+    print('RV for {0} is {1} +/- {2} km/s (scatter: {3} km/s, {4} orders)'.format(
+        fname.replace('.fits', ''), round(rv, 2), round(rverr, 3), round(scatter, 3),
+        int(np.sum(np.isfinite(df['rv'])))))
+    return rv, rverr, scatter, df
+
+
+def _init_worker(w_mod, I_mod, ftype, order, norm, method, fit):
+    """Store the prepared model once in each worker process"""
+    _template.update(w_mod=w_mod, I_mod=I_mod, ftype=ftype, order=order,
+                     norm=norm, method=method, fit=fit)
+
+
+def _measure(fname):
+    """Measure the RV of a single spectrum against the prepared model
+
+    :fname: Input spectra
+    :returns: A dictionary with the RV, its uncertainty, the width of the
+              CCF and the time used
+    """
+    t0 = time.time()
+    rv, rverr, width, error = np.nan, np.nan, np.nan, ''
+    try:
+        w, I = _read_spectrum(fname, _template['ftype'], _template['order'],
+                              _template['norm'])
+        w_mod, I_mod = cut_model(_template['w_mod'], _template['I_mod'],
+                                 w[0] - dw, w[-1] + dw)
+        _, drvs, cc, _, _ = ccf_astro((w, -I + 1), (w_mod, -I_mod + 1),
+                                      method=_template['method'])
+        if np.any(cc):
+            rv, width, rverr, _ = fit_ccf(drvs, cc, method=_template['fit'])
+        else:
+            error = 'No overlap between spectrum and model'
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    return {'fname': fname, 'rv': float(np.squeeze(rv)), 'rverr': float(rverr),
+            'width': float(width), 'time': time.time() - t0, 'error': error}
+
+
+def _expand(fnames=None, manifest=None):
+    """Expand file names and glob patterns, optionally read from a manifest
+
+    :fnames: List of file names or glob patterns
+    :manifest: File with one file name or glob pattern per line
+    :returns: The sorted list of unique file names
+    """
+    patterns = list(fnames or [])
+    if manifest:
+        with open(manifest, 'r') as lines:
+            patterns += [line.strip() for line in lines
+                         if line.strip() and not line.startswith('#')]
+    files = set()
+    for pattern in patterns:
+        matches = glob.glob(os.path.expanduser(pattern))
+        files.update(matches if matches else [pattern])
+    return sorted(files)
+
+
+def batch(fnames, model, ftype='1D', order=None, norm='constant', method='direct',
+          fit='gauss', workers=None, output='rv_measure.csv'):
+    """Measure the RV of many spectra against the same model
+
+    The model is read and converted to air wavelengths once, and the spectra
+    are measured in parallel by a pool of worker processes.
+
+    :fnames: List of fits files
+    :model: Model spectrum
+    :ftype: Type of fits files (1D, CRIRES, GIANO)
+    :order: The CRIRES extension or GIANO order (default: the first)
+    :norm: Normalization of the spectra (constant, percentile, spline)
+    :method: Method for the CCF (direct, fft)
+    :fit: Method for fitting the CCF peak (gauss, parabola, astropy)
+    :workers: Number of worker processes (default: number of CPUs)
+    :output: Output table (.csv or .parquet). If None, nothing is written
+    :returns: A pandas DataFrame with one row per spectrum
+    """
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+
+    w_mod, I_mod = _read_model(model)
+    chunksize = max(1, len(fnames) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(w_mod, I_mod, ftype, order, norm, method, fit)) as executor:
+        rows = list(executor.map(_measure, fnames, chunksize=chunksize))
+
+    df = pd.DataFrame(rows, columns=['fname', 'rv', 'rverr', 'width', 'time', 'error'])
+    if output:
+        if output.lower().endswith('.parquet'):
+            df.to_parquet(output, index=False)
+        else:
+            df.to_csv(output, index=False)
+        print('Results saved in {}'.format(output))
+    return df
+
+
 def runner():
     args = vars(_parser())
     fname = args.pop('fname')
     model = args.pop('model')
     ftype = args.pop('ftype')
-    main(fname, model, ftype)
+    method = args.pop('method')
+    order = args.pop('order')
+    norm = args.pop('norm')
+    orders = args.pop('orders')
+    if orders is not None:
+        multi_order(fname, model, ftype, orders=orders or None, norm=norm,
+                    method=method, workers=args.pop('workers'))
+    else:
+        main(fname, model, ftype, method, order, norm)
+
+
+def batch_runner():
+    args = _parser_batch()
+    fnames = _expand(args.fnames, args.manifest)
+    if not len(fnames):
+        raise SystemExit('No spectra given')
+    print('Measuring the RV of {} spectra...'.format(len(fnames)))
+    batch(fnames, args.model, ftype=args.ftype, order=args.order, norm=args.norm,
+          method=args.method, fit=args.fit, workers=args.workers, output=args.output)
 
 
 if __name__ == '__main__':
@@ -1,33 +1,36 @@
 from __future__ import division, print_function
+import os
+from functools import partial
 import numpy as np
-import scipy.interpolate as sci
 
+_C = 299792.458  # Speed of light in km/s
+_CCF_CHUNK = 2**22  # Maximum number of points interpolated at once in the CCF
 
-def ccf_astro(spectrum1, spectrum2, rvmin=0, rvmax=150, drv=1):
+
+def ccf_astro(spectrum1, spectrum2, rvmin=0, rvmax=150, drv=1, method='direct',
+              fit='gauss'):
     """Make a CCF between 2 spectra and find the RV
 
     :spectrum1: The stellar spectrum
     :spectrum2: The model, sun or telluric
     :dv: The velocity step
+    :method: 'direct' shifts the template to every velocity, 'fft' resamples
+             both spectra to log(wavelength) once and correlates with FFTs
+    :fit: How to fit the CCF peak (gauss, parabola, astropy). See fit_ccf
     :returns: The RV shift
     """
+    if method not in ('direct', 'fft'):
+        raise ValueError('method must be "direct" or "fft", not: {}'.format(method))
     # Calculate the cross correlation
     w, f = spectrum1
     tw, tf = spectrum2
     if not len(w) or not len(tw):
         return 0, 0, 0, 0, 0
-    c = 299792.458
     drvs = np.arange(rvmin, rvmax, drv)
-    cc = np.zeros(len(drvs))
-    for i, rv in enumerate(drvs):
-        fi = sci.interp1d(tw * (1.0 + rv / c), tf)
-        # Shifted template evaluated at location of spectrum
-        try:
-            fiw = fi(w)
-            cc[i] = np.sum(f * fiw)
-        except ValueError:
-            fiw = 0
-            cc[i] = 0
+    if method == 'fft':
+        cc = _ccf_fft(w, f, tw, tf, drvs)
+    else:
+        cc = _ccf_direct(w, f, tw, tf, drvs)
 
     if not np.any(cc):
         return 0, 0, 0, 0, 0
@@ -35,31 +38,211 @@ def ccf_astro(spectrum1, spectrum2, rvmin=0, rvmax=150, drv=1):
     # Fit the CCF with a gaussian
     cc[cc == 0] = np.mean(cc)
     cc = (cc-min(cc))/(max(cc)-min(cc))
-    RV, g = _fit_ccf(drvs, cc)
+    RV, _, _, g = fit_ccf(drvs, cc, method=fit)
     return RV, drvs, cc, drvs, g(drvs)
 
 
-def _fit_ccf(rv, ccf):
-    """Fit the CCF with a 1D gaussian
+def _ccf_coverage(w, tw, factor):
+    """Velocities (as 1+rv/c) where the shifted template covers the spectrum"""
+    return (tw.min()*factor <= w.min()) & (tw.max()*factor >= w.max())
+
+
+def _ccf_direct(w, f, tw, tf, drvs, chunksize=_CCF_CHUNK):
+    """Cross correlate by shifting the template to all velocities at once
+
+    The template shifted by rv and evaluated at w is the same as the
+    unshifted template evaluated at w/(1+rv/c), so every velocity is just
+    another row of query points for np.interp. Rows are processed in chunks
+    of at most chunksize points to keep the memory bounded.
+
+    :w: Wavelength of the spectrum
+    :f: Flux of the spectrum
+    :tw: Wavelength of the template
+    :tf: Flux of the template
+    :drvs: The velocities in km/s
+    :chunksize: Maximum number of interpolated points held in memory
+    :returns: The CCF (0 where the shifted template does not cover w)
+    """
+    w = np.asarray(w, dtype=float)
+    f = np.asarray(f, dtype=float)
+    tw = np.asarray(tw, dtype=float)
+    tf = np.asarray(tf, dtype=float)
+    if np.any(np.diff(tw) < 0):
+        idx = np.argsort(tw)
+        tw, tf = tw[idx], tf[idx]
+
+    factor = 1.0 + np.asarray(drvs, dtype=float) / _C
+    cc = np.zeros(len(factor))
+    # Only velocities where the shifted template covers the whole spectrum
+    valid = np.where(_ccf_coverage(w, tw, factor))[0]
+    nrows = max(1, chunksize // len(w))
+    for i in range(0, len(valid), nrows):
+        rows = valid[i:i+nrows]
+        wi = w[np.newaxis, :] / factor[rows, np.newaxis]
+        fiw = np.interp(wi.ravel(), tw, tf).reshape(wi.shape)
+        cc[rows] = np.dot(fiw, f)
+    return cc
+
+
+def _ccf_fft(w, f, tw, tf, drvs):
+    """Cross correlate on a common log(wavelength) grid with FFTs
+
+    On a grid equidistant in log(wavelength) a Doppler shift is a constant
+    offset of ln(1+rv/c), so the CCF for all lags is a single FFT
+    correlation. The grid step is the median step of the spectrum, and the
+    CCF is interpolated to the velocities in drvs.
+
+    :w: Wavelength of the spectrum
+    :f: Flux of the spectrum
+    :tw: Wavelength of the template
+    :tf: Flux of the template
+    :drvs: The velocities in km/s
+    :returns: The CCF (0 where the shifted template does not cover w)
+    """
+    w = np.asarray(w, dtype=float)
+    f = np.asarray(f, dtype=float)
+    tw = np.asarray(tw, dtype=float)
+    tf = np.asarray(tf, dtype=float)
+    if np.any(np.diff(w) < 0):
+        idx = np.argsort(w)
+        w, f = w[idx], f[idx]
+    if np.any(np.diff(tw) < 0):
+        idx = np.argsort(tw)
+        tw, tf = tw[idx], tf[idx]
+
+    factor = 1.0 + np.asarray(drvs, dtype=float) / _C
+    cc = np.zeros(len(factor))
+    valid = _ccf_coverage(w, tw, factor)
+    if not np.any(valid):
+        return cc
+
+    lnw = np.log(w)
+    dx = np.median(np.diff(lnw))
+    lags = np.log(factor)
+    # The template is needed from lnw[0]-max(lag) to lnw[-1]-min(lag)
+    x0 = lnw[0] - max(lags.max(), 0) - dx
+    x1 = lnw[-1] - min(lags.min(), 0) + dx
+    x = x0 + np.arange(int(np.ceil((x1 - x0) / dx)) + 1) * dx
+    F = np.interp(x, lnw, f, left=0, right=0)
+    T = np.interp(x, np.log(tw), tf, left=0, right=0)
+
+    n = len(x)
+    nfft = 2**int(np.ceil(np.log2(2*n)))
+    c = np.fft.irfft(np.fft.rfft(F, nfft) * np.conj(np.fft.rfft(T, nfft)), nfft)
+    # c[k] = sum_i F[i]*T[i-k], negative lags are wrapped to the end
+    c = np.concatenate((c[nfft-n+1:], c[:n]))
+    k = np.arange(-n+1, n)
+    cc[valid] = np.interp(lags[valid] / dx, k, c)
+    return cc
+
+
+def _gaussian(x, amplitude=1, mean=0, stddev=1):
+    """A 1D gaussian"""
+    return amplitude * np.exp(-0.5 * ((x - mean) / stddev)**2)
+
+
+def fit_ccf(rv, ccf, method='gauss', window=10):
+    """Fit the peak of the CCF with a 1D gaussian
+
     :rv: The RV vector
     :ccf: The CCF values
-    :returns: The RV, and best fit gaussian
+    :method: 'gauss' (Gauss-Newton least squares in the window around the
+             peak), 'parabola' (closed form vertex of a parabola through the
+             log of the 3 points around the peak) or 'astropy' (reference
+             fit with astropy.modeling)
+    :window: Number of points on each side of the peak used in the fit
+    :returns: The RV, the width (stddev), the uncertainty on the RV, and the
+              best fit gaussian
     """
+    fitters = {'gauss': _fit_ccf_gauss, 'parabola': _fit_ccf_parabola,
+               'astropy': _fit_ccf_astropy}
+    if method not in fitters:
+        raise ValueError('method must be one of {}, not: {}'.format(sorted(fitters), method))
+    rv = np.asarray(rv, dtype=float)
+    ccf = np.asarray(ccf, dtype=float)
+    I = np.argmax(ccf)
+    i0, i1 = max(I - window, 0), min(I + window, len(rv))
+    return fitters[method](rv, ccf, I, i0, i1)
+
+
+def _fit_ccf_parabola(rv, ccf, I, i0, i1):
+    """Closed form fit: the vertex of a parabola through the log of the 3
+    points around the peak (exact for a gaussian). The uncertainty is
+    propagated from the scatter around the gaussian in the window.
+    """
+    ampl, mean, stddev = ccf[I], rv[I], 5.0
+    if 0 < I < len(rv) - 1 and np.all(ccf[I-1:I+2] > 0):
+        h = rv[I+1] - rv[I]
+        y = ccf[I-1:I+2]
+        L = np.log(y)
+        d = L[0] - 2*L[1] + L[2]
+        n = L[0] - L[2]
+        if d < 0:
+            mean = rv[I] + 0.5 * h * n / d
+            stddev = h / np.sqrt(-d)
+            ampl = np.exp(L[1] + 0.5 * ((mean - rv[I]) / stddev)**2)
+            g = partial(_gaussian, amplitude=ampl, mean=mean, stddev=stddev)
+            res = ccf[i0:i1] - g(rv[i0:i1])
+            dof = max(i1 - i0 - 3, 1)
+            sigma = np.sqrt(np.sum(res**2) / dof)
+            # Derivatives of the vertex with respect to the 3 log points
+            dL = 0.5 * h * np.array([d - n, 2*n, -d - n]) / d**2
+            error = sigma * np.sqrt(np.sum((dL / y)**2))
+            return mean, stddev, error, g
+    print('Warning: Not able to fit a gaussian to the CCF')
+    return mean, stddev, np.nan, partial(_gaussian, amplitude=ampl, mean=mean, stddev=stddev)
+
+
+def _fit_ccf_gauss(rv, ccf, I, i0, i1, maxiter=50, tol=1e-8):
+    """Least squares fit of a gaussian with Gauss-Newton iterations, starting
+    from the closed form solution. The uncertainty is from the covariance
+    matrix scaled with the residuals.
+    """
+    mean, stddev, error, g = _fit_ccf_parabola(rv, ccf, I, i0, i1)
+    if np.isnan(error):
+        return mean, stddev, error, g
+    x, y = rv[i0:i1], ccf[i0:i1]
+    p = np.array([g.keywords['amplitude'], mean, stddev])
+    for _ in range(maxiter):
+        e = _gaussian(x, *p)
+        u = (x - p[1]) / p[2]
+        J = np.column_stack((e / p[0], e * u / p[2], e * u**2 / p[2]))
+        step = np.linalg.lstsq(J, y - e, rcond=None)[0]
+        p = p + step
+        if not np.all(np.isfinite(p)) or p[2] <= 0:
+            return mean, stddev, error, g
+        if np.all(np.abs(step) <= tol * (np.abs(p) + tol)):
+            break
+
+    e = _gaussian(x, *p)
+    u = (x - p[1]) / p[2]
+    J = np.column_stack((e / p[0], e * u / p[2], e * u**2 / p[2]))
+    dof = max(len(x) - 3, 1)
+    try:
+        cov = np.linalg.inv(np.dot(J.T, J)) * np.sum((y - e)**2) / dof
+        error = np.sqrt(cov[1, 1])
+    except np.linalg.LinAlgError:
+        error = np.nan
+    return p[1], p[2], error, partial(_gaussian, amplitude=p[0], mean=p[1], stddev=p[2])
+
+
+def _fit_ccf_astropy(rv, ccf, I, i0, i1):
+    """Reference fit with the LevMarLSQFitter from astropy.modeling"""
     from astropy.modeling import models, fitting
     ampl = 1
-    mean = rv[ccf == ampl]
-    I = np.where(ccf == ampl)[0][0]
+    mean = rv[I]
 
     g_init = models.Gaussian1D(amplitude=ampl, mean=mean, stddev=5)
     fit_g = fitting.LevMarLSQFitter()
 
     try:
-        g = fit_g(g_init, rv[I - 10:I + 10], ccf[I - 10:I + 10])
+        g = fit_g(g_init, rv[i0:i1], ccf[i0:i1])
     except TypeError:
         print('Warning: Not able to fit a gaussian to the CCF')
-        return mean, g_init
-    RV = g.mean.value
-    return RV, g
+        return mean, 5.0, np.nan, g_init
+    cov = fit_g.fit_info.get('param_cov')
+    error = np.sqrt(cov[1, 1]) if cov is not None else np.nan
+    return g.mean.value, g.stddev.value, error, g
 
 
 def _nrefrac(wavelength, density=1.0):
@@ -84,6 +267,18 @@ def vac2air(wavelength, density=1.0):
     return wavelength/_nrefrac(wavelength, density)
 
 
+def air2vac(wavelength, density=1.0):
+    """
+    Inverse of vac2air (from air to vacuum). The refractive index depends on
+    the vacuum wavelength, so it is found by a few fixed point iterations.
+    """
+    air = np.asarray(wavelength, dtype=float)
+    vac = air * _nrefrac(air, density)
+    for _ in range(3):
+        vac = air * _nrefrac(vac, density)
+    return vac
+
+
 def dopplerShift(wvl, flux, v):
     """Doppler shift a given spectrum.
     Does not interpolate to a new wavelength vector, but does shift it.
@@ -115,3 +310,41 @@ def get_wavelength(hdr, convert=False):
     if convert:
         w *= 10
     return w
+
+
+def save_npy(fname, arr):
+    """Save an array as .npy, safe for other processes reading fname"""
+    dirname = os.path.dirname(fname)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    tmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp, fname)
+
+
+def prune_cache(directory, size):
+    """Remove the least recently used .npy files (modification time) in a
+    cache until it is below size
+
+    :directory: The cache directory
+    :size: Maximum size of the cache in bytes
+    """
+    files = []
+    for f in os.listdir(directory):
+        if f.endswith('.npy'):
+            try:
+                st = os.stat(os.path.join(directory, f))
+            except OSError:  # Removed by another process
+                continue
+            files.append((st.st_mtime, st.st_size, os.path.join(directory, f)))
+    files.sort()
+    total = sum(f[1] for f in files)
+    for _, fsize, fname in files:
+        if total <= size:
+            break
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+        total -= fsize
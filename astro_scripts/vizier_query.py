@@ -1,28 +1,165 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
+"""
+Look up objects in VizieR and give mean/median values of some parameters.
+
+The result of each query (per object and set of catalogs) is cached in
+~/.vizier_query/ and reused until it is older than the TTL. In offline mode
+only the cache is used. Many objects are queried concurrently with a thread
+pool, and their parameters are collected in one table.
+
+The backend doing the query can be replaced (e.g. in tests). It is called
+as backend(obj, catalogs) and returns a list of tables, which can be indexed
+by column name.
+"""
 
 # My imports
 from __future__ import division, print_function
+import os
+import time
+import pickle
+import hashlib
 import numpy as np
-try:
-    from astroquery.vizier import Vizier
-except ImportError:
-    url = 'https://astroquery.readthedocs.org/'
-    raise ImportError('astroquery is needed (pip). More info here: %s' % url)
 import argparse
 import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+path = os.path.expanduser('~/.vizier_query/')
+TTL = 30 * 24 * 3600  # Time (seconds) before a cached query is repeated
+PARAMETERS = ['Teff', 'logg', '__Fe_H_']
 
 
-def _q2a(lst):
+def astroquery_backend(obj, catalogs=None):
+    """Query VizieR with astroquery
+
+    :obj: The object to query (e.g. HD20010)
+    :catalogs: List of catalogs to query (default: all)
+    :returns: The tables (astroquery TableList)
     """
-    Convert list of quantities to numpy array
+    try:
+        from astroquery.vizier import Vizier
+    except ImportError:
+        url = 'https://astroquery.readthedocs.org/'
+        raise ImportError('astroquery is needed (pip). More info here: %s' % url)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return Vizier.query_object(obj, catalog=catalogs)
+
+
+def _cache_name(obj, catalogs=None):
+    """The cache file of a query"""
+    key = repr([obj.strip(), sorted(catalogs) if catalogs else None])
+    return os.path.join(path, '{}.pkl'.format(hashlib.sha1(key.encode('utf8')).hexdigest()))
+
+
+def query(obj, catalogs=None, ttl=TTL, offline=False, backend=None, cache=True):
+    """Query VizieR for an object (or use the cache)
+
+    :obj: The object to query (e.g. HD20010)
+    :catalogs: List of catalogs to query (default: all)
+    :ttl: Seconds before a cached query is repeated
+    :offline: Only use the cache (IOError if the object is not cached)
+    :backend: Function doing the query (default: astroquery_backend)
+    :cache: Use the cache
+    :returns: The tables
+    """
+    fname = _cache_name(obj, catalogs)
+    if cache and os.path.isfile(fname):
+        if offline or time.time() - os.path.getmtime(fname) < ttl:
+            with open(fname, 'rb') as f:
+                return pickle.load(f)
+    if offline:
+        raise IOError('{} is not in the cache (offline mode)'.format(obj))
+
+    cat = (backend or astroquery_backend)(obj, catalogs)
+    if cache:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        tmp = '{}.{}.{}.tmp'.format(fname, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            pickle.dump(cat, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, fname)
+    return cat
+
+
+def query_many(objects, workers=8, **options):
+    """Query VizieR for many objects concurrently
+
+    :objects: List of objects
+    :workers: Maximum number of concurrent queries
+    :options: Options for query
+    :returns: List of the tables for each object (None if the query failed)
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(query, obj, **options) for obj in objects]
+    cats = []
+    for obj, future in zip(objects, futures):
+        try:
+            cats.append(future.result())
+        except Exception as e:
+            print('Warning: Query for {} failed: {}'.format(obj, e))
+            cats.append(None)
+    return cats
+
+
+def _values(cat, column):
+    """All the values of a column in the tables (masked values are NaN)"""
+    values = []
+    for table in cat:
+        try:
+            values.append(np.ma.filled(np.ma.asarray(table[column], dtype=float), np.nan).ravel())
+        except (TypeError, KeyError, ValueError):
+            pass
+    return np.concatenate(values) if values else np.zeros(0)
+
+
+def _coordinate(cat):
+    """The first RA and DEC in the tables"""
+    for c in cat:
+        try:
+            ra = c['RAJ2000'][0]
+            dec = c['DEJ2000'][0]
+        except (KeyError, IndexError):
+            continue
+        if ra != 0:
+            return ra, dec
+    return 0, 0
+
+
+def _statistics(values):
+    """The mean and median of the values (NaN if not available)"""
+    if not np.isfinite(values).any():
+        return np.nan, np.nan
+    return round(np.nanmean(values), 2), round(np.nanmedian(values), 2)
+
+
+def parameter_table(objects, params=PARAMETERS, workers=8, **options):
+    """Mean and median values of parameters for many objects in one table
+
+    :objects: List of objects
+    :params: The parameters (columns in VizieR)
+    :workers: Maximum number of concurrent queries
+    :options: Options for query (catalogs, ttl, offline, backend, cache)
+    :returns: An astropy Table with a row per object
     """
-    lst_new = []
-    for li in lst:
-        li = li.value
-        for value in li:
-            lst_new.append(value)
-    return np.array(lst_new)
+    from astropy.table import Table
+    names = ['object', 'RA', 'DEC']
+    for param in params:
+        param = '[Fe/H]' if param == '__Fe_H_' else param
+        names += ['{}_mean'.format(param), '{}_median'.format(param), '{}_n'.format(param)]
+
+    rows = []
+    for obj, cat in zip(objects, query_many(objects, workers=workers, **options)):
+        cat = cat if cat is not None else []
+        ra, dec = _coordinate(cat)
+        row = [obj, str(ra), str(dec)]
+        for param in params:
+            values = _values(cat, param)
+            row += list(_statistics(values)) + [int(np.isfinite(values).sum())]
+        rows.append(row)
+    return Table(rows=rows, names=names) if rows else Table(names=names)
 
 
 def _parser():
@@ -36,57 +173,44 @@ def _parser():
                         help='Which method to print values (mean or median). Default is both')
     parser.add_argument('-c', '--coordinate', default=False, action='store_true',
                         help='Return the RA and DEC (format for NOT\'s visibility plot)')
+    parser.add_argument('--catalog', default=None, nargs='+',
+                        help='Only query these catalogs')
+    parser.add_argument('-w', '--workers', default=8, type=int,
+                        help='Maximum number of concurrent queries (default: 8)')
+    parser.add_argument('--ttl', default=TTL / (24 * 3600), type=float,
+                        help='Days before a cached query is repeated (default: 30)')
+    parser.add_argument('--offline', default=False, action='store_true',
+                        help='Only use the cached queries')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Save the table of all objects (e.g. .csv or .fits)')
     return parser.parse_args()
 
 
-def vizier_query(obj, params=True, method='both', coordinate=False):
+def vizier_query(obj, params=True, method='both', coordinate=False, **options):
     """Give mean/median values of some parameters for an object.
     This script use VizieR for looking up the object.
 
     :obj: The object to query (e.g. HD20010).
     :parama: Extra parameters to look for (default is Teff, logg, __Fe_H_).
     :method: Print median, main or both
+    :options: Options for query (catalogs, ttl, offline, backend, cache)
 
     :returns: A dictionary with the parameters
     """
-
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        cat = Vizier.query_object(obj)
+    cat = query(obj, **options)
 
     if coordinate:
-        for c in cat:
-            try:
-                ra = c['RAJ2000'][0]
-                dec = c['DEJ2000'][0]
-            except KeyError:
-                ra = 0
-            if ra != 0:
-                break
+        ra, dec = _coordinate(cat)
         print('\n\n%s %s %s' % (obj, ra, dec))
     else:
         print('\n\nObject: %s' % obj)
 
     parameters = {'Teff': [], 'logg': [], '__Fe_H_': []}
     if params:
-        params=['Teff', 'logg', '__Fe_H_']
-        for param in params:
-            parameters[param] = []
-
-        for ci in cat:
-            for column in parameters.keys():
-                try:
-                    parameters[column].append(ci[column].quantity)
-                except (TypeError, KeyError):
-                    pass
-
-        for key in parameters.keys():
-            pi = parameters[key]
-            parameters[key] = _q2a(pi)
-            if len(parameters[key]):
-                mean = round(np.nanmean(parameters[key]), 2)
-                median = round(np.nanmedian(parameters[key]), 2)
-            else:
+        for key in PARAMETERS:
+            parameters[key] = _values(cat, key)
+            mean, median = _statistics(parameters[key])
+            if np.isnan(mean):
                 mean = 'Not available'
                 median = 'Not available'
 
@@ -105,11 +229,21 @@ def vizier_query(obj, params=True, method='both', coordinate=False):
 
 def main():
     args = _parser()
-    stars = args.object[0].split(' ')
+    stars = args.object[0].split(' ') if len(args.object) == 1 else args.object
     if len(stars) == 1:
         stars = args.object[0].split(',')
-    for star in stars:
-        vizier_query(star, params=args.params, method=args.method, coordinate=args.coordinate)
+    options = {'catalogs': args.catalog, 'ttl': args.ttl * 24 * 3600, 'offline': args.offline}
+    if len(stars) == 1 and not args.output:
+        vizier_query(stars[0], params=args.params, method=args.method,
+                     coordinate=args.coordinate, **options)
+        return
+
+    table = parameter_table(stars, workers=args.workers, **options)
+    if args.output:
+        table.write(args.output, overwrite=True)
+        print('Table saved in {}'.format(args.output))
+    else:
+        table.pprint(max_lines=-1, max_width=-1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Benchmarks for the hot paths in astro_scripts (CCF, CCF peak fit,
+wavelength vector, and normalization) on synthetic spectra.
+
+The time (best of a few repeats) and the peak memory (tracemalloc) of each
+benchmark are written to a JSON file. Compare with an earlier run to fail
+on regressions:
+
+    python benchmarks/bench_utils.py -o baseline.json
+    python benchmarks/bench_utils.py -o new.json --compare baseline.json
+
+The exit status is 1 if the time or the peak memory of any benchmark
+increased by more than the threshold (default: 20%).
+"""
+
+# My imports
+from __future__ import division, print_function
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from astropy.io import fits
+# Use astro_scripts from this checkout (also when it is not installed)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from astro_scripts.utils import ccf_astro, fit_ccf, get_wavelength, _gaussian
+from astro_scripts.normalize import normalize
+
+SIZES = [1000, 10000, 100000, 1000000]
+DRVS = [1, 0.1]
+MAX_POINTS = 2e8  # Skip direct CCFs with more (pixels x velocities)
+MIN_MEMORY = 1024**2  # Do not compare peak memory below this (bytes)
+
+_benchmarks = []
+
+
+def benchmark(name, **params):
+    """Register a benchmark. The function gets the params and returns a
+    function without arguments, which is timed."""
+    def decorator(setup):
+        _benchmarks.append((name, params, setup))
+        return setup
+    return decorator
+
+
+def _spectrum(n, rv=0, pad=0):
+    """Synthetic spectrum with n pixels (0.01AA) from 5000AA, and a line
+    every 1AA. pad extends the wavelength range on both sides."""
+    w = np.arange(-int(pad / 0.01), n + int(pad / 0.01)) * 0.01 + 5000
+    lines = np.arange(5000.5, w[-1], 1.0) * (1.0 + rv / 299792.458)
+    flux = np.ones(len(w))
+    for i in range(0, len(lines), 1000):
+        chunk = lines[i:i+1000]
+        j0 = max(np.searchsorted(w, chunk[0]) - 50, 0)
+        j1 = np.searchsorted(w, chunk[-1]) + 50
+        x = w[j0:j1, np.newaxis] - chunk[np.newaxis, :]
+        flux[j0:j1] -= np.sum(0.5 * np.exp(-0.5 * (x / 0.05)**2), axis=1)
+    return w, flux
+
+
+for _n in SIZES:
+    for _drv in DRVS:
+        for _method in ('direct', 'fft'):
+            if _method == 'direct' and _n * 150 / _drv > MAX_POINTS:
+                continue
+
+            @benchmark('ccf_astro', n=_n, drv=_drv, method=_method)
+            def _ccf(n, drv, method):
+                w, f = _spectrum(n, rv=25)
+                # The template covers the spectrum shifted up to 150 km/s
+                tw, tf = _spectrum(n, pad=3 + 0.0006 * w[-1])
+                return lambda: ccf_astro((w, 1 - f), (tw, 1 - tf), rvmin=0, rvmax=150,
+                                         drv=drv, method=method)
+
+    for _method in ('constant', 'percentile', 'spline'):
+        @benchmark('normalize', n=_n, method=_method)
+        def _normalize(n, method):
+            w, f = _spectrum(n)
+            f = 1000 * f * (1 + (w - w[0]) / (w[-1] - w[0]))
+            return lambda: normalize(w, f, method=method)
+
+    @benchmark('get_wavelength', n=_n)
+    def _get_wavelength(n):
+        hdr = fits.Header()
+        hdr['NAXIS1'] = n
+        hdr['CRVAL1'] = 5000.0
+        hdr['CDELT1'] = 0.01
+        return lambda: get_wavelength(hdr)
+
+
+for _drv in DRVS:
+    for _method in ('parabola', 'gauss', 'astropy'):
+        @benchmark('fit_ccf', drv=_drv, method=_method)
+        def _fit(drv, method):
+            rv = np.arange(0, 150, drv)
+            noise = np.random.RandomState(42).normal(0, 0.01, len(rv))
+            ccf = _gaussian(rv, amplitude=1, mean=42.3, stddev=4.1) + noise
+            return lambda: fit_ccf(rv, ccf, method=method)
+
+
+def _run(func, repeat=3, mintime=0.2):
+    """Best time of func (averaged over enough calls to take mintime), and
+    the peak memory allocated during one call"""
+    func()  # Warm up (imports, caches)
+    t0 = time.perf_counter()
+    func()
+    once = time.perf_counter() - t0
+    number = max(1, int(mintime / max(once, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t0) / number)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def _key(name, params):
+    return '{}({})'.format(name, ', '.join('{}={}'.format(k, params[k]) for k in sorted(params)))
+
+
+def run(select=None, repeat=3, max_size=None):
+    """Run the benchmarks
+
+    :select: Only run benchmarks with this in the name
+    :repeat: Number of repeats for the timing
+    :max_size: Skip benchmarks of spectra larger than this
+    :returns: A dictionary with the time and peak memory of each benchmark
+    """
+    results = {}
+    for name, params, setup in _benchmarks:
+        key = _key(name, params)
+        if select and select not in key:
+            continue
+        if max_size and params.get('n', 0) > max_size:
+            continue
+        func = setup(**params)
+        seconds, peak = _run(func, repeat=repeat)
+        results[key] = {'time': seconds, 'memory': peak}
+        print('{:<60s} {:>12.6f} s {:>10.1f} MB'.format(key, seconds, peak / 1024**2))
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """Find the benchmarks which are slower or use more memory than in the
+    baseline by more than threshold
+
+    :results: The new results
+    :baseline: The results to compare with
+    :threshold: The allowed relative increase
+    :returns: List of the regressions
+    """
+    regressions = []
+    for key in sorted(set(results) & set(baseline)):
+        for quantity in ('time', 'memory'):
+            old, new = baseline[key][quantity], results[key][quantity]
+            if quantity == 'memory' and max(old, new) < MIN_MEMORY:
+                continue
+            if old > 0 and (new - old) / old > threshold:
+                regressions.append('{} {}: {:.4g} -> {:.4g} (+{:.0%})'.format(
+                    key, quantity, old, new, (new - old) / old))
+    return regressions
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths in astro_scripts')
+    parser.add_argument('-o', '--output', default='benchmarks.json',
+                        help='Save the results to this JSON file')
+    parser.add_argument('-c', '--compare', default=None,
+                        help='Compare with the results in this JSON file')
+    parser.add_argument('-t', '--threshold', default=0.2, type=float,
+                        help='Allowed relative increase in time or memory (default: 0.2)')
+    parser.add_argument('-k', '--select', default=None,
+                        help='Only run benchmarks with this in the name, e.g. ccf_astro')
+    parser.add_argument('-r', '--repeat', default=3, type=int,
+                        help='Number of repeats of the timing (default: 3)')
+    parser.add_argument('--max-size', default=None, type=int,
+                        help='Skip spectra with more pixels than this')
+    return parser.parse_args()
+
+
+def main():
+    args = _parser()
+    results = run(select=args.select, repeat=args.repeat, max_size=args.max_size)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results saved in {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold=args.threshold)
+        if regressions:
+            print('\nRegressions (threshold: {:.0%}):'.format(args.threshold))
+            print('\n'.join(regressions))
+            raise SystemExit(1)
+        print('No regressions (threshold: {:.0%})'.format(args.threshold))
+
+
+if __name__ == '__main__':
+    main()
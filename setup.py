@@ -68,11 +68,10 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
-        # 'Programming Language :: Python :: 3',
-        # 'Programming Language :: Python :: 3.4',
-        # 'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Natural Language :: English',
     ],
 
@@ -88,6 +87,7 @@ setup(
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=requirements,
+    python_requires='>=3.5',
 
     # setup_requires=['pytest-runner'],
     tests_require=['pytest', "hypothesis"],
@@ -122,17 +122,20 @@ setup(
     #    'console_scripts': [
     #        'sample=sample:main',
         'console_scripts': [
-            'plot_fits=astro_scripts:plot_fits',
-            'numpy2moog=astro_scripts:numpy2moog',
-            'fitsheader2=astro_scripts:fitsheader',  # There is a fitsheader from astropy
-            'ascii2fits=astro_scripts:ascii2fits',
-            'CRIRES2ARES=astro_scripts:CRIRES2ARES',
-            'linelist_filter=astro_scripts:linelist_filter',
-            'rv_measure=astro_scripts:rv_measure',
-            'VALDextraction=astro_scripts:VALDextraction',
-            'VALDprepare=astro_scripts:VALDprepare',
-            'vizier_query=astro_scripts:vizier_query',
-            'SWEETCat=astro_scripts:SWEETCat',
+            'plot_fits=astro_scripts.plot_fits:runner',
+            'numpy2moog=astro_scripts.numpy2moog:runner',
+            'fitsheader2=astro_scripts.fitsHeader:main',  # There is a fitsheader from astropy
+            'ascii2fits=astro_scripts.ascii2fits:main',
+            'CRIRES2ARES=astro_scripts.CRIRES2ARES:runner',
+            'linelist_filter=astro_scripts.linelist_filter:main',
+            'linelist_convert=astro_scripts.linelist:main',
+            'rv_measure=astro_scripts.rv_measure:runner',
+            'rv_measure_batch=astro_scripts.rv_measure:batch_runner',
+            'VALDextraction=astro_scripts.VALDextraction:main',
+            'VALDprepare=astro_scripts.VALDprepare:runner',
+            'vizier_query=astro_scripts.vizier_query:main',
+            'SWEETCat=astro_scripts.SWEETCat:main',
+            'fits_archive=astro_scripts.archive:main',
         ],
     },
 )
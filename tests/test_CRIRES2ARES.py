@@ -0,0 +1,77 @@
+from __future__ import division
+import importlib
+import numpy as np
+from astropy.io import fits
+from astro_scripts.utils import get_wavelength
+
+# The package attribute CRIRES2ARES is the console script function
+c2a = importlib.import_module('astro_scripts.CRIRES2ARES')
+
+
+def _write_crires(fname, n=1024):
+    hdu = fits.PrimaryHDU()
+    hdu.header['ESO INS WLEN MIN'] = 2100.
+    hdu.header['ESO INS WLEN MAX'] = 2110.
+    w = np.linspace(2100, 2110, n)**1.001 / 2100**0.001  # Not equidistant
+    cols = [fits.Column(name='Wavelength', format='D', array=w),
+            fits.Column(name='Extracted_OPT', format='D', array=w - 2100)]
+    fits.HDUList([hdu, fits.BinTableHDU.from_columns(cols)]).writeto(str(fname))
+    return w
+
+
+def test_main(tmp_path):
+    fname = str(tmp_path / 'crires.fits')
+    w = _write_crires(fname)
+    output = str(tmp_path / 'out.fits')
+    c2a.main(fname, output=output)
+    data, hdr = fits.getdata(output, header=True)
+    # The wavelength of the last pixel is WLEN MAX
+    np.testing.assert_allclose(get_wavelength(hdr)[[0, -1]], [21000, 21100])
+
+    c2a.main(fname, output=output, resample_method='linear')
+    data, hdr = fits.getdata(output, header=True)
+    np.testing.assert_allclose(data, np.interp(get_wavelength(hdr) / 10, w, w - 2100), atol=1e-10)
+
+
+def _write_crires4(fname, n=512):
+    """A CRIRES product with four detector extensions and gaps between them"""
+    hdu = fits.PrimaryHDU()
+    hdu.header['ESO INS WLEN MIN'] = 2100.
+    hdu.header['ESO INS WLEN MAX'] = 2140.
+    hdul = [hdu]
+    for i in range(4):
+        w = np.linspace(2100 + 10 * i, 2109 + 10 * i, n)
+        cols = [fits.Column(name='Wavelength', format='D', array=w),
+                fits.Column(name='Extracted_OPT', format='D', array=w - 2100)]
+        hdul.append(fits.BinTableHDU.from_columns(cols))
+    fits.HDUList(hdul).writeto(str(fname))
+
+
+def test_convert(tmp_path):
+    fname = str(tmp_path / 'crires.fits')
+    _write_crires4(fname)
+    outputs = c2a.convert(fname, outdir=str(tmp_path / 'out'))
+    assert [o.rsplit('/', 1)[1] for o in outputs] == ['crires_ext%i.fits' % i for i in range(1, 5)]
+    data, hdr = fits.getdata(outputs[2], header=True)
+    np.testing.assert_allclose(get_wavelength(hdr)[[0, -1]], [21200, 21290])
+    np.testing.assert_allclose(data, get_wavelength(hdr) / 10 - 2100, atol=1e-8)
+
+    outputs = c2a.convert(fname, extensions=[2, 3], stitched=True, unit=2)
+    assert outputs == [str(tmp_path / 'crires_stitched.fits')]
+    data, hdr = fits.getdata(outputs[0], header=True)
+    w = get_wavelength(hdr)
+    np.testing.assert_allclose(w[[0, -1]], [2110, 2129])
+    # The flux is linear in wavelength, also in the gap between the detectors
+    np.testing.assert_allclose(data, w - 2100, atol=1e-8)
+
+
+def test_batch(tmp_path):
+    for name in ('a', 'b'):
+        _write_crires4(tmp_path / (name + '.fits'))
+    (tmp_path / 'bad.fits').write_bytes(b'not a fits file')
+    outputs = c2a.batch([str(tmp_path)], workers=2, extensions=[1])
+    assert outputs == {str(tmp_path / 'a.fits'): [str(tmp_path / 'a_ext1.fits')],
+                       str(tmp_path / 'b.fits'): [str(tmp_path / 'b_ext1.fits')],
+                       str(tmp_path / 'bad.fits'): []}
+    # The outputs are not converted again
+    assert sorted(c2a.batch([str(tmp_path)], workers=1, stitched=True)) == sorted(outputs)
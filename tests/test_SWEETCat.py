@@ -0,0 +1,125 @@
+from __future__ import division
+import os
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+
+# The package attribute SWEETCat is the console script function
+sc = importlib.import_module('astro_scripts.SWEETCat')
+
+ROWS = [
+    ['HD1', '1', '00 00 01', '+01 00 00', '7.1', '0.01', '20.1', '0.5', 'Gaia', '5777', '50',
+     '4.44', '0.1', '4.40', '0.1', '1.0', '0.1', '0.00', '0.05', '1.00', '0.1', 'Sousa', '1',
+     '2017', '~', '~', '~'],
+    ['HD2', '~', '00 00 02', '-01 00 00', '8.2', '0.02', '~', '~', '~', '6200', '70',
+     '4.20', '0.1', '~', '~', '1.3', '0.1', '-0.20', '0.05', '1.20', '0.1', 'Santos', '~',
+     '2016', 'note', '~', '~'],
+    ['HD3', '3', '00 00 03', '+03 00 00', '9.3', '0.03', '10.0', '0.4', 'Hipparcos', '12000',
+     '100', '4.00', '0.1', '~', '~', '1.5', '0.1', '0.10', '0.05', '2.00', '0.1', 'Tsantaki',
+     '1', '2015', '~', '~', '~'],
+]
+
+
+def _write(fname, rows):
+    with open(fname, 'w') as f:
+        for row in rows:
+            f.write('\t'.join(row) + '\n')
+
+
+def test_read_sweetcat(tmp_path, monkeypatch):
+    fname = str(tmp_path / 'sweetcat.csv')
+    _write(fname, ROWS)
+    expected = sc._parse_sweetcat(fname)
+    parsed = []
+    parse = sc._parse_sweetcat
+    monkeypatch.setattr(sc, '_parse_sweetcat', lambda fname: parsed.append(fname) or parse(fname))
+
+    df = sc._read_sweetcat(fname)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert list(df['source']) == [True, False]
+    assert df['lum'].iloc[0] == pytest.approx(1.0)
+    assert os.path.isfile(os.path.join(str(tmp_path / 'sweetcat_cache'), 'teff.npy'))
+
+    # From the cache, only the requested columns
+    df = sc._read_sweetcat(fname, columns=['teff', 'parsource'])
+    assert list(df.columns) == ['teff', 'parsource']
+    assert list(df['teff']) == [5777, 6200]
+    assert df['parsource'].iloc[0] == 'Gaia' and np.isnan(df['parsource'].iloc[1])
+    assert len(parsed) == 1
+    with pytest.raises(ValueError):
+        sc._read_sweetcat(fname, columns=['radius'])
+
+    # Same content with a new modification time
+    os.utime(fname, (0, 0))
+    sc._read_sweetcat(fname, columns=['teff'])
+    assert len(parsed) == 1
+
+    # New content
+    _write(fname, ROWS[:1])
+    assert list(sc._read_sweetcat(fname, columns=['star'])['star']) == ['HD1']
+    assert len(parsed) == 2
+
+
+class Isochrone(object):
+    """A stand-in for the Dartmouth isochrone with log(age) range
+    9 + mass + feh +- 0.1"""
+
+    def agerange(self, mass, feh):
+        return 9 + mass + feh - 0.1, 9 + mass + feh + 0.1
+
+
+def _age(mass, feh):
+    return (10**(mass + feh - 0.1) + 10**(mass + feh + 0.1)) / 2
+
+
+class PartialIsochrone(Isochrone):
+    """No solution for masses above 2"""
+
+    def agerange(self, mass, feh):
+        if mass > 2:
+            raise ValueError('No solution')
+        return Isochrone.agerange(self, mass, feh)
+
+
+def test_ages(tmp_path, monkeypatch):
+    monkeypatch.setattr(sc, 'path', str(tmp_path))
+    monkeypatch.setattr(sc, '_isochrone', None)  # Set by exact_ages
+    mass = np.array([0.8, 1.0, 1.23, np.nan, 3.0])
+    feh = np.array([0.1, 0.0, -0.31, 0.0, 0.0])
+    expected = _age(mass, feh)
+    expected[-2:] = np.nan
+    ages = sc.exact_ages(mass[:-1], feh[:-1], isochrone=Isochrone())
+    np.testing.assert_allclose(ages, _age(mass[:-1], feh[:-1]))
+    np.testing.assert_allclose(sc.exact_ages(mass[:-1], feh[:-1], workers=2, isochrone=Isochrone()), ages)
+
+    grid = sc.age_grid(isochrone=Isochrone())
+    assert grid.shape == (len(sc.MASS_GRID), len(sc.FEH_GRID))
+    np.testing.assert_allclose(sc.grid_ages(mass, feh, grid), expected, rtol=0.01)
+    # On the grid points the interpolation is exact
+    mass, feh = np.array([1.0, 2.5]), np.array([0.5, -1.0])
+    np.testing.assert_allclose(sc.grid_ages(mass, feh, grid), _age(mass, feh))
+
+
+def test_age_grid_without_solution(tmp_path, monkeypatch):
+    monkeypatch.setattr(sc, 'path', str(tmp_path))
+    monkeypatch.setattr(sc, '_isochrone', None)
+    grid = sc.age_grid(isochrone=PartialIsochrone())
+    assert np.isnan(grid[sc.MASS_GRID > 2]).all()
+    assert np.isfinite(grid[sc.MASS_GRID <= 2]).all()
+    ages = sc.grid_ages(np.array([1.0, 2.5]), np.array([0.0, 0.0]), grid)
+    assert np.isclose(ages[0], _age(1.0, 0.0)) and np.isnan(ages[1])
+
+
+def test_catalogue_ages(tmp_path, monkeypatch):
+    fname = str(tmp_path / 'sweetcat.csv')
+    _write(fname, ROWS)
+    monkeypatch.setattr(sc, 'path', str(tmp_path))
+    monkeypatch.setattr(sc, '_isochrone', Isochrone())
+    ages = sc._ages(fname, method='exact')
+    df = sc._read_sweetcat(fname)
+    assert list(ages.index) == list(df.index)
+    np.testing.assert_allclose(ages, _age(df['mass'].values, df['feh'].values))
+    # Cached for this version of the catalogue
+    monkeypatch.setattr(sc, 'exact_ages', None)
+    np.testing.assert_allclose(sc._ages(fname, method='exact'), ages)
@@ -0,0 +1,44 @@
+from __future__ import division
+import gzip
+import pytest
+from astro_scripts.VALDprepare import main, batch
+
+VALD = b"""                                                                   Lande factors      Damping parameters
+Elm Ion       WL_air(A)   Excit(eV) Vmic log gf*  Rad.   Stark    Waals   factor  depth  Reference
+'Fe 1',       6000.0000,  3.0000, 1.0, -1.000, 8.000,-6.000,-7.000, 1.000, 0.100, 'ref'
+'Ti 2',       6001.0000,  1.0000, 1.0, -2.000, 8.000,-6.000,-7.000, 1.000, 0.100, 'ref'
+* oscillator strengths were scaled by the solar isotopic ratios.
+ References:
+  1. K08: 'Kurucz Fe I'
+"""
+
+
+def _write(fname):
+    with gzip.open(str(fname), 'wb') as f:
+        f.write(VALD)
+
+
+def test_main(tmp_path):
+    inp = tmp_path / 'vald.gz'
+    _write(inp)
+    output = main(str(inp))
+    assert output == str(tmp_path / 'vald.dat')
+    with open(output, 'rb') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 6
+    assert lines[0].startswith(b'# ')
+    assert lines[1].startswith(b'# Elm Ion')
+    assert lines[2] == b"Fe 1,       6000.0000,  3.0000, 1.0, -1.000, 8.000,-6.000,-7.000, 1.000, 0.100, ref"
+    assert lines[-1] == b' References:'
+    with pytest.raises(IOError):
+        main(str(tmp_path / 'missing.gz'))
+
+
+def test_batch(tmp_path):
+    inputs = [str(tmp_path / 'vald{}.gz'.format(i)) for i in range(3)]
+    for inp in inputs:
+        _write(inp)
+    outputs = batch(inputs, workers=2)
+    assert outputs == [inp.replace('.gz', '.dat') for inp in inputs]
+    with open(outputs[0], 'rb') as f0, open(outputs[2], 'rb') as f2:
+        assert f0.read() == f2.read()
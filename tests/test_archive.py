@@ -0,0 +1,54 @@
+from __future__ import division
+import os
+import numpy as np
+from astropy.io import fits
+from astro_scripts.archive import update, query, coverage
+
+
+def _write(fname, w0, n=100, obj='HD20010', ext=False):
+    hdr = fits.Header()
+    hdr['CRVAL1'] = w0
+    hdr['CDELT1'] = 0.1
+    hdr['OBJECT'] = obj
+    hdr['ESO OBS PROG ID'] = '094.D-0123'
+    data = np.ones(n)
+    if ext:
+        fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(data, header=hdr)]).writeto(str(fname), overwrite=True)
+    else:
+        fits.writeto(str(fname), data, header=hdr, overwrite=True)
+
+
+def test_coverage():
+    assert coverage([{'NAXIS1': 11, 'CRVAL1': 5000., 'CD1_1': 0.1}]) == (0, 5000., 5001.)
+    assert coverage([{'NAXIS': 0}, {'NAXIS1': 3, 'CRVAL1': 10., 'CDELT1': -1.}]) == (1, 8., 10.)
+    assert coverage([{'NAXIS': 0}]) == (None, None, None)
+
+
+def test_archive(tmp_path):
+    db = str(tmp_path / 'archive.sqlite')
+    night = tmp_path / 'night'
+    os.mkdir(str(night))
+    _write(night / 'a.fits', 6500)
+    _write(night / 'b.fits', 6555, obj='HD41248', ext=True)
+    _write(night / 'c.fits', 5000)
+    assert update([str(night)], database=db, workers=1) == (3, 0, 0)
+
+    paths = [s['path'] for s in query(db, 6556, 6564)]
+    assert paths == [str(night / 'b.fits')]
+    spectra = query(db, 6505, 6556, overlap=True)
+    assert [os.path.basename(s['path']) for s in spectra] == ['a.fits', 'b.fits']
+    np.testing.assert_allclose([spectra[1]['wmin'], spectra[1]['wmax']], [6555, 6564.9])
+    assert spectra[1]['hdu'] == 1
+    assert [os.path.basename(s['path']) for s in query(db, keys={'object': 'HD2%'})] == ['a.fits', 'c.fits']
+    assert len(query(db, 6505, keys={'OBJECT': 'HD20010', 'ESO OBS PROG ID': '094.D-0123'})) == 1
+    assert query(db, keys={'NAXIS1': 100, 'object': 'HD41248'})[0]['header']['OBJECT'] == 'HD41248'
+    # Keys are not part of the SQL
+    assert query(db, keys={"A'B": 1}) == []
+    assert query(db, keys={"NAXIS1\"') OR 1=1 --": 1}) == []
+
+    # Only the changed files are read again, and removed files are removed
+    _write(night / 'c.fits', 6560, n=200)
+    os.remove(str(night / 'a.fits'))
+    assert update([str(night)], database=db) == (1, 1, 1)
+    paths = [os.path.basename(s['path']) for s in query(db, 6560, 6564)]
+    assert paths == ['b.fits', 'c.fits']
@@ -0,0 +1,39 @@
+from __future__ import division
+import numpy as np
+from astropy.io import fits
+from astro_scripts.ascii2fits import read_ascii, convert2fits, batch
+from astro_scripts.utils import get_wavelength
+
+
+def _write(fname, n=20000):
+    w = np.sort(5000 + 100 * np.random.RandomState(1).rand(n))
+    flux = 1 - 0.5 * np.exp(-0.5 * ((w - 5050) / 0.1)**2)
+    with open(fname, 'w') as f:
+        f.write('# wavelength flux\n')
+        np.savetxt(f, np.column_stack((w, flux, flux)))
+    return w, flux
+
+
+def test_convert2fits(tmp_path):
+    fname = str(tmp_path / 'spectrum.dat')
+    w, flux = _write(fname)
+    ww, ff = read_ascii(fname, chunksize=3000)
+    np.testing.assert_allclose(ww, w)
+    np.testing.assert_allclose(ff, flux)
+
+    fout = convert2fits(fname, dA=0.05)
+    assert fout == str(tmp_path / 'spectrum.fits')
+    data, hdr = fits.getdata(fout, header=True)
+    assert hdr['CDELT1'] == 0.05
+    assert abs(hdr['CRVAL1'] - w[0]) < 1e-9
+    np.testing.assert_allclose(data, np.interp(get_wavelength(hdr), w, flux))
+
+
+def test_batch(tmp_path):
+    fnames = [str(tmp_path / 'spectrum{}.dat'.format(i)) for i in range(4)]
+    for fname in fnames:
+        _write(fname, n=1000)
+    fouts = batch(fnames, workers=2, dA=0.1)
+    assert fouts == [fname.replace('.dat', '.fits') for fname in fnames]
+    for fout in fouts:
+        assert fits.getheader(fout)['CDELT1'] == 0.1
@@ -0,0 +1,85 @@
+from __future__ import division
+import os
+import numpy as np
+from astropy.io import fits
+from astro_scripts.fitsHeader import read_headers, scan, table, write_table, _inputs
+
+
+def _write(fname, value=1.5):
+    hdu = fits.PrimaryHDU(np.zeros((3, 5), dtype='f4'))
+    hdu.header['OBJECT'] = "HD 20010's"
+    hdu.header['EXPTIME'] = value
+    hdu.header['SIMPLEST'] = True
+    hdu.header['ESO INS WLEN MIN'] = 2100.5
+    hdu.header['LONGSTR'] = 'x' * 100
+    hdu.header['HISTORY'] = 'Nothing to see'
+    cols = [fits.Column(name='flux', format='D', array=np.arange(1000.))]
+    table = fits.BinTableHDU.from_columns(cols)
+    table.header['EXTNAME'] = 'SPEC'
+    fits.HDUList([hdu, table, fits.ImageHDU(np.ones(7, dtype='i2'))]).writeto(str(fname))
+
+
+def test_read_headers(tmp_path):
+    fname = str(tmp_path / 'a.fits')
+    _write(fname)
+    headers = read_headers(fname)
+    assert len(headers) == 3
+    with fits.open(fname) as hdul:
+        for header, hdu in zip(headers, hdul):
+            for key in ('BITPIX', 'NAXIS', 'EXTNAME', 'OBJECT', 'EXPTIME', 'SIMPLEST'):
+                assert header.get(key) == hdu.header.get(key)
+    assert headers[0]['ESO INS WLEN MIN'] == 2100.5
+    assert headers[0]['LONGSTR'] == 'x' * 100
+    assert 'HISTORY' not in headers[0]
+    assert len(read_headers(fname, hdus=1)) == 1
+
+
+def test_table(tmp_path, capsys):
+    _write(tmp_path / 'a.fits')
+    os.mkdir(str(tmp_path / 'night'))
+    _write(tmp_path / 'night' / 'b.fits', value=3)
+    (tmp_path / 'night' / 'bad.fits').write_bytes(b'not a fits file')
+    fnames = _inputs([str(tmp_path)])
+    assert [os.path.basename(f) for f in fnames] == ['a.fits', 'b.fits', 'bad.fits']
+
+    names, rows = table(fnames, ['exptime', 'hierarch eso ins wlen min', 'extname'], workers=2)
+    assert names == ['fname', 'exptime', 'hierarch eso ins wlen min', 'extname']
+    assert rows == [[fnames[0], 1.5, 2100.5, None], [fnames[1], 3, 2100.5, None]]
+    assert 'Could not read' in capsys.readouterr().err
+
+    names, rows = table(fnames[:1], ['EXTNAME'], all_hdus=True, workers=1)
+    assert rows == [[fnames[0], 0, None], [fnames[0], 1, 'SPEC'], [fnames[0], 2, None]]
+    output = str(tmp_path / 'keys.csv')
+    write_table(names, rows, output)
+    with open(output) as f:
+        assert f.read().splitlines()[1:3] == [fnames[0] + ',0,', fnames[0] + ',1,SPEC']
+
+
+def test_index(tmp_path):
+    fname = str(tmp_path / 'a.fits')
+    index = str(tmp_path / 'index.pkl')
+    _write(fname)
+    assert scan([fname], index=index)[fname][0]['EXPTIME'] == 1.5
+    # Unchanged files are taken from the index
+    st = os.stat(fname)
+    with open(fname, 'r+b') as f:
+        f.write(b'X')
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert scan([fname], index=index)[fname][0]['EXPTIME'] == 1.5
+    # Changed files are scanned again
+    os.remove(fname)
+    _write(fname, value=2.5)
+    os.utime(fname, (st.st_atime + 10, st.st_mtime + 10))
+    assert scan([fname], index=index)[fname][0]['EXPTIME'] == 2.5
+
+
+def test_main(tmp_path, monkeypatch, capsys):
+    from astro_scripts.fitsHeader import main
+    fname = str(tmp_path / 'a.fits')
+    _write(fname)
+    monkeypatch.setattr('sys.argv', ['fitsheader2', '-key', 'OBJECT', fname])
+    main()
+    assert capsys.readouterr().out == "{}:  HD 20010's\n".format(fname)
+    monkeypatch.setattr('sys.argv', ['fitsheader2', '-key', 'OBJECT', '-key', 'exptime', fname])
+    main()
+    assert capsys.readouterr().out.splitlines()[1] == "{},HD 20010's,1.5".format(fname)
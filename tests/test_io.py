@@ -0,0 +1,68 @@
+from __future__ import division
+import numpy as np
+import pytest
+from astropy.io import fits
+from astro_scripts.io import read_spectra, read_spectrum, register, ftypes, Spectrum, _readers
+
+
+def _write_crires(fname, n=1024):
+    hdus = [fits.PrimaryHDU()]
+    hdus[0].header['ESO INS WLEN MIN'] = 2100.
+    for ext in range(4):
+        w = np.linspace(2100 + 10*ext, 2105 + 10*ext, n)
+        cols = [fits.Column(name='Wavelength', format='D', array=w),
+                fits.Column(name='Extracted_OPT', format='D', array=np.ones(n) * ext)]
+        hdus.append(fits.BinTableHDU.from_columns(cols))
+    fits.HDUList(hdus).writeto(str(fname))
+
+
+def test_read_1d(tmp_path):
+    fname = str(tmp_path / 'spec.fits')
+    hdr = fits.Header()
+    hdr['CRVAL1'] = 600.
+    hdr['CDELT1'] = 0.01
+    fits.writeto(fname, np.arange(100, dtype=float), hdr)
+    spectrum = read_spectrum(fname)
+    assert isinstance(spectrum, Spectrum)
+    assert len(spectrum) == 100
+    assert spectrum.wavelength[0] == 600
+    assert read_spectrum(fname, convert=True).wavelength[0] == 6000
+    assert spectrum.header['CDELT1'] == 0.01
+    assert spectrum.fname == fname
+
+
+def test_read_crires(tmp_path):
+    fname = tmp_path / 'crires.fits'
+    _write_crires(fname)
+    spectra = read_spectra(str(fname), 'CRIRES')
+    assert [s.order for s in spectra] == [1, 2, 3, 4]
+    # Data is only accessed after the file is closed
+    assert spectra[2].wavelength[0] == 21200
+    assert (spectra[2].flux == 2).all()
+    assert spectra[2].primary_header['ESO INS WLEN MIN'] == 2100
+    assert read_spectrum(str(fname), 'crires', order=4).flux[0] == 3
+
+
+def test_read_giano(tmp_path):
+    fname = str(tmp_path / 'giano.fits')
+    wavefile = str(tmp_path / 'wavelength_GIANO.dat')
+    fits.writeto(fname, np.ones((3, 50)) * np.arange(3)[:, np.newaxis])
+    np.savetxt(wavefile, [[32, 24000, 24100], [33, 23800, 23900], [34, 23600, 23700]])
+    spectra = read_spectra(fname, 'GIANO', wavefile=wavefile)
+    assert [s.order for s in spectra] == [32, 33, 34]
+    spectrum = read_spectrum(fname, 'GIANO', order=33, wavefile=wavefile)
+    assert spectrum.wavelength[0] == 23800
+    assert spectrum.wavelength[-1] == 23900
+    assert (spectrum.flux == 1).all()
+
+
+def test_register():
+    assert 'UVES' in ftypes()
+    with pytest.raises(ValueError):
+        read_spectra('spec.fits', 'HARPS')
+
+    @register('dummy')
+    def _read_dummy(hdul, orders=None, **options):
+        return [Spectrum(lambda: np.arange(3), hdul[0].data)]
+    assert 'DUMMY' in ftypes()
+    _readers.pop('DUMMY')
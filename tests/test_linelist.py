@@ -0,0 +1,69 @@
+from __future__ import division
+import os
+import numpy as np
+from astro_scripts import linelist
+
+MOOG = """Wavelength\tEle\t  excit\t  log gf\t\t\t EW
+ 6005.551      26.0     2.22    -3.930                        15.1
+ 5001.864      26.0     3.88    -0.010                        71.3
+ 5198.711      26.1     2.22    -2.140                        20.4
+"""
+
+
+def test_read_moog(tmp_path):
+    fname = str(tmp_path / 'lines.moog')
+    with open(fname, 'w') as f:
+        f.write(MOOG)
+    data = linelist.read_moog(fname)
+    assert data.dtype == linelist.DTYPE
+    assert list(data['wavelength']) == [5001.864, 5198.711, 6005.551]
+    assert list(data['ew']) == [71.3, 20.4, 15.1]
+
+    # Round trip through the MOOG format
+    out = str(tmp_path / 'out.moog')
+    linelist.write_moog(data, out)
+    assert np.array_equal(linelist.read_moog(out), data)
+
+    # Lines without the fifth column
+    with open(fname, 'w') as f:
+        f.write('Wavelength Ele excit loggf D0\n 5001.864 26.0 3.88 -0.010\n 4000.0 106.0 1.0 -1.0 3.47\n')
+    data = linelist.read_moog(fname)
+    assert np.isnan(data['ew'][1])
+    assert data['ew'][0] == 3.47
+
+
+def test_read_linelist(tmp_path, monkeypatch):
+    monkeypatch.setattr(linelist, 'pathlinelists', str(tmp_path / 'cache'))
+    fname = str(tmp_path / 'lines.moog')
+    with open(fname, 'w') as f:
+        f.write(MOOG)
+    data = linelist.read_linelist(fname)
+    assert isinstance(data, np.memmap)
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+    assert np.array_equal(data, linelist.read_moog(fname))
+
+    # The least recently used line lists are removed
+    monkeypatch.setattr(linelist, 'CACHE_SIZE', 1)
+    other = str(tmp_path / 'other.moog')
+    with open(other, 'w') as f:
+        f.write(MOOG)
+    linelist.read_linelist(other)
+    assert os.listdir(str(tmp_path / 'cache')) == [os.path.basename(linelist._cache_name(other))]
+
+
+def test_window(tmp_path):
+    rng = np.random.RandomState(42)
+    data = np.zeros(500000, dtype=linelist.DTYPE)
+    data['wavelength'] = rng.uniform(3000, 10000, len(data))
+    data['element'] = rng.choice([26.0, 26.1, 22.0], len(data))
+    fname = str(tmp_path / 'lines.npy')
+    linelist.save(data, fname)
+    data = linelist.read_linelist(fname)
+
+    lines = linelist.window(data, 6000, 6050)
+    i = (data['wavelength'] >= 6000) & (data['wavelength'] <= 6050)
+    assert np.array_equal(lines, data[i])
+    # A view of the memory-mapped file, not a copy
+    assert isinstance(lines, np.memmap) and np.shares_memory(lines, data)
+    assert len(linelist.window(data, 1000, 2000)) == 0
+    assert len(linelist.window(data, 0, np.inf)) == len(data)
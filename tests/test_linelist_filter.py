@@ -0,0 +1,86 @@
+from __future__ import division
+import numpy as np
+import pytest
+from astro_scripts import linelist
+from astro_scripts.linelist_filter import Column, parse, select, filter_linelist, ll_filter
+
+
+def _linelist(n=1000):
+    rng = np.random.RandomState(42)
+    data = np.zeros(n, dtype=linelist.DTYPE)
+    data['wavelength'] = rng.uniform(4000, 7000, n)
+    data['element'] = rng.choice([26.0, 26.1, 22.0, 106.0], n)
+    data['excit'] = rng.uniform(0, 6, n)
+    data['loggf'] = rng.uniform(-6, 1, n)
+    data['ew'] = rng.uniform(5, 100, n)
+    return data
+
+
+def test_parse():
+    data = _linelist()
+    w, e, ep, gf = data['wavelength'], data['element'], data['excit'], data['loggf']
+    queries = {
+        'wavelength >= 5000 and wavelength <= 6000': (w >= 5000) & (w <= 6000),
+        '(5000 < wavelength < 6000) & (excit <= 4)': (w > 5000) & (w < 6000) & (ep <= 4),
+        'excit > loggf': ep > gf,
+        'loggf > -3 or element in (26.0, 26.1)': (gf > -3) | np.isin(e, [26.0, 26.1]),
+        'not element == 106.0': e != 106.0,
+        'element not in [22.0] and -2 > loggf': (e != 22.0) & (gf < -2),
+        '~(excit < 2) | (element != 26.1)': (ep >= 2) | (e != 26.1),
+    }
+    for query, expected in queries.items():
+        assert np.array_equal(parse(query)(data), expected), query
+
+    predicate = (Column('excit') < 5) & Column('element').isin([26.0, 26.1])
+    assert np.array_equal(select(data, predicate), data[(ep < 5) & np.isin(e, [26.0, 26.1])])
+    assert np.array_equal(Column('loggf').between(-2, 0)(data), (gf >= -2) & (gf <= 0))
+
+    for query in ['wavelength', 'foo > 1', '__import__("os")', '1 < 2', 'loggf >', 'wavelength < 6000 & excit <= 4',
+                  'loggf > True', 'element in (26, False)', 'excit > "1"', 'loggf > 1j']:
+        with pytest.raises(ValueError):
+            parse(query)
+
+
+def test_filter_linelist(tmp_path):
+    data = _linelist(2500)
+    data['ew'][::3] = np.nan
+    fname = str(tmp_path / 'lines.moog')
+    linelist.write_moog(data, fname)
+    data = linelist.read_moog(fname)  # Rounded by the format
+    queries = ['4500 < wavelength < 6500', 'excit < 5 or element == 26.1']
+    expected = select(data, queries)
+
+    output = str(tmp_path / 'filtered.moog')
+    n = filter_linelist(fname, queries, output, chunksize=100)
+    assert n == len(expected)
+    result = linelist.read_moog(output)
+    assert np.array_equal(result[['wavelength', 'element', 'excit', 'loggf']],
+                          expected[['wavelength', 'element', 'excit', 'loggf']])
+    assert np.array_equal(np.isnan(result['ew']), np.isnan(expected['ew']))
+
+    output = str(tmp_path / 'filtered.npy')
+    assert filter_linelist(fname, queries, output, chunksize=100) == n
+    assert np.array_equal(np.asarray(linelist.load(output))['wavelength'], expected['wavelength'])
+
+
+def test_ll_filter(tmp_path):
+    data = _linelist()
+    fname = str(tmp_path / 'lines.moog')
+    linelist.write_moog(data, fname)
+    data = next(linelist.iter_moog(fname))  # In the order of the file
+    result = ll_filter(fname, 3, -2.0, True, 26.1)
+    i = (data['loggf'] > -2) | (data['element'] == 26.1)
+    assert result.shape == (i.sum(), 5)
+    assert np.array_equal(result[:, 0], data['wavelength'][i])
+
+
+def test_ll_filter_order_and_columns(tmp_path):
+    # Not sorted by wavelength, and with extra columns
+    rows = np.array([[6000.1, 26.0, 2.5, -1.0, 0.0, 1.0, 2.0],
+                     [5000.2, 26.1, 3.5, -3.0, 0.0, 3.0, 4.0],
+                     [5500.3, 22.0, 1.5, -1.5, 0.0, 5.0, 6.0],
+                     [4000.4, 22.0, 0.5, -2.5, 0.0, 7.0, 8.0]])
+    fname = str(tmp_path / 'lines.moog')
+    np.savetxt(fname, rows, header='Wavelength', comments='')
+    assert np.array_equal(ll_filter(fname, 3, -2.0, True, 26.1), rows[:3])
+    assert np.array_equal(ll_filter(fname, 6, 5.0, False, False), rows[:2])
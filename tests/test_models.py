@@ -0,0 +1,68 @@
+from __future__ import division
+import os
+import numpy as np
+from astropy.io import fits
+from astro_scripts import models
+from astro_scripts.utils import vac2air, air2vac
+
+
+def _write_model(fname, w0=5900, dw=0.01, n=30000):
+    w = w0 + dw * np.arange(n)
+    flux = 1 - 0.5 * np.exp(-0.5 * ((w - 6000) / 0.2)**2) + 0.01 * np.sin(w)
+    hdr = fits.Header()
+    hdr['CRVAL1'] = w0
+    hdr['CDELT1'] = dw
+    fits.writeto(str(fname), flux.astype(np.float32), hdr)
+    return w, flux.astype(np.float32)
+
+
+def test_read_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'pathcache', str(tmp_path / 'cache'))
+    fname = str(tmp_path / 'model.fits')
+    w, flux = _write_model(fname)
+
+    # Reference: read everything, convert to air, and cut the window
+    w_air = vac2air(w)
+    i = (w_air > 5990) & (w_air < 6010)
+    w_ref, I_ref = models.cut_model(w_air, flux, 5990, 6010)
+    assert len(w_ref) == i.sum()
+
+    w_mod, I_mod = models.read_model(fname, 5990, 6010)
+    assert np.allclose(w_mod, w_ref)
+    assert np.allclose(I_mod, I_ref)
+    assert len(os.listdir(models.pathcache)) == 1
+
+    w_mod, I_mod = models.read_model(fname, 5990, 6010)
+    assert np.allclose(w_mod, w_ref)
+    assert np.allclose(I_mod, I_ref)
+    assert len(os.listdir(models.pathcache)) == 1
+
+    w_mod, I_mod = models.read_model(fname, 5990, 6010, air=False, normalize=False)
+    i = (w > 5990) & (w < 6010)
+    assert np.allclose(w_mod, w[i])
+    assert np.allclose(I_mod, flux[i])
+    assert len(os.listdir(models.pathcache)) == 2
+
+    w_mod, I_mod = models.read_model(fname, 7000, 7010)
+    assert len(w_mod) == len(I_mod) == 0
+
+    models._prune_cache(size=1)
+    assert len(os.listdir(models.pathcache)) == 0
+
+
+def test_air_wavelength(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'pathgrids', str(tmp_path / 'grids'))
+    fname = str(tmp_path / 'WAVE.fits')
+    w = np.linspace(3000, 25000, 100000)
+    fits.writeto(fname, w)
+
+    air = models.air_wavelength(fname)
+    assert isinstance(air, np.memmap)
+    assert np.allclose(air, vac2air(w))
+    assert len(os.listdir(models.pathgrids)) == 2
+    assert np.allclose(models.air_wavelength(fname, density=2), vac2air(w, density=2))
+    assert len(os.listdir(models.pathgrids)) == 3
+
+    wl = np.array([2000, 3500.5, 6562.8, 24000, 30000])
+    assert np.allclose(models.air2vac(wl, fname), air2vac(wl), rtol=1e-10)
+    assert np.allclose(models.air2vac(vac2air(w[10:20]), fname), w[10:20], rtol=1e-12)
@@ -0,0 +1,42 @@
+from __future__ import division
+import numpy as np
+import pytest
+from astro_scripts.normalize import continuum_constant, normalize_constant, normalize
+
+
+def _spectrum(n=10000, continuum=None):
+    w = np.linspace(6000, 6100, n)
+    flux = 1 - 0.5 * np.exp(-0.5 * ((w - 6050) / 0.1)**2)
+    if continuum is not None:
+        flux *= continuum(w)
+    return w, flux
+
+
+def test_continuum_constant():
+    I = np.random.RandomState(1).uniform(0, 1.5, 1000)
+    # Reference: sort all the points below 1.2
+    assert continuum_constant(I) == np.median(np.sort(I[I < 1.2])[-50:])
+    assert continuum_constant(I, npoints=2000) == np.median(I[I < 1.2])
+    assert continuum_constant([2, 3]) == 1
+
+
+def test_normalize_constant():
+    w, flux = _spectrum()
+    I = normalize_constant(3 * flux - 2.5, clip=True)
+    assert round(I.max(), 6) == 1
+    assert I.min() == 0
+    assert np.allclose(normalize_constant(3 * flux), flux)
+    assert np.allclose(normalize(w, 3 * flux), flux)
+
+
+@pytest.mark.parametrize('method', ['percentile', 'spline'])
+def test_normalize_continuum(method, monkeypatch):
+    from astro_scripts import normalize as norm
+    monkeypatch.setattr(norm, '_CHUNK', 1000)  # Several chunks
+    w, flux = _spectrum(continuum=lambda w: 2 + (w - 6000) / 100)
+    I = normalize(w, flux, method=method, percentile=50)
+    continuum = (np.abs(w - 6050) > 3) & (w > 6001) & (w < 6099)
+    assert np.allclose(I[continuum], 1, atol=1e-3)
+    assert abs(I.min() - 0.5) < 0.01
+    with pytest.raises(ValueError):
+        normalize(w, flux, method='polynomial')
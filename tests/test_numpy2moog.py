@@ -0,0 +1,51 @@
+from __future__ import division
+import pytest
+from astro_scripts.numpy2moog import vald2numpy, numpy2moog_synth
+
+VALD = """# Elm Ion       WL_air(A)   Excit(eV) Vmic log gf*
+# Lande factors
+Fe 1,       6000.0000,  3.0000, -1.5, 1.000, 8.000,-6.000,-7.000, 1.000, 0.100, K08 Fe I, other
+Ti 2,        999.1230,  1.2345, -0.25, 1.000, 8.000,-6.000,-7.000, 1.000, 0.100, ref
+'CH 1',     10000.1234,  0.5000, 2.0, 1.000, 8.000,-6.000,-7.000, 1.000, 0.100, ref
+* oscillator strengths were scaled by the solar isotopic ratios.
+ References:
+"""
+
+
+def test_vald2numpy(tmp_path):
+    fname = tmp_path / 'vald.dat'
+    fname.write_text(VALD)
+    output = str(tmp_path / 'vald.moog')
+    vald2numpy(str(fname), output, chunksize=2)
+    with open(output.replace('.moog', '.npy')) as f:
+        lines = f.read().splitlines()
+    assert lines == ['Wavelength\tEle\tExcit\tloggf\t\tD0',
+                     '6000.0000\t26.0\t3.0\t-1.500',
+                     '999.12300\t22.1\t1.2345\t-0.250',
+                     '10000.123\t106.0\t0.5\t2.0000\t3.47']
+
+
+def test_vald2numpy_unknown(tmp_path):
+    fname = tmp_path / 'vald.dat'
+    fname.write_text('Xx 1, 6000.0, 3.0, -1.5, 1.0\n')
+    with pytest.raises(AttributeError):
+        vald2numpy(str(fname), str(tmp_path / 'vald.moog'))
+
+
+def test_numpy2moog_synth(tmp_path):
+    fname = tmp_path / 'lines.dat'
+    fname.write_text('Wavelength Ele excit loggf D0\n'
+                     '4000.123 26.0 2.5 -1.234 3.47\n'
+                     '12345.6789 106.0 0.123 -10.5 nan\n'
+                     '5000 22.1 1 0.5\n')
+    output = str(tmp_path / 'lines.moog')
+    numpy2moog_synth(str(fname), output, chunksize=2)
+    with open(output) as f:
+        assert f.read() == ('Wavelength    Ele    excit         loggf               D0\n'
+                            '  4000.123   26.0     2.50        -1.234             3.47\n'
+                            ' 12345.679  106.0     0.12       -10.500\n'
+                            '  5000.000   22.1     1.00         0.500\n')
+
+    numpy2moog_synth(str(fname), output, header='My header')
+    with open(output) as f:
+        assert f.readline() == 'My header\n'
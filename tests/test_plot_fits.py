@@ -0,0 +1,73 @@
+from __future__ import division
+import gc
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from astro_scripts.plot_fits import DecimatedLine, Cursor
+
+
+def test_decimated_line():
+    n = 1000001
+    w = np.linspace(5000, 6000, n)
+    flux = np.ones(n)
+    flux[123457] = 0.1  # A single deep pixel
+    flux[654321] = 1.9
+    fig, ax = plt.subplots()
+    line = DecimatedLine(ax, w, flux, '-k', npoints=2000, label='Star')
+    fig.canvas.draw()
+
+    x, y = line.line.get_data()
+    assert len(x) < 4 * 2000 + 10
+    assert x[0] == w[0] and x[-1] == w[-1]
+    assert y.min() == 0.1 and y.max() == 1.9
+    assert ax.get_xlim()[0] <= w[0] and ax.get_xlim()[1] >= w[-1]
+
+    # Zoom: the visible part at full resolution
+    ax.set_xlim(5123.0, 5123.5)
+    x, y = line.line.get_data()
+    i = (w >= 5123.0) & (w <= 5123.5)
+    assert len(x) < 1000
+    assert np.all(np.isin(w[i], x))
+    assert y.min() == 0.1
+
+    # Zoom out a bit: decimated, but the extremes are kept
+    ax.set_xlim(5500, 5900)
+    x, y = line.line.get_data()
+    assert len(x) < 4 * 2000 + 10
+    assert x[0] <= 5500 and x[-1] >= 5900
+    assert y.max() == 1.9 and y.min() == 1.0
+    plt.close(fig)
+
+
+def test_decimated_line_without_reference():
+    # As in plot_fits.main, where the DecimatedLine is not kept
+    w = np.linspace(5000, 6000, 1000001)
+    fig, ax = plt.subplots()
+    DecimatedLine(ax, w, np.ones(len(w)), '-k', npoints=2000)
+    gc.collect()
+    ax.set_xlim(5123.0, 5123.5)
+    x, y = ax.lines[0].get_data()
+    assert np.sum((x >= 5123.0) & (x <= 5123.5)) == np.sum((w >= 5123.0) & (w <= 5123.5))
+    plt.close(fig)
+
+
+def test_cursor():
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], [0, 1])
+    cursor = Cursor(ax)
+    fig.canvas.draw()
+    event = matplotlib.backend_bases.MouseEvent('motion_notify_event', fig.canvas,
+                                                *ax.transData.transform((0.3, 0.6)))
+    cursor.mouse_move(event)
+    assert np.allclose(cursor.ly.get_xdata(), 0.3)
+    assert np.allclose(cursor.lx.get_ydata(), 0.6)
+    plt.close(fig)
+
+
+def test_cursor_without_blitting():
+    fig = matplotlib.figure.Figure()
+    matplotlib.backend_bases.FigureCanvasBase(fig)
+    ax = fig.add_subplot(111)
+    cursor = Cursor(ax)
+    assert not cursor.lx.get_animated() and not cursor.ly.get_animated()
@@ -0,0 +1,52 @@
+from __future__ import division
+import numpy as np
+import pytest
+from astro_scripts import resample as rs
+
+
+def test_linear():
+    w = np.sort(np.random.RandomState(2).uniform(5000, 5010, 500))
+    flux = np.sin(w)
+    wnew = np.linspace(4999, 5011, 300)
+    np.testing.assert_allclose(rs.resample(w, flux, wnew), np.interp(wnew, w, flux))
+
+
+def test_cubic():
+    w = np.linspace(0, 10, 101)
+    wnew = np.linspace(0.05, 9.95, 77)
+    # Exact for polynomials up to degree 3
+    poly = lambda x: 1 + 2*x - 0.3*x**2 + 0.05*x**3
+    np.testing.assert_allclose(rs.resample(w, poly(w), wnew, 'cubic'), poly(wnew))
+    assert rs.resample(w, poly(w), [-1, 11], 'cubic') == pytest.approx([poly(0), poly(10)])
+
+
+def test_flux():
+    w = 5000 + 0.01 * np.arange(1000)
+    flux = np.random.RandomState(3).rand(1000)
+    # Bins of 4 pixels: the mean of the pixels
+    wnew = w.reshape(-1, 4).mean(axis=1)
+    np.testing.assert_allclose(rs.resample(w, flux, wnew, 'flux'), flux.reshape(-1, 4).mean(axis=1))
+    # Irregular bins conserve the total flux
+    wnew = np.sort(np.random.RandomState(4).uniform(w[0], w[-1], 137))
+    wnew[0], wnew[-1] = w[0], w[-1]
+    fnew = rs.resample(w, flux, wnew, 'flux')
+    edges = np.clip(rs._edges(wnew), w[0] - 0.005, w[-1] + 0.005)  # Covered by the old pixels
+    assert np.sum(fnew * np.diff(edges)) == pytest.approx(np.sum(flux * 0.01))
+    # Outside: the nearest pixel
+    assert rs.resample(w, flux, [4000, 4000.01], 'flux') == pytest.approx([flux[0], flux[0]])
+    assert rs.resample(w, flux, [6000, 6000.01], 'flux') == pytest.approx([flux[-1], flux[-1]])
+
+
+def test_rebin_matrix_cache():
+    w = np.linspace(0, 1, 100)
+    wnew = np.linspace(0, 1, 33)
+    matrix = rs.rebin_matrix(w, wnew, 'flux')
+    assert rs.rebin_matrix(w.copy(), wnew.copy(), 'flux') is matrix
+    assert rs.rebin_matrix(w, wnew, 'linear') is not matrix
+    # Many spectra on the same grid at once
+    fluxes = np.random.RandomState(5).rand(10, 100)
+    result = rs.resample(w, fluxes, wnew, 'flux')
+    assert result.shape == (10, 33)
+    np.testing.assert_allclose(result[3], rs.resample(w, fluxes[3], wnew, 'flux'))
+    with pytest.raises(ValueError):
+        rs.rebin_matrix(w, wnew, 'nearest')
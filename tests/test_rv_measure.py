@@ -0,0 +1,94 @@
+from __future__ import division
+import numpy as np
+from astropy.io import fits
+from astro_scripts.rv_measure import batch, multi_order, _expand, _combine
+from astro_scripts.utils import _nrefrac
+
+
+def _write_spectrum(fname, w0, dw, n, rv=0):
+    """Write a 1D fits file with a few gaussian absorption lines"""
+    w = w0 + dw * np.arange(n)
+    flux = np.ones(n)
+    for line in np.linspace(w[0] + 10, w[-1] - 10, 15):
+        line *= 1.0 + rv / 299792.458
+        flux -= 0.5 * np.exp(-0.5 * ((w - line) / 0.1)**2)
+    hdr = fits.Header()
+    hdr['CRVAL1'] = w0
+    hdr['CDELT1'] = dw
+    fits.writeto(str(fname), flux, hdr)
+
+
+def test_batch(tmp_path):
+    model = tmp_path / 'model.fits'
+    _write_spectrum(model, 5900, 0.02, 15000)
+    for i in range(3):
+        _write_spectrum(tmp_path / 'star{}.fits'.format(i), 6000, 0.02, 5000, rv=10*i)
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text(u'# spectra\n{}\n'.format(tmp_path / 'star*.fits'))
+    fnames = _expand([str(tmp_path / 'missing.fits')], str(manifest))
+    assert len(fnames) == 4
+
+    output = tmp_path / 'rv.csv'
+    df = batch(fnames, str(model), method='fft', workers=2, output=str(output))
+    assert output.exists()
+    assert list(df.columns) == ['fname', 'rv', 'rverr', 'width', 'time', 'error']
+    assert len(df) == 4
+    assert df['error'].iloc[0].startswith('FileNotFoundError')
+    assert np.isnan(df['rv'].iloc[0])
+    rv = df['rv'].values[1:]
+    assert np.allclose(np.diff(rv), 10, atol=0.5)
+    assert (df['rverr'].values[1:] > 0).all()
+
+
+def test_multi_order(tmp_path, monkeypatch):
+    from astro_scripts import models
+    monkeypatch.setattr(models, 'pathcache', str(tmp_path / 'cache'))
+    lines = np.random.RandomState(3).uniform(5950, 6300, 150)
+
+    def absorption(w, rv=0):
+        flux = np.ones(len(w))
+        for line in lines * (1.0 + rv / 299792.458):
+            flux -= 0.5 * np.exp(-0.5 * ((w - line) / 0.1)**2)
+        return flux
+
+    w = 5900 + 0.02 * np.arange(25000)
+    hdr = fits.Header()
+    hdr['CRVAL1'] = w[0]
+    hdr['CDELT1'] = 0.02
+    model = str(tmp_path / 'model.fits')
+    fits.writeto(model, absorption(w), hdr)
+
+    hdus = [fits.PrimaryHDU()]
+    for ext in range(4):
+        w = 6000 + 60*ext + 0.02 * np.arange(2500)
+        cols = [fits.Column(name='Wavelength', format='D', array=w/10),
+                fits.Column(name='Extracted_OPT', format='D', array=absorption(w, rv=12))]
+        hdus.append(fits.BinTableHDU.from_columns(cols))
+    fname = str(tmp_path / 'crires.fits')
+    fits.HDUList(hdus).writeto(fname)
+
+    rv, rverr, scatter, df = multi_order(fname, model, 'CRIRES', method='fft', workers=2)
+    assert list(df['order']) == [1, 2, 3, 4]
+    # The model is converted to air, which shifts it by (n-1)*c (about 83 km/s)
+    wc = 6025 + 60 * np.arange(4)
+    expected = 299792.458 * (_nrefrac(wc) * (1 + 12 / 299792.458) - 1)
+    np.testing.assert_allclose(df['rv'], expected, atol=0.5)
+    assert abs(rv - np.mean(expected)) < 0.3
+    assert np.isclose(scatter, np.std(df['rv']))
+    # The uncertainty reflects the scatter of the orders
+    assert np.isclose(rverr, np.std(df['rv'], ddof=1) / 2)
+
+    rv, rverr, scatter, df = multi_order(fname, model, 'CRIRES', orders=[2, 3], workers=1)
+    assert list(df['order']) == [2, 3]
+
+
+def test_combine():
+    rv, rverr, scatter = _combine([1, 2, np.nan], [1, 1, 1])
+    assert (rv, scatter) == (1.5, 0.5)
+    assert round(rverr, 6) == round(1 / np.sqrt(2), 6)
+    assert _combine([1, 3], [1, np.inf])[0] == 1
+    # Small uncertainties, but the RVs scatter: the standard error is used
+    rv, rverr, scatter = _combine([0, 1], [0.01, 0.01])
+    assert (rv, scatter) == (0.5, 0.5)
+    assert np.isclose(rverr, np.std([0, 1], ddof=1) / np.sqrt(2))
+    assert np.isnan(_combine([1], [np.nan])[0])
@@ -0,0 +1,57 @@
+from __future__ import division
+import sys
+import json
+import importlib
+import subprocess
+import pytest
+
+# Heavy dependencies which should only be imported when they are used
+HEAVY = ['matplotlib', 'pandas', 'scipy', 'PyAstronomy', 'astroquery', 'requests',
+         'lineid_plot', 'astropy.io.fits', 'astropy.modeling', 'isochrones']
+
+# Console script: (seconds to resolve the entry point, dependencies it may import)
+BUDGETS = {
+    'plot_fits': (3.0, ['matplotlib', 'astropy.io.fits']),
+    'numpy2moog': (1.0, []),
+    'fitsheader': (2.0, ['astropy.io.fits']),
+    'ascii2fits': (2.0, ['astropy.io.fits']),
+    'CRIRES2ARES': (2.0, ['astropy.io.fits']),
+    'linelist_filter': (1.0, []),
+    'linelist_convert': (1.0, []),
+    'rv_measure': (2.0, ['astropy.io.fits']),
+    'rv_measure_batch': (2.0, ['astropy.io.fits']),
+    'VALDextraction': (1.0, []),
+    'VALDprepare': (1.0, []),
+    'vizier_query': (1.0, []),
+    'SWEETCat': (3.0, ['matplotlib', 'pandas']),
+    'fits_archive': (1.0, []),
+}
+
+# As the console scripts (setup.py): import the module and get the function
+_code = '''
+import sys, json, time, importlib
+t = time.perf_counter()
+import astro_scripts
+module, function = astro_scripts._entry_points[{name!r}]
+function = getattr(importlib.import_module('astro_scripts.' + module), function)
+t = time.perf_counter() - t
+print(json.dumps([t, callable(function), [m for m in {heavy!r} if m in sys.modules]]))
+'''
+
+
+@pytest.mark.parametrize('name', sorted(BUDGETS))
+def test_startup(name):
+    budget, allowed = BUDGETS[name]
+    out = subprocess.check_output([sys.executable, '-c', _code.format(name=name, heavy=HEAVY)])
+    seconds, is_callable, imported = json.loads(out.decode().splitlines()[-1])
+    assert is_callable
+    assert set(imported) <= set(allowed)
+    assert seconds < budget
+
+
+
+def test_entry_point_wrapper():
+    import astro_scripts
+    numpy2moog = importlib.import_module('astro_scripts.numpy2moog')
+    assert astro_scripts.numpy2moog is numpy2moog
+    assert astro_scripts.linelist_convert.__name__ == 'linelist_convert'
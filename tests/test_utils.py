@@ -1,7 +1,17 @@
 from __future__ import division
 import pytest
 import numpy as np
-from astro_scripts.utils import _nrefrac, vac2air, dopplerShift
+from astro_scripts.utils import _nrefrac, vac2air, dopplerShift, ccf_astro
+from astro_scripts.utils import fit_ccf, _gaussian, air2vac
+
+
+def _synthetic_spectrum(wl, rv=0):
+    """Absorption spectrum with a few gaussian lines, shifted by rv"""
+    flux = np.ones_like(wl)
+    for line in np.linspace(6005, 6095, 15):
+        line *= 1.0 + rv / 299792.458
+        flux -= 0.5 * np.exp(-0.5 * ((wl - line) / 0.1)**2)
+    return flux
 
 def test_nrefrac():
     wl, density = 10, 1.0
@@ -28,6 +38,15 @@ def test_vac2air():
         vac2air(0, density=density)
 
 
+def test_air2vac():
+    wl = np.linspace(3000, 25000, 100)
+    assert np.allclose(air2vac(vac2air(wl)), wl, rtol=1e-12)
+    assert np.allclose(air2vac(vac2air(wl, density=2), density=2), wl, rtol=1e-12)
+    assert (air2vac(wl) > wl).all()
+    with pytest.raises(ValueError):
+        air2vac(wl, density=0)
+
+
 def test_dopplerShift():
     wl = np.array([1, 2, 3])
     fl = np.array([1, 0.8, 1])
@@ -37,3 +56,47 @@ def test_dopplerShift():
     assert (dopplerShift(wl, fl, v)[0] == fl).all()
     assert (dopplerShift(wl, fl, v)[1]  > wl).all()
     assert (dopplerShift(wl, fl, -v)[1] < wl).all()
+
+
+def test_ccf_astro():
+    w = np.linspace(6000, 6100, 5000)
+    tw = np.linspace(5990, 6110, 6000)
+    f, tf = _synthetic_spectrum(w, rv=23.4), _synthetic_spectrum(tw)
+    rv, drvs, cc, x, y = ccf_astro((w, -f + 1), (tw, -tf + 1), rvmin=0, rvmax=50, drv=0.5)
+    assert abs(rv - 23.4) < 0.5
+    assert len(drvs) == len(cc) == len(y) == 100
+    assert cc.max() == 1
+    assert ccf_astro(([], []), (tw, tf)) == (0, 0, 0, 0, 0)
+
+
+def test_ccf_astro_fft():
+    w = np.linspace(6000, 6100, 5000)
+    tw = np.linspace(5990, 6110, 6000)
+    f, tf = _synthetic_spectrum(w, rv=23.4), _synthetic_spectrum(tw)
+    direct = ccf_astro((w, -f + 1), (tw, -tf + 1), rvmin=0, rvmax=50, drv=0.5)
+    fft = ccf_astro((w, -f + 1), (tw, -tf + 1), rvmin=0, rvmax=50, drv=0.5, method='fft')
+    assert abs(fft[0] - 23.4) < 0.5
+    assert abs(fft[0] - direct[0]) < 0.1
+    assert (fft[1] == direct[1]).all()
+    assert np.allclose(fft[2], direct[2], atol=0.05)
+    with pytest.raises(ValueError):
+        ccf_astro((w, f), (tw, tf), method='slow')
+
+
+def test_fit_ccf():
+    rv = np.arange(0, 150, 0.5)
+    ccf = _gaussian(rv, amplitude=1, mean=42.3, stddev=4.1)
+    for method in ('parabola', 'gauss', 'astropy'):
+        mean, stddev, error, g = fit_ccf(rv, ccf, method=method)
+        assert round(mean, 3) == 42.3
+        assert round(stddev, 3) == 4.1
+        assert np.allclose(g(rv), ccf, atol=1e-4)
+
+    noise = np.random.RandomState(42).normal(0, 0.01, len(rv))
+    gauss = fit_ccf(rv, ccf + noise, method='gauss')
+    astropy = fit_ccf(rv, ccf + noise, method='astropy')
+    assert abs(gauss[0] - astropy[0]) < 1e-5
+    assert abs(gauss[2] - astropy[2]) < 1e-5
+    assert 0 < gauss[2] < 0.1
+    with pytest.raises(ValueError):
+        fit_ccf(rv, ccf, method='spline')
@@ -0,0 +1,65 @@
+from __future__ import division
+import importlib
+import threading
+import numpy as np
+import pytest
+
+# The package attribute vizier_query is the console script function
+vq = importlib.import_module('astro_scripts.vizier_query')
+
+
+class Backend(object):
+    """A local stand-in for VizieR"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, obj, catalogs=None):
+        with self._lock:
+            self.calls.append((obj, catalogs))
+        if obj == 'unknown':
+            raise ValueError('Not found')
+        teff = {'HD1': [5700.0, 5800.0], 'HD2': [4500.0, np.nan]}.get(obj, [6000.0])
+        return [{'RAJ2000': np.array(['01 02 03']), 'DEJ2000': np.array(['+04 05 06']),
+                 'Teff': np.array(teff)},
+                {'Teff': np.ma.masked_array([1.0, 6100.0], mask=[True, False]),
+                 'logg': np.array([4.4])}]
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(vq, 'path', str(tmp_path / 'cache'))
+    return Backend()
+
+
+def test_query_cache(backend):
+    cat = vq.query('HD1', backend=backend)
+    np.testing.assert_array_equal(vq._values(cat, 'Teff'), [5700.0, 5800.0, np.nan, 6100.0])
+    assert vq.query('HD1', backend=backend)[0]['Teff'].tolist() == [5700.0, 5800.0]
+    assert len(backend.calls) == 1
+    # Another set of catalogs is another query
+    vq.query('HD1', catalogs=['II/246'], backend=backend)
+    assert len(backend.calls) == 2
+    # Expired
+    vq.query('HD1', ttl=0, backend=backend)
+    assert len(backend.calls) == 3
+    # Offline mode only uses the cache
+    vq.query('HD1', ttl=0, offline=True, backend=backend)
+    assert len(backend.calls) == 3
+    with pytest.raises(IOError):
+        vq.query('HD2', offline=True, backend=backend)
+
+
+def test_parameter_table(backend):
+    objects = ['HD1', 'HD2', 'unknown', 'HD3']
+    table = vq.parameter_table(objects, workers=4, backend=backend)
+    assert list(table['object']) == objects
+    assert sorted(call[0] for call in backend.calls) == sorted(objects)
+    assert table['Teff_mean'][0] == round(np.mean([5700, 5800, 6100]), 2)
+    assert table['Teff_median'][1] == 5300.0
+    assert table['Teff_n'][1] == 2
+    assert np.isnan(table['Teff_mean'][2])
+    assert table['logg_mean'][3] == 4.4
+    assert table['[Fe/H]_n'][3] == 0
+    assert table['RA'][0] == '01 02 03'